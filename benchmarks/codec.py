@@ -0,0 +1,292 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import protocol  # noqa: E402
+from protocol import DEFAULT_SCHEMA, ChannelSchema, Codec  # noqa: E402
+
+MESSAGE_TYPES = (
+    protocol.PidStatus,
+    protocol.TuneStatus,
+    protocol.ProfileAck,
+    protocol.ProfileStatus,
+    protocol.SchemaAnnounce,
+    protocol.BadSchema,
+    protocol.Batch,
+    protocol.BadBatch,
+    protocol.Sample,
+    protocol.DeviceError,
+    protocol.Text,
+)
+
+
+class LegacyChain:
+    # The startswith/split chain the GUI used before the codec, minus its side effects:
+    # every parser is tried in turn until one claims the line.
+
+    def __init__(self, schema: ChannelSchema = DEFAULT_SCHEMA) -> None:
+        self.schema = schema
+
+    def decode(self, line: str):
+        if line.startswith("!ERR:"):
+            return line
+        if line.startswith("PACK="):
+            return self._parse_profile_status(line)
+        for parse in (
+            self._parse_pid_status,
+            self._parse_tune_status,
+            self._parse_profile_status,
+            self._parse_schema,
+            self._parse_batch,
+        ):
+            result = parse(line)
+            if result is not None:
+                return result
+        return self._parse_target_actual(line)
+
+    def _parse_pid_status(self, line: str):
+        if not line.startswith("PID="):
+            return None
+        p_val = i_val = d_val = None
+        try:
+            for part in line[4:].split(","):
+                if part.startswith("P="):
+                    p_val = float(part[2:].strip())
+                elif part.startswith("I="):
+                    i_val = float(part[2:].strip())
+                elif part.startswith("D="):
+                    d_val = float(part[2:].strip())
+        except ValueError:
+            return None
+        if p_val is None or i_val is None or d_val is None:
+            return None
+        return p_val, i_val, d_val
+
+    def _parse_tune_status(self, line: str):
+        if not line.startswith("TUNE="):
+            return None
+        payload = line[5:]
+        if payload.startswith("OK"):
+            vals = {}
+            for part in payload.split(",")[1:]:
+                if "=" in part:
+                    k, v = part.split("=", 1)
+                    vals[k.strip()] = v.strip()
+            return vals
+        if payload.startswith("ERR") or payload.startswith("START"):
+            return payload
+        return None
+
+    def _parse_profile_status(self, line: str):
+        if line.startswith("PACK="):
+            parts = line[5:].split(",")
+            try:
+                block_seq = int(parts[0])
+                free = None
+                for part in parts[1:]:
+                    if part.startswith("FREE="):
+                        free = int(part[5:])
+            except ValueError:
+                return False
+            return block_seq, free
+        if not line.startswith("PROFILE="):
+            return None
+        return line[8:]
+
+    def _parse_schema(self, line: str):
+        if not line.startswith("SCHEMA="):
+            return None
+        try:
+            return ChannelSchema.parse(line[7:])
+        except ValueError:
+            return False
+
+    def _parse_batch(self, line: str):
+        if not line.startswith("B,"):
+            return None
+        parts = line.split(",")
+        if len(parts) < 5:
+            return False
+        try:
+            t0_ms = float(parts[1])
+            dt_ms = float(parts[2])
+            count = int(parts[3])
+        except ValueError:
+            return False
+        schema = self.schema
+        expected = 4 + (count * schema.width)
+        if count <= 0 or len(parts) < expected:
+            return False
+        try:
+            return t0_ms, dt_ms, schema.decode(parts[4:expected], count)
+        except ValueError:
+            return False
+
+    def _parse_target_actual(self, line: str):
+        if "," not in line:
+            return None
+        schema = self.schema
+        fields = line.split(",")
+        if len(fields) != schema.width:
+            schema = DEFAULT_SCHEMA
+            fields = line.split(",", 1)
+        try:
+            return schema.decode(fields, 1)[0]
+        except ValueError:
+            return None
+
+
+def sample_traffic(n: int, batch: int, rng: random.Random) -> list[str]:
+    # Mostly samples, with the status chatter a tuning session produces.
+    lines = []
+    t_ms = 0
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.45:
+            lines.append(f"{rng.uniform(-5, 5):.4f},{rng.uniform(-5, 5):.4f}")
+        elif roll < 0.75:
+            values = ",".join(f"{rng.uniform(-5, 5):.4f}" for _ in range(2 * batch))
+            lines.append(f"B,{t_ms},2,{batch},{values}")
+            t_ms += 2 * batch
+        elif roll < 0.85:
+            lines.append(f"PACK={rng.randint(1, 999)},FREE={rng.randint(0, 512)}")
+        elif roll < 0.92:
+            lines.append(f"PID=P={rng.uniform(0, 5):.3f},I={rng.uniform(0, 1):.3f},D={rng.uniform(0, 0.1):.3f}")
+        elif roll < 0.96:
+            lines.append("TUNE=OK,Ku=2.1,Pu=0.8,Kp=1.26,Ki=3.15,Kd=0.126")
+        else:
+            lines.append(f"ACK={rng.randint(1, 999)}")
+    return lines
+
+
+def time_per_line(decode, lines: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            decode(line)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e9 / len(lines)
+
+
+def random_message(rng: random.Random, schema: ChannelSchema):
+    roll = rng.randrange(7)
+    if roll == 0:
+        return protocol.PidStatus(rng.uniform(-10, 10), rng.uniform(-10, 10), rng.uniform(-10, 10))
+    if roll == 1:
+        return protocol.ProfileAck(rng.randint(0, 10**6), rng.randint(0, 10**6))
+    if roll == 2:
+        return protocol.ProfileStatus("READY", rng.randint(1, 10**6))
+    if roll == 3:
+        return protocol.TuneStatus("OK", {"Kp": f"{rng.uniform(0, 9):.4g}", "Ki": "0.5"})
+    if roll == 4:
+        count = rng.randint(1, 20)
+        block = np.array([[rng.uniform(-1e3, 1e3) for _ in range(schema.width)] for _ in range(count)])
+        return protocol.Batch(
+            float(rng.randint(0, 2**32)), 2.0, count, schema.coerce(block) * schema.scales
+        )
+    if roll == 5:
+        row = np.array([rng.uniform(-1e3, 1e3) for _ in range(schema.width)])
+        return protocol.Sample(schema.coerce(row) * schema.scales, schema)
+    return protocol.DeviceError(f" code {rng.randint(0, 99)}")
+
+
+def same(a, b) -> bool:
+    if type(a) is not type(b):
+        return False
+    for x, y in zip(a, b):
+        if isinstance(x, np.ndarray):
+            if not np.allclose(x, y, rtol=1e-8):
+                return False
+        elif isinstance(x, ChannelSchema):
+            if x.describe() != y.describe():
+                return False
+        elif isinstance(x, float):
+            if not np.isclose(x, y, rtol=1e-12):
+                return False
+        elif x != y:
+            return False
+    return True
+
+
+def mutate(line: str, rng: random.Random) -> str:
+    alphabet = ",=-+.0123456789eEBPIDnaNinf!: \x00\xff"
+    chars = list(line)
+    for _ in range(rng.randint(1, 4)):
+        op = rng.randrange(4)
+        pos = rng.randrange(len(chars) + 1)
+        if op == 0 and chars:
+            del chars[min(pos, len(chars) - 1)]
+        elif op == 1:
+            chars.insert(pos, rng.choice(alphabet))
+        elif op == 2 and chars:
+            chars[min(pos, len(chars) - 1)] = rng.choice(alphabet)
+        else:
+            chars = chars[:pos]
+    return "".join(chars) or ","
+
+
+def fuzz(iterations: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    schemas = [DEFAULT_SCHEMA, ChannelSchema(["target", "actual", "u"], ["f32", "f32", "i16"], [1.0, 1.0, 0.001])]
+    for i in range(iterations):
+        schema = schemas[i % len(schemas)]
+        codec = Codec(schema)
+        message = random_message(rng, schema)
+        line = message.encode(schema) if type(message) is protocol.Batch else message.encode()
+        decoded = codec.decode(line)
+        if not same(message, decoded):
+            failures += 1
+            print(f"round trip mismatch: {line!r} -> {decoded!r}")
+        bad = mutate(line, rng)
+        try:
+            decoded = codec.decode(bad)
+        except Exception as exc:
+            failures += 1
+            print(f"decode raised on {bad!r}: {exc!r}")
+            continue
+        if type(decoded) not in MESSAGE_TYPES:
+            failures += 1
+            print(f"unexpected message type for {bad!r}: {decoded!r}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the protocol codec with the legacy parser chain.")
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fuzz", type=int, default=20000, help="fuzz iterations, 0 to skip")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lines = sample_traffic(args.lines, args.batch, rng)
+    codec = Codec()
+    legacy = LegacyChain()
+    legacy_ns = time_per_line(legacy.decode, lines, args.repeat)
+    codec_ns = time_per_line(codec.decode, lines, args.repeat)
+    print(f"legacy chain {legacy_ns:8.0f} ns/line")
+    print(f"codec        {codec_ns:8.0f} ns/line  ({legacy_ns / codec_ns:.2f}x)")
+    for label, keep in (("samples", lambda l: l[0].isdigit() or l[0] == "-"), ("status", lambda l: l[0].isalpha() and l[1] != ",")):
+        subset = [line for line in lines if keep(line)]
+        legacy_ns = time_per_line(legacy.decode, subset, args.repeat)
+        codec_ns = time_per_line(codec.decode, subset, args.repeat)
+        print(f"  {label:8s} legacy {legacy_ns:7.0f} ns  codec {codec_ns:7.0f} ns  ({legacy_ns / codec_ns:.2f}x)")
+
+    if args.fuzz:
+        failures = fuzz(args.fuzz, args.seed)
+        print(f"fuzz: {args.fuzz} iterations, {failures} failures")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
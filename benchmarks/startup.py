@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_PROBE = (
+    "import time; start = time.perf_counter(); import main; "
+    "print((time.perf_counter() - start) * 1000.0)"
+)
+
+
+def measure_import() -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_startup(timeout_s: float) -> dict:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "main.py", "--startup-benchmark"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=timeout_s,
+        check=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000.0
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = wall_ms
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure cold-start import and first-paint time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    rows = []
+    for _ in range(args.runs):
+        timings = measure_startup(args.timeout)
+        timings["import_ms"] = measure_import()
+        rows.append(timings)
+        print(
+            f"import {timings['import_ms']:7.1f} ms  first paint {timings['first_paint_ms']:7.1f} ms  "
+            f"plot ready {timings['ready_ms']:7.1f} ms  process {timings['process_ms']:7.1f} ms"
+        )
+    print("median:")
+    for key in ("import_ms", "first_paint_ms", "ready_ms", "process_ms"):
+        print(f"  {key:15s} {statistics.median(row[key] for row in rows):7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,798 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+import serial
+
+from protocol import (
+    Batch,
+    Codec,
+    GetSchema,
+    Response,
+    Sample,
+    SchemaAnnounce,
+    SetGains,
+    SetSampleTime,
+    frame,
+)
+
+# Plan step type -> (device command, value parameters in command order, defaults).
+RESPONSE_TYPES = {
+    "setpoint": ("SETPOINT", ("value",), {}),
+    "step": ("STEP", ("amplitude",), {}),
+    "ramp": ("RAMP", ("slope",), {}),
+    "accel": ("ACCEL", ("accel",), {}),
+    "sine": ("SINE", ("amplitude", "frequency", "offset"), {"offset": 0.0}),
+}
+METRICS = ("settling_time", "rise_time", "overshoot_pct", "peak", "sse", "iae")
+# Reported from the averaged response rather than as a mean over runs.
+MEAN_METRICS = ("settling_time", "overshoot_pct", "peak")
+MIN_DURATION_S = 2.0
+MAX_SINE_HZ = 100.0
+
+
+class Step(NamedTuple):
+    index: int
+    gains_name: str | None
+    gains: tuple | None
+    kind: str
+    values: tuple
+    duration: float | None
+    # How long to capture: the response duration, or hold_s for an open-ended setpoint.
+    capture_s: float
+    settle_s: float
+    # Repetition of this step within its group; ensemble groups are averaged at the last one.
+    repeat_index: int = 0
+    repeats: int = 1
+    ensemble: bool = False
+
+    def describe(self) -> str:
+        params = ",".join(f"{v:g}" for v in self.values)
+        gains = f" [{self.gains_name}]" if self.gains_name else ""
+        return f"{self.kind} {params}{gains}"
+
+
+class Plan(NamedTuple):
+    name: str
+    path: str
+    text: str
+    sample_time_ms: float | None
+    metrics: tuple
+    output: str
+    steps: list
+
+
+def _read_plan_file(path: str) -> tuple[str, dict]:
+    with open(path, "rb") as handle:
+        raw = handle.read()
+    text = raw.decode("utf-8")
+    if path.lower().endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError as exc:
+            raise ValueError("YAML plans need PyYAML (pip install pyyaml)") from exc
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as exc:
+            raise ValueError(f"bad YAML: {exc}") from exc
+    else:
+        try:
+            import tomllib
+        except ImportError as exc:
+            raise ValueError("TOML plans need Python 3.11 or newer") from exc
+        try:
+            data = tomllib.loads(text)
+        except tomllib.TOMLDecodeError as exc:
+            raise ValueError(f"bad TOML: {exc}") from exc
+    if not isinstance(data, dict):
+        raise ValueError("plan must be a table/mapping at the top level")
+    return text, data
+
+
+def _number(entry: dict, key: str, where: str, default=None) -> float | None:
+    value = entry.get(key, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{where}: {key} must be a number")
+    return float(value)
+
+
+def load_plan(path: str) -> Plan:
+    # Example (TOML; YAML with the same keys also works):
+    #
+    #   name = "qualification"
+    #   sample_time_ms = 2
+    #   settle_s = 1.0
+    #   metrics = ["settling_time", "overshoot_pct"]
+    #   [[gains]]
+    #   name = "baseline"
+    #   p = 1.2
+    #   i = 0.5
+    #   d = 0.01
+    #   [[steps]]
+    #   type = "step"
+    #   amplitude = [0.5, 1.0, 2.0]
+    #   duration = 3
+    #   repeat = 20
+    #   ensemble = true
+    #
+    # Any step parameter given as a list expands into one step per value (all combinations);
+    # steps without a "gains" key run once under every gain set. With ensemble = true the
+    # repeats of each expanded step are aligned and averaged (see ensemble()). Plan-level
+    # settle_s and hold_s are defaults that a step can override.
+    text, data = _read_plan_file(path)
+    gain_sets = []
+    for n, entry in enumerate(data.get("gains", []), start=1):
+        where = f"gains {n}"
+        if not isinstance(entry, dict):
+            raise ValueError(f"{where}: must be a table")
+        gain_sets.append(
+            (
+                str(entry.get("name", f"set{n}")),
+                tuple(_number(entry, key, where) for key in ("p", "i", "d")),
+            )
+        )
+        if None in gain_sets[-1][1]:
+            raise ValueError(f"{where}: p, i and d are all required")
+    named_gains = dict(gain_sets)
+
+    metrics = tuple(data.get("metrics", METRICS))
+    for name in metrics:
+        if name not in METRICS:
+            raise ValueError(f"unknown metric {name}; choose from {', '.join(METRICS)}")
+    default_settle = _number(data, "settle_s", "plan", 1.0)
+    default_hold = _number(data, "hold_s", "plan", 2.0)
+
+    steps = []
+    for n, entry in enumerate(data.get("steps", []), start=1):
+        where = f"step {n}"
+        if not isinstance(entry, dict):
+            raise ValueError(f"{where}: must be a table")
+        kind = str(entry.get("type", "")).lower()
+        if kind not in RESPONSE_TYPES:
+            raise ValueError(f"{where}: unknown type {kind!r}; use {', '.join(RESPONSE_TYPES)}")
+        command, names, defaults = RESPONSE_TYPES[kind]
+        if "gains" in entry:
+            if entry["gains"] not in named_gains:
+                raise ValueError(f"{where}: unknown gain set {entry['gains']!r}")
+            gain_choices = [(entry["gains"], named_gains[entry["gains"]])]
+        else:
+            gain_choices = gain_sets or [(None, None)]
+        axes = []
+        for key in names + ("duration",):
+            value = entry.get(key, defaults.get(key))
+            values = value if isinstance(value, list) else [value]
+            if value is None and key != "duration":
+                raise ValueError(f"{where}: {key} is required for {kind}")
+            axes.append([_number({key: v}, key, where) for v in values])
+        settle_s = _number(entry, "settle_s", where, default_settle)
+        hold_s = _number(entry, "hold_s", where, default_hold)
+        repeat = int(entry.get("repeat", 1))
+        averaged = bool(entry.get("ensemble", False))
+        if repeat < 1 or (averaged and repeat < 2):
+            raise ValueError(f"{where}: repeat must be >= 1 (>= 2 for ensemble)")
+        for gains_name, gains in gain_choices:
+            for *values, duration in itertools.product(*axes):
+                if duration is None and kind != "setpoint":
+                    raise ValueError(f"{where}: duration is required for {kind}")
+                if duration is not None and duration < MIN_DURATION_S:
+                    raise ValueError(f"{where}: duration must be >= {MIN_DURATION_S:g} s")
+                if kind == "sine" and not 0 <= values[1] <= MAX_SINE_HZ:
+                    raise ValueError(f"{where}: sine frequency must be 0-{MAX_SINE_HZ:g} Hz")
+                capture_s = duration if duration is not None else hold_s
+                for repeat_index in range(repeat):
+                    steps.append(
+                        Step(
+                            len(steps), gains_name, gains, command, tuple(values),
+                            duration, capture_s, settle_s, repeat_index, repeat, averaged,
+                        )
+                    )
+    if not steps:
+        raise ValueError("plan has no steps")
+
+    output = str(data.get("output", os.path.splitext(os.path.basename(path))[0] + "_results"))
+    output = os.path.join(os.path.dirname(os.path.abspath(path)), output)
+    return Plan(
+        str(data.get("name", os.path.basename(path))),
+        os.path.abspath(path),
+        text,
+        _number(data, "sample_time_ms", "plan"),
+        metrics,
+        output,
+        steps,
+    )
+
+
+def repeat_plan(kind: str, values: tuple, duration: float, repeats: int, output: str) -> Plan:
+    # One response fired repeats times and averaged. The settle wait matches the response so
+    # the plant is back at its baseline before the next edge.
+    steps = [
+        Step(n, None, None, kind, tuple(values), duration, duration, duration, n, repeats, True)
+        for n in range(repeats)
+    ]
+    return Plan(f"{kind.lower()} x{repeats}", "", "", None, METRICS, output, steps)
+
+
+def _target_edge(targets: np.ndarray, start: int) -> int:
+    # First sample at or after start whose target differs from the one before the command.
+    if start:
+        moved = np.flatnonzero(targets[start:] != targets[start - 1])
+        if moved.size:
+            return start + int(moved[0])
+    return start
+
+
+def step_metrics(
+    t: np.ndarray, targets: np.ndarray, actuals: np.ndarray, prev_targets, noise=None
+) -> dict:
+    # targets/actuals are (runs, samples) on the shared time axis t, which starts at the
+    # target edge; prev_targets is the level each run stepped from and noise, if given, the
+    # pre-edge std of each run. Returns one array per metric with a value (or NaN) per run.
+    runs, count = actuals.shape
+    target = np.median(targets, axis=1)[:, None]
+    prev_target = np.asarray(prev_targets, dtype=np.float64).reshape(runs, 1)
+    error = targets - actuals
+    nan = np.full(runs, np.nan)
+    result = {}
+
+    result["peak"] = actuals.max(axis=1)
+    abs_error = np.abs(error)
+    result["iae"] = np.sum(0.5 * (abs_error[:, 1:] + abs_error[:, :-1]) * np.diff(t), axis=1)
+    tail = max(t[-1] * 0.2, 0.1)
+    result["sse"] = error[:, t >= t[-1] - tail].mean(axis=1)
+
+    band = np.maximum(np.abs(target) * 0.02, 0.01)
+    if noise is not None:
+        # A band inside the noise floor never settles; keep it clear of 5 sigma.
+        band = np.maximum(band, 5.0 * np.asarray(noise, dtype=np.float64).reshape(runs, 1))
+    outside = np.abs(actuals - target) > band
+    last_out = count - 1 - np.argmax(outside[:, ::-1], axis=1)
+    settled = last_out < count - 1
+    result["settling_time"] = np.where(
+        ~outside.any(axis=1), 0.0, np.where(settled, t[np.minimum(last_out + 1, count - 1)], nan)
+    )
+
+    step_size = target - prev_target
+    moved = step_size[:, 0] != 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        direction = np.sign(step_size)
+        overshoot = np.maximum((direction * (actuals - target)).max(axis=1), 0.0)
+        result["overshoot_pct"] = np.where(moved, overshoot / np.abs(step_size[:, 0]) * 100.0, nan)
+        progress = (actuals - prev_target) / step_size
+    lo_hit = progress >= 0.1
+    hi_hit = progress >= 0.9
+    lo = np.argmax(lo_hit, axis=1)
+    hi = np.argmax(hi_hit, axis=1)
+    rose = moved & lo_hit.any(axis=1) & hi_hit.any(axis=1) & (hi >= lo)
+    result["rise_time"] = np.where(rose, t[hi] - t[lo], nan)
+    return {name: result[name] for name in METRICS}
+
+
+def response_metrics(
+    times, targets, actuals, start: int | None, end_s: float | None = None
+) -> dict:
+    # Samples before start are the baseline. The response is measured from the first target
+    # change at or after start (the command's transport delay) for end_s seconds.
+    result = dict.fromkeys(METRICS, float("nan"))
+    if start is None or len(times) - start < 2:
+        return result
+    times = np.asarray(times, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    actuals = np.asarray(actuals, dtype=np.float64)
+    start = _target_edge(targets, start)
+    stop = len(times)
+    if end_s is not None:
+        stop = start + int(np.searchsorted(times[start:] - times[start], end_s))
+    if stop - start < 2:
+        return result
+    prev_target = np.median(targets[max(start - 50, 0) : start]) if start else targets[start]
+    metrics = step_metrics(
+        times[start:stop] - times[start],
+        targets[None, start:stop],
+        actuals[None, start:stop],
+        [prev_target],
+    )
+    return {name: float(values[0]) for name, values in metrics.items()}
+
+
+def window_metrics(times, targets, actuals, t_start: float, t_end: float) -> dict:
+    # Cursor-window form used by the response window: the baseline is the 0.2 s before
+    # t_start and the response runs from t_start to t_end. NaN (gap) samples are skipped.
+    result = dict.fromkeys(METRICS, float("nan"))
+    times = np.asarray(times, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    actuals = np.asarray(actuals, dtype=np.float64)
+    valid = np.isfinite(times) & np.isfinite(targets) & np.isfinite(actuals)
+    times, targets, actuals = times[valid], targets[valid], actuals[valid]
+    inside = (times >= t_start) & (times <= t_end)
+    if np.count_nonzero(inside) < 2:
+        return result
+    before = targets[(times >= t_start - 0.2) & (times < t_start)]
+    prev_target = np.median(before) if before.size else np.median(targets[inside])
+    metrics = step_metrics(
+        times[inside] - t_start, targets[None, inside], actuals[None, inside], [prev_target]
+    )
+    return {name: float(values[0]) for name, values in metrics.items()}
+
+
+# Two-sided 95% Student t quantiles for 1..30 degrees of freedom.
+T95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)
+
+
+def _t95(dof: int) -> float:
+    if dof < 1:
+        return float("nan")
+    if dof <= len(T95):
+        return T95[dof - 1]
+    # Cornish-Fisher expansion around z = 1.96; within 1e-3 of the exact value past 30.
+    z = 1.959964
+    return z + (z**3 + z) / (4 * dof) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * dof**2)
+
+
+class Ensemble(NamedTuple):
+    # Averaged response on t (seconds from the target edge). band is the 95% confidence
+    # half-width of the mean; metrics maps name -> (mean, std, 95% half-width) across runs
+    # and mean_metrics holds the metrics of the averaged response itself.
+    t: np.ndarray
+    target: np.ndarray
+    mean: np.ndarray
+    std: np.ndarray
+    band: np.ndarray
+    runs: int
+    dropped: int
+    metrics: dict
+    mean_metrics: dict
+
+    def summary(self, names=METRICS) -> str:
+        # Shape metrics come from the averaged response: per-run peaks ride on the noise and
+        # per-run settling is only as good as the band.
+        parts = []
+        for name in names:
+            if name in MEAN_METRICS:
+                parts.append(f"{name}={self.mean_metrics[name]:.4g}")
+            else:
+                parts.append(f"{name}={self.metrics[name][0]:.4g}±{self.metrics[name][2]:.2g}")
+        return ", ".join(parts)
+
+
+def align_runs(captures: list, window_s: float, pre_s: float = 0.1):
+    # captures: (block, start) per run as returned by SampleTap.release, with device times in
+    # block[:, 0]. Runs are cut at their own target edge and stacked on one index grid;
+    # returns (t, targets, actuals, prev_targets, dropped) with (runs, samples) arrays.
+    edges = []
+    usable = []
+    steps = []
+    for block, start in captures:
+        if start is None or len(block) - start < 2:
+            continue
+        edges.append(_target_edge(block[:, 1], start))
+        usable.append(block)
+        steps.append((block[-1, 0] - block[0, 0]) / (len(block) - 1))
+    dropped = len(captures) - len(usable)
+    if not usable:
+        raise ValueError("no run captured a response")
+    dt = float(np.median(steps))
+    pre = int(round(pre_s / dt))
+    post = int(round(window_s / dt))
+    # Every run must cover the same grid; short ones are clipped to the shortest.
+    post = min(post, min(len(block) - edge for block, edge in zip(usable, edges)))
+    pre = min(pre, min(edges))
+    if post < 2:
+        raise ValueError("runs are too short to align")
+    offsets = np.arange(-pre, post)
+    grid = offsets * dt
+    stacked = np.empty((len(usable), len(offsets), 2))
+    for row, (block, edge) in enumerate(zip(usable, edges)):
+        window = block[edge - pre : edge + post]
+        relative = window[:, 0] - block[edge, 0]
+        if np.all(np.abs(relative - grid) < 0.5 * dt):
+            stacked[row] = window[:, 1:]
+        else:
+            # Missing or late samples in this run: resample it onto the grid instead.
+            rel_all = block[:, 0] - block[edge, 0]
+            stacked[row, :, 0] = np.interp(grid, rel_all, block[:, 1])
+            stacked[row, :, 1] = np.interp(grid, rel_all, block[:, 2])
+    baseline = stacked[:, :pre, 0]
+    prev_targets = np.median(baseline, axis=1) if pre else stacked[:, 0, 0]
+    return grid, stacked[:, :, 0], stacked[:, :, 1], prev_targets, dropped
+
+
+def _noise_floor(t: np.ndarray, actuals: np.ndarray) -> np.ndarray:
+    # Per-run std pooled over the pre-edge baseline and the settled tail (the sse window);
+    # the baseline alone is too short to estimate the noise over a whole response.
+    tail = t >= t[-1] - max(t[-1] * 0.2, 0.1)
+    quiet = [part for part in (actuals[:, t < 0], actuals[:, tail]) if part.shape[1] > 1]
+    squares = sum(((part - part.mean(axis=1, keepdims=True)) ** 2).sum(axis=1) for part in quiet)
+    dof = sum(part.shape[1] - 1 for part in quiet)
+    return np.sqrt(squares / dof)
+
+
+def ensemble(captures: list, window_s: float, pre_s: float = 0.1) -> Ensemble:
+    t, targets, actuals, prev_targets, dropped = align_runs(captures, window_s, pre_s)
+    runs = len(actuals)
+    after = t >= 0
+    mean = actuals.mean(axis=0)
+    std = actuals.std(axis=0, ddof=1) if runs > 1 else np.zeros_like(mean)
+    band = _t95(runs - 1) * std / np.sqrt(runs)
+    noise = _noise_floor(t, actuals)
+    per_run = step_metrics(t[after], targets[:, after], actuals[:, after], prev_targets, noise)
+    metrics = {}
+    for name, values in per_run.items():
+        values = values[~np.isnan(values)]
+        n = len(values)
+        centre = float(values.mean()) if n else float("nan")
+        spread = float(values.std(ddof=1)) if n > 1 else float("nan")
+        metrics[name] = (centre, spread, _t95(n - 1) * spread / np.sqrt(n) if n > 1 else spread)
+    target = targets.mean(axis=0)
+    averaged = step_metrics(
+        t[after], target[None, after], mean[None, after], [float(np.mean(prev_targets))],
+        _noise_floor(t, mean[None, :]),
+    )
+    return Ensemble(
+        t, target, mean, std, band, runs, dropped, metrics,
+        {name: float(values[0]) for name, values in averaged.items()},
+    )
+
+
+class Capture:
+    # Samples fed to a SampleTap while the capture is open; start is the sample count at
+    # the moment the response command went out.
+    def __init__(self) -> None:
+        self.chunks = []
+        self.count = 0
+        self.start = None
+
+
+class SampleTap:
+    # Base for the links a runner drives. Subclasses call feed() from wherever samples
+    # arrive and mark() right where the response command is queued.
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.captures = []
+
+    def capture(self) -> Capture:
+        capture = Capture()
+        with self.lock:
+            self.captures.append(capture)
+        return capture
+
+    def feed(self, times, targets, actuals) -> None:
+        if not self.captures:
+            return
+        block = np.column_stack((times, targets, actuals)).astype(np.float64)
+        with self.lock:
+            for capture in self.captures:
+                capture.chunks.append(block)
+                capture.count += len(block)
+
+    def mark(self, capture: Capture) -> None:
+        with self.lock:
+            capture.start = capture.count
+
+    def release(self, capture: Capture) -> tuple[np.ndarray, int | None]:
+        with self.lock:
+            self.captures.remove(capture)
+        if not capture.chunks:
+            return np.empty((0, 3)), None
+        return np.concatenate(capture.chunks), capture.start
+
+
+class SerialLink(SampleTap):
+    # Headless link: owns the port, decodes samples on its own thread.
+    def __init__(self, port: str, baud: int) -> None:
+        super().__init__()
+        self.serial_port = serial.Serial(port, baudrate=baud, timeout=0.1)
+        self.codec = Codec()
+        self.seq = 0
+        self.error = None
+        self.started = time.monotonic()
+        self.stop_event = threading.Event()
+        self.reader = threading.Thread(target=self._read, name="link-reader", daemon=True)
+        self.reader.start()
+        self.send(GetSchema())
+
+    def send(self, message) -> None:
+        self.serial_port.write(frame(message))
+
+    def respond(self, kind: str, values: tuple, duration: float | None, capture: Capture) -> None:
+        self.seq += 1
+        self.mark(capture)
+        self.send(Response(kind, values, duration, self.seq))
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.reader.join(timeout=1.0)
+        self.serial_port.close()
+
+    def _read(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                raw = self.serial_port.readline()
+            except serial.SerialException as exc:
+                self.error = f"serial link lost: {exc}"
+                return
+            line = raw.decode("ascii", "replace").strip()
+            if not line:
+                continue
+            message = self.codec.decode(line)
+            kind = type(message)
+            if kind is Batch and message.block is not None:
+                schema = self.codec.schema
+                self.feed(
+                    message.device_times() / 1000.0,
+                    message.block[:, schema.target_index],
+                    message.block[:, schema.actual_index],
+                )
+            elif kind is Sample:
+                schema = message.schema
+                self.feed(
+                    [time.monotonic() - self.started],
+                    [message.row[schema.target_index]],
+                    [message.row[schema.actual_index]],
+                )
+            elif kind is SchemaAnnounce:
+                self.codec.schema = message.schema
+
+
+class ResultStore:
+    # One SQLite file per output directory; only ever touched from the analysis thread.
+    def __init__(self, path: str) -> None:
+        import sqlite3
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY, name TEXT, plan_path TEXT, plan TEXT,
+                started REAL, finished REAL
+            );
+            CREATE TABLE IF NOT EXISTS steps (
+                run_id INTEGER, step INTEGER, gains TEXT, kind TEXT, params TEXT,
+                duration REAL, samples INTEGER, csv TEXT, PRIMARY KEY (run_id, step)
+            );
+            CREATE TABLE IF NOT EXISTS metrics (
+                run_id INTEGER, step INTEGER, name TEXT, value REAL,
+                PRIMARY KEY (run_id, step, name)
+            );
+            CREATE INDEX IF NOT EXISTS steps_by_kind ON steps (kind, gains);
+            CREATE TABLE IF NOT EXISTS ensembles (
+                run_id INTEGER, first_step INTEGER, last_step INTEGER, runs INTEGER,
+                csv TEXT, PRIMARY KEY (run_id, first_step)
+            );
+            CREATE TABLE IF NOT EXISTS ensemble_metrics (
+                run_id INTEGER, first_step INTEGER, name TEXT, mean REAL, std REAL,
+                ci95 REAL, averaged REAL, PRIMARY KEY (run_id, first_step, name)
+            );
+            CREATE INDEX IF NOT EXISTS metrics_by_name ON metrics (name, run_id);
+            """
+        )
+        self.run_id = None
+
+    def begin(self, plan: Plan) -> int:
+        cursor = self.db.execute(
+            "INSERT INTO runs (name, plan_path, plan, started) VALUES (?, ?, ?, ?)",
+            (plan.name, plan.path, plan.text, time.time()),
+        )
+        self.db.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def add_step(self, step: Step, samples: int, csv_path: str | None, metrics: dict) -> None:
+        self.db.execute(
+            "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.run_id, step.index, step.gains_name, step.kind, json.dumps(step.values),
+                step.duration, samples, csv_path,
+            ),
+        )
+        self.db.executemany(
+            "INSERT INTO metrics VALUES (?, ?, ?, ?)",
+            [
+                (self.run_id, step.index, name, None if np.isnan(value) else value)
+                for name, value in metrics.items()
+            ],
+        )
+        self.db.commit()
+
+    def add_ensemble(self, step: Step, result: "Ensemble", csv_path: str, names) -> None:
+        first_step = step.index - step.repeat_index
+        self.db.execute(
+            "INSERT INTO ensembles VALUES (?, ?, ?, ?, ?)",
+            (self.run_id, first_step, step.index, result.runs, csv_path),
+        )
+        self.db.executemany(
+            "INSERT INTO ensemble_metrics VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    self.run_id, first_step, name,
+                    *(None if np.isnan(v) else v for v in result.metrics[name]),
+                    None if np.isnan(result.mean_metrics[name]) else result.mean_metrics[name],
+                )
+                for name in names
+            ],
+        )
+        self.db.commit()
+
+    def finish(self) -> None:
+        self.db.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self.run_id))
+        self.db.commit()
+        self.db.close()
+
+
+class ExperimentRunner(threading.Thread):
+    # Walks a plan on its own thread; step N is analysed and stored on a single worker
+    # while step N+1 runs on the device.
+    TAIL_S = 0.25
+
+    def __init__(self, plan: Plan, link, report=print, finished=None, ensembled=None) -> None:
+        super().__init__(name="experiment", daemon=True)
+        self.plan = plan
+        self.link = link
+        self.report = report
+        self.finished = finished
+        self.ensembled = ensembled
+        self.group = []
+        self.stop_event = threading.Event()
+        self.completed = 0
+
+    def abort(self) -> None:
+        self.stop_event.set()
+
+    def run(self) -> None:
+        try:
+            self._run()
+        finally:
+            # The GUI unlocks its controls here, whatever happened to the sequence.
+            if self.finished is not None:
+                self.finished()
+
+    def _run(self) -> None:
+        import sqlite3
+        from concurrent.futures import ThreadPoolExecutor
+
+        plan = self.plan
+        analysis = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis")
+        error = None
+        try:
+            os.makedirs(plan.output, exist_ok=True)
+            store = analysis.submit(ResultStore, os.path.join(plan.output, "results.sqlite"))
+            store = store.result()
+            run_id = analysis.submit(store.begin, plan).result()
+            self.report(f"Sequence {plan.name}: run {run_id}, {len(plan.steps)} steps")
+            pending = []
+            error = self._execute(store, run_id, analysis, pending)
+            for future in pending:
+                future.result()
+            analysis.submit(store.finish).result()
+        except (OSError, ValueError, serial.SerialException, sqlite3.Error, csv.Error) as exc:
+            error = str(exc)
+        finally:
+            analysis.shutdown(wait=True)
+        if error:
+            self.report(f"ERR: sequence {plan.name} stopped: {error}")
+        elif self.stop_event.is_set():
+            self.report(f"Sequence {plan.name} aborted after {self.completed} steps")
+        else:
+            self.report(f"Sequence {plan.name} finished: results in {plan.output}")
+
+    def _execute(self, store: ResultStore, run_id: int, analysis, pending: list) -> str | None:
+        plan = self.plan
+        link = self.link
+        if plan.sample_time_ms is not None:
+            link.send(SetSampleTime(plan.sample_time_ms))
+        gains = None
+        for step in plan.steps:
+            if step.gains is not None and step.gains != gains:
+                link.send(SetGains(*step.gains))
+                gains = step.gains
+            # The settle wait doubles as the baseline the metrics measure the step from.
+            capture = link.capture()
+            if self.stop_event.wait(step.settle_s):
+                link.release(capture)
+                return None
+            self.report(f"Step {step.index + 1}/{len(plan.steps)}: {step.describe()}")
+            link.respond(step.kind, step.values, step.duration, capture)
+            aborted = self.stop_event.wait(step.capture_s + self.TAIL_S)
+            block, start = link.release(capture)
+            if link.error:
+                return link.error
+            if aborted:
+                return None
+            path = os.path.join(plan.output, f"run{run_id:03d}_step{step.index:03d}.csv")
+            pending.append(analysis.submit(self._analyse, store, step, block, start, path))
+            while pending and pending[0].done():
+                pending.pop(0).result()
+        return None
+
+    def _analyse(self, store: ResultStore, step: Step, block: np.ndarray, start, path: str) -> None:
+        metrics = response_metrics(block[:, 0], block[:, 1], block[:, 2], start, step.capture_s)
+        metrics = {name: metrics[name] for name in self.plan.metrics}
+        if start is None or not len(block):
+            path = None
+        else:
+            rows = block.copy()
+            rows[:, 0] -= rows[start, 0] if start < len(rows) else rows[-1, 0]
+            with open(path, "w", newline="", encoding="utf-8") as handle:
+                writer = csv.writer(handle)
+                writer.writerow(["time_s", "target", "actual"])
+                writer.writerows(rows.tolist())
+        store.add_step(step, len(block), path, metrics)
+        self.completed += 1
+        summary = ", ".join(f"{name}={value:.4g}" for name, value in metrics.items())
+        self.report(f"Step {step.index + 1} ({len(block)} samples): {summary}")
+        if step.ensemble:
+            self.group.append((block, start))
+            if step.repeat_index == step.repeats - 1:
+                captures, self.group = self.group, []
+                self._average(store, step, captures)
+
+    def _average(self, store: ResultStore, step: Step, captures: list) -> None:
+        first = step.index - step.repeat_index
+        try:
+            result = ensemble(captures, step.capture_s)
+        except ValueError as exc:
+            self.report(f"ERR: ensemble of steps {first + 1}-{step.index + 1}: {exc}")
+            return
+        path = os.path.join(
+            self.plan.output, f"run{store.run_id:03d}_step{first:03d}_ensemble.csv"
+        )
+        rows = np.column_stack(
+            (
+                result.t, result.target, result.mean, result.std,
+                result.mean - result.band, result.mean + result.band,
+            )
+        )
+        with open(path, "w", newline="", encoding="utf-8") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(["time_s", "target", "mean", "std", "ci95_low", "ci95_high"])
+            writer.writerows(rows.tolist())
+        store.add_ensemble(step, result, path, self.plan.metrics)
+        dropped = f", {result.dropped} runs without data" if result.dropped else ""
+        self.report(
+            f"Ensemble of {result.runs} x {step.describe()}{dropped}: "
+            f"{result.summary(self.plan.metrics)}"
+        )
+        if self.ensembled is not None:
+            self.ensembled(step, result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run an experiment plan without the GUI.")
+    parser.add_argument("plan", help="TOML or YAML experiment plan")
+    parser.add_argument("--port", required=True)
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--out", help="results directory (default: from the plan)")
+    args = parser.parse_args()
+
+    try:
+        plan = load_plan(args.plan)
+    except (OSError, ValueError) as exc:
+        sys.exit(f"ERR: {exc}")
+    if args.out:
+        plan = plan._replace(output=os.path.abspath(args.out))
+    link = SerialLink(args.port, args.baud)
+    runner = ExperimentRunner(plan, link)
+    runner.start()
+    try:
+        while runner.is_alive():
+            runner.join(0.2)
+    except KeyboardInterrupt:
+        runner.abort()
+        runner.join()
+    link.close()
+
+
+if __name__ == "__main__":
+    main()
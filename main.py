@@ -1,21 +1,3047 @@
+import base64
+import bisect
+import cProfile
 import csv
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
 import queue
+import select
+import selectors
+import socket
+import stat
+import struct
+import sys
 import threading
+import traceback
 import tkinter as tk
 from collections import deque
+from multiprocessing import shared_memory
 from tkinter import filedialog
 from tkinter import ttk
 import time
 import statistics
 
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+import numpy as np
 import serial
-from serial.tools import list_ports
+
+from experiments import (
+    METRICS,
+    ExperimentRunner,
+    SampleTap,
+    load_plan,
+    repeat_plan,
+    window_metrics,
+)
+from protocol import (
+    DEFAULT_SCHEMA,
+    BadBatch,
+    BadSchema,
+    Batch,
+    ChannelSchema,
+    Codec,
+    DeviceError,
+    EStop,
+    GetPid,
+    GetSchema,
+    PidStatus,
+    ProfileAbort,
+    ProfileAck,
+    ProfileBegin,
+    ProfileEnd,
+    ProfileStatus,
+    Response,
+    Sample,
+    SchemaAnnounce,
+    SetGains,
+    SetSampleTime,
+    StartRelayTune,
+    StartTune,
+    StopTune,
+    TuneStatus,
+    frame,
+)
+
+
+def _plotting():
+    # matplotlib dominates cold start; it is imported when the first figure is built.
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from matplotlib.figure import Figure
+
+    return Figure, FigureCanvasTkAgg
+
+
+def _list_ports():
+    from serial.tools import list_ports
+
+    return list_ports.comports()
+
+
+PROFILE_SHAPES = ["Chirp", "PRBS", "Multisine", "Trapezoid", "CSV"]
+
+
+def _profile_length(duration: float, sample_time_s: float) -> int:
+    if duration <= 0 or sample_time_s <= 0:
+        raise ValueError("duration and sample time must be positive")
+    return max(int(round(duration / sample_time_s)), 1)
+
+
+def _chirp_profile(
+    amplitude: float, offset: float, f0: float, f1: float, duration: float, sample_time_s: float
+) -> np.ndarray:
+    n = _profile_length(duration, sample_time_s)
+    t = np.arange(n) * sample_time_s
+    # Linear sweep: instantaneous frequency goes f0 -> f1 over the duration.
+    k = (f1 - f0) / duration
+    phase = 2.0 * np.pi * (f0 * t + 0.5 * k * t * t)
+    return (offset + amplitude * np.sin(phase)).astype(np.float32)
+
+
+# Feedback taps (1-based, Fibonacci form) of primitive polynomials for maximum-length LFSRs.
+MLS_TAPS = {
+    3: (3, 2),
+    4: (4, 3),
+    5: (5, 3),
+    6: (6, 5),
+    7: (7, 6),
+    8: (8, 6, 5, 4),
+    9: (9, 5),
+    10: (10, 7),
+    11: (11, 9),
+    12: (12, 11, 10, 4),
+    13: (13, 12, 11, 8),
+    14: (14, 13, 12, 2),
+    15: (15, 14),
+    16: (16, 15, 13, 4),
+}
+
+
+def _mls_sequence(order: int) -> np.ndarray:
+    taps = MLS_TAPS[order]
+    length = (1 << order) - 1
+    state = length
+    out = np.empty(length, dtype=np.int8)
+    for i in range(length):
+        out[i] = state & 1
+        feedback = 0
+        for tap in taps:
+            feedback ^= (state >> (order - tap)) & 1
+        state = (state >> 1) | (feedback << (order - 1))
+    return out
+
+
+def _periods_for(duration: float, period: int, sample_time_s: float) -> int:
+    # At least two periods: the first one absorbs the plant transient.
+    return max(int(duration / (period * sample_time_s)), 2)
+
+
+def _prbs_profile(
+    amplitude: float,
+    offset: float,
+    f_min: float,
+    hold: int,
+    duration: float,
+    sample_time_s: float,
+) -> tuple[np.ndarray, int]:
+    _profile_length(duration, sample_time_s)
+    hold = max(int(hold), 1)
+    # One period must be at least 1/f_min long to resolve the lowest frequency of interest.
+    bits_needed = 1.0 / (max(f_min, 1e-6) * sample_time_s * hold)
+    order = int(np.ceil(np.log2(bits_needed + 1.0)))
+    order = min(max(order, min(MLS_TAPS)), max(MLS_TAPS))
+    levels = np.repeat(_mls_sequence(order) * 2.0 - 1.0, hold)
+    period = len(levels)
+    values = np.tile(levels, _periods_for(duration, period, sample_time_s))
+    return (offset + amplitude * values).astype(np.float32), period
+
+
+def _multisine_profile(
+    amplitude: float,
+    offset: float,
+    f_min: float,
+    f_max: float,
+    tones: int,
+    duration: float,
+    sample_time_s: float,
+) -> tuple[np.ndarray, int]:
+    _profile_length(duration, sample_time_s)
+    if f_min <= 0 or f_max <= f_min:
+        raise ValueError("multisine needs 0 < Freq Lo < Freq Hi")
+    # Frequency resolution 1/(period*Ts) equals f_min, so every tone lands on an FFT bin.
+    period = max(int(round(1.0 / (f_min * sample_time_s))), 8)
+    top_bin = min(int(f_max * period * sample_time_s), period // 2 - 1)
+    if top_bin < 1:
+        raise ValueError("Freq Hi is below the frequency resolution")
+    bins = np.unique(np.round(np.geomspace(1, top_bin, max(int(tones), 1))).astype(int))
+    k = np.arange(1, len(bins) + 1)
+    # Schroeder phases keep the crest factor low for a flat amplitude spectrum.
+    phases = -np.pi * k * (k - 1) / len(bins)
+    spectrum = np.zeros(period // 2 + 1, dtype=complex)
+    spectrum[bins] = np.exp(1j * phases)
+    one_period = np.fft.irfft(spectrum, n=period)
+    one_period /= np.max(np.abs(one_period))
+    values = np.tile(one_period, _periods_for(duration, period, sample_time_s))
+    return (offset + amplitude * values).astype(np.float32), period
+
+
+def _estimate_frf(
+    times, inputs, outputs, sample_time_s: float, period: int, count: int | None = None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    t = np.asarray(times, dtype=np.float64)
+    if len(t) < 2 or np.any(np.diff(t) <= 0):
+        raise ValueError("capture time base is not increasing")
+    inputs = np.asarray(inputs, dtype=np.float64)
+    # Blocks are anchored at the first target change (profile sample 0); the capture
+    # runs on past the excitation, and count samples is where the profile ends.
+    moved = np.flatnonzero(np.abs(inputs - inputs[0]) > 1e-6 * (np.abs(inputs).max() + 1.0))
+    if not moved.size:
+        raise ValueError("target never changed during the capture")
+    t0 = t[moved[0]]
+    n = int(np.floor((t[-1] - t0) / sample_time_s + 1e-9)) + 1
+    if count is not None:
+        n = min(n, count)
+    grid = t0 + np.arange(n) * sample_time_s
+    u = np.interp(grid, t, inputs)
+    y = np.interp(grid, t, np.asarray(outputs, dtype=np.float64))
+    periods = len(grid) // period - 1
+    if periods < 1:
+        raise ValueError("capture must cover at least two excitation periods")
+    # Drop the first period (transient) and average the following ones.
+    stop = (periods + 1) * period
+    u = u[period:stop]
+    y = y[period:stop]
+    u_blocks = (u - u.mean()).reshape(periods, period)
+    y_blocks = (y - y.mean()).reshape(periods, period)
+    u_spec = np.fft.rfft(u_blocks, axis=1)
+    y_spec = np.fft.rfft(y_blocks, axis=1)
+    s_uu = np.mean(np.abs(u_spec) ** 2, axis=0)
+    s_yy = np.mean(np.abs(y_spec) ** 2, axis=0)
+    s_yu = np.mean(np.conj(u_spec) * y_spec, axis=0)
+    freqs = np.fft.rfftfreq(period, sample_time_s)
+    excited = s_uu > 1e-3 * np.max(s_uu[1:])
+    excited[0] = False
+    response = s_yu[excited] / s_uu[excited]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coherence = np.abs(s_yu[excited]) ** 2 / (s_uu[excited] * s_yy[excited])
+    return freqs[excited], response, np.nan_to_num(coherence)
+
+
+def _trapezoid_profile(
+    amplitude: float, offset: float, ramp_s: float, duration: float, sample_time_s: float
+) -> np.ndarray:
+    n = _profile_length(duration, sample_time_s)
+    t = np.arange(n) * sample_time_s
+    ramp_s = min(max(ramp_s, 0.0), duration / 2.0)
+    knots_t = [0.0, ramp_s, duration - ramp_s, duration]
+    knots_v = [0.0, 1.0, 1.0, 0.0]
+    return (offset + amplitude * np.interp(t, knots_t, knots_v)).astype(np.float32)
+
+
+def _load_csv_profile(filepath: str, sample_time_s: float) -> np.ndarray:
+    rows = []
+    with open(filepath, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            try:
+                rows.append([float(cell) for cell in row if cell.strip()])
+            except ValueError:
+                # Header or comment line.
+                continue
+    rows = [row for row in rows if row]
+    if not rows:
+        raise ValueError("no numeric rows in CSV")
+    if min(len(row) for row in rows) >= 2:
+        # time_s,value columns: resample onto the controller sample grid.
+        data = np.asarray([row[:2] for row in rows], dtype=np.float64)
+        times = data[:, 0] - data[0, 0]
+        if np.any(np.diff(times) <= 0):
+            raise ValueError("CSV time column must be strictly increasing")
+        grid = np.arange(0.0, times[-1] + sample_time_s / 2.0, sample_time_s)
+        return np.interp(grid, times, data[:, 1]).astype(np.float32)
+    return np.asarray([row[0] for row in rows], dtype=np.float32)
+
+
+class ProfileStreamer:
+    READY_TIMEOUT_S = 2.0
+    ACK_TIMEOUT_S = 2.0
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        sample_time_ms: float,
+        write,
+        on_event,
+        seq: int,
+        chunk: int = 64,
+        binary: bool = False,
+    ) -> None:
+        self.values = np.ascontiguousarray(values, dtype=np.float32)
+        self.sample_time_ms = sample_time_ms
+        self.write = write
+        self.on_event = on_event
+        self.seq = seq
+        self.chunk = max(int(chunk), 1)
+        self.binary = binary
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.ready = False
+        self.done = False
+        self.error = None
+        self.device_free = 0
+        # Blocks sent but not yet acknowledged: block seq -> sample count.
+        self.in_flight = {}
+        self.sent = 0
+        # Reader-thread state for feed_text().
+        self.codec = Codec()
+        self.partial = ""
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+
+    def is_alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def on_ready(self, capacity: int) -> None:
+        with self.cond:
+            self.ready = True
+            self.device_free = capacity
+            self.chunk = max(min(self.chunk, capacity), 1)
+            self.cond.notify_all()
+
+    def on_ack(self, block_seq: int, free: int) -> None:
+        with self.cond:
+            for key in [k for k in self.in_flight if k <= block_seq]:
+                del self.in_flight[key]
+            # FREE is absolute at the time of the ack; blocks sent after it are still in flight.
+            self.device_free = free
+            self.cond.notify_all()
+
+    def feed_text(self, text: str) -> None:
+        # Called from the reader thread with raw chunks, so credits keep flowing while
+        # the Tk thread is busy in a dialog or a long redraw.
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            if line.startswith("PACK="):
+                message = self.codec.decode(line.strip())
+                if type(message) is ProfileAck:
+                    self.on_ack(message.seq, message.free)
+
+    def on_done(self) -> None:
+        with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+    def on_error(self, message: str) -> None:
+        with self.cond:
+            self.error = message
+            self.cond.notify_all()
+
+    def _credit(self) -> int:
+        return self.device_free - sum(self.in_flight.values())
+
+    def _wait(self, predicate, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while not predicate():
+                if self.stop_event.is_set() or self.error is not None:
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            return True
+
+    def _encode_block(self, block_seq: int, offset: int, block: np.ndarray) -> bytes:
+        if self.binary:
+            payload = block.astype("<f4").tobytes()
+            header = f"PBB={block_seq},{offset},{len(block)},{len(payload)}\n"
+            return header.encode("ascii") + payload
+        values = ",".join(f"{v:.6g}" for v in block.tolist())
+        return f"PB={block_seq},{offset},{values}\n".encode("ascii")
+
+    def _run(self) -> None:
+        total = len(self.values)
+        try:
+            self.write(frame(ProfileBegin(total, self.sample_time_ms, self.binary, self.seq)))
+            if not self._wait(lambda: self.ready, self.READY_TIMEOUT_S):
+                self._finish("no PROFILE=READY from device")
+                return
+            block_seq = 0
+            offset = 0
+            while offset < total:
+                want = min(self.chunk, total - offset)
+                if not self._wait(lambda: self._credit() >= want, self.ACK_TIMEOUT_S):
+                    self._finish("profile acknowledgement timeout")
+                    return
+                block_seq += 1
+                block = self.values[offset:offset + want]
+                with self.cond:
+                    self.in_flight[block_seq] = want
+                self.write(self._encode_block(block_seq, offset, block))
+                offset += want
+                self.sent = offset
+            self.write(frame(ProfileEnd(self.seq)))
+            playback_s = total * self.sample_time_ms / 1000.0
+            if not self._wait(lambda: self.done, playback_s + self.ACK_TIMEOUT_S):
+                self._finish("no PROFILE=DONE from device")
+                return
+        except (serial.SerialException, OSError) as exc:
+            self._finish(f"profile write failed: {exc}")
+            return
+        self._finish(None)
+
+    def _finish(self, error: str | None) -> None:
+        if self.stop_event.is_set():
+            try:
+                self.write(frame(ProfileAbort(self.seq)))
+            except (serial.SerialException, OSError):
+                pass
+            self.on_event("stopped", None)
+        elif error is not None or self.error is not None:
+            self.on_event("error", self.error or error)
+        else:
+            self.on_event("done", None)
+
+
+TRIGGER_MODES = ["Single", "Normal", "Auto"]
+TRIGGER_CONDITIONS = ["Target change", "Actual rising", "Actual falling", "Error band", "Rate limit"]
+
+
+class TriggerEngine:
+    CAPACITY = 1 << 17
+
+    def __init__(self) -> None:
+        self.times = np.zeros(self.CAPACITY)
+        self.target = np.zeros(self.CAPACITY)
+        self.actual = np.zeros(self.CAPACITY)
+        # Absolute sample count; ring slot is total % CAPACITY.
+        self.total = 0
+        self.mode = "Single"
+        self.condition = "Target change"
+        self.level = 0.0
+        self.pre_s = 1.0
+        self.post_s = 2.0
+        self.armed = False
+        self.armed_at = None
+        self.trigger_time = None
+        self.forced = False
+
+    def configure(self, mode: str, condition: str, level: float, pre_s: float, post_s: float) -> None:
+        if mode not in TRIGGER_MODES or condition not in TRIGGER_CONDITIONS:
+            raise ValueError("unknown trigger mode or condition")
+        if pre_s < 0 or post_s <= 0:
+            raise ValueError("pre must be >= 0 and post > 0")
+        self.mode = mode
+        self.condition = condition
+        self.level = level
+        self.pre_s = pre_s
+        self.post_s = post_s
+
+    def arm(self) -> None:
+        self.armed = True
+        self.armed_at = self.times[(self.total - 1) % self.CAPACITY] if self.total else None
+        self.trigger_time = None
+        self.forced = False
+
+    def disarm(self) -> None:
+        self.armed = False
+        self.trigger_time = None
+
+    def _store(self, times: np.ndarray, target: np.ndarray, actual: np.ndarray) -> None:
+        n = len(times)
+        if n >= self.CAPACITY:
+            times = times[-self.CAPACITY:]
+            target = target[-self.CAPACITY:]
+            actual = actual[-self.CAPACITY:]
+            self.total += n - self.CAPACITY
+            n = self.CAPACITY
+        slots = (self.total + np.arange(n)) % self.CAPACITY
+        self.times[slots] = times
+        self.target[slots] = target
+        self.actual[slots] = actual
+        self.total += n
+
+    def _first_hit(self, times: np.ndarray, target: np.ndarray, actual: np.ndarray) -> int | None:
+        # Prepend the last stored sample so edges across block boundaries are seen.
+        if self.total:
+            last = (self.total - 1) % self.CAPACITY
+            times = np.concatenate(([self.times[last]], times))
+            target = np.concatenate(([self.target[last]], target))
+            actual = np.concatenate(([self.actual[last]], actual))
+        if len(times) < 2:
+            return None
+        level = self.level
+        if self.condition == "Target change":
+            hits = np.abs(np.diff(target)) > max(level, 1e-9)
+        elif self.condition == "Actual rising":
+            hits = (actual[:-1] < level) & (actual[1:] >= level)
+        elif self.condition == "Actual falling":
+            hits = (actual[:-1] > level) & (actual[1:] <= level)
+        elif self.condition == "Error band":
+            outside = np.abs(target - actual) > level
+            hits = outside[1:] & ~outside[:-1]
+        else:
+            dt = np.diff(times)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rate = np.where(dt > 0, np.abs(np.diff(actual)) / dt, 0.0)
+            hits = rate > level
+        found = np.flatnonzero(hits)
+        if not len(found):
+            return None
+        # Index into the incoming block of the sample that satisfied the condition.
+        return int(found[0]) + (0 if self.total else 1)
+
+    def push(self, times, target, actual) -> list[tuple]:
+        times = np.asarray(times, dtype=np.float64)
+        target = np.asarray(target, dtype=np.float64)
+        actual = np.asarray(actual, dtype=np.float64)
+        if not len(times):
+            return []
+        if self.armed and self.trigger_time is None:
+            hit = self._first_hit(times, target, actual)
+            if hit is not None:
+                self.trigger_time = float(times[hit])
+            elif self.mode == "Auto":
+                if self.armed_at is None:
+                    self.armed_at = float(times[0])
+                elif times[-1] - self.armed_at >= self.pre_s + self.post_s:
+                    # Free-run: capture anyway so the display never goes stale.
+                    self.trigger_time = float(times[-1])
+                    self.forced = True
+        self._store(times, target, actual)
+        captures = []
+        if self.trigger_time is not None and times[-1] >= self.trigger_time + self.post_s:
+            captures.append(self._extract())
+            if self.mode == "Single":
+                self.disarm()
+            else:
+                self.arm()
+        return captures
+
+    def _extract(self) -> tuple:
+        start = max(self.total - self.CAPACITY, 0)
+        slots = np.arange(start, self.total) % self.CAPACITY
+        times = self.times[slots]
+        mask = (times >= self.trigger_time - self.pre_s) & (times <= self.trigger_time + self.post_s)
+        return (
+            self.trigger_time,
+            self.forced,
+            times[mask] - self.trigger_time,
+            self.target[slots][mask],
+            self.actual[slots][mask],
+        )
+
+
+class ChannelRing:
+    def __init__(self, capacity: int, width: int) -> None:
+        self.capacity = capacity
+        self.data = np.full((capacity, width), np.nan)
+        self.total = 0
+
+    def extend(self, block: np.ndarray) -> None:
+        n = len(block)
+        if n >= self.capacity:
+            self.total += n - self.capacity
+            block = block[-self.capacity:]
+            n = self.capacity
+        slots = (self.total + np.arange(n)) % self.capacity
+        self.data[slots] = block
+        self.total += n
+
+    def view(self) -> np.ndarray:
+        if self.total <= self.capacity:
+            return self.data[: self.total]
+        start = self.total % self.capacity
+        return np.concatenate((self.data[start:], self.data[:start]))
+
+
+class SpectrumAnalyzer:
+    # Overlapping-window FFT over the live stream: a frame every hop samples, Hann window,
+    # exponentially averaged magnitude. Ring, window and frame buffers are allocated once,
+    # and update() computes at most one frame, so the cost per redraw is fixed.
+    SIZES = [256, 512, 1024, 2048, 4096]
+
+    def __init__(self, size: int = 1024, channels: int = 2, overlap: float = 0.75) -> None:
+        self.size = size
+        self.hop = max(int(size * (1.0 - overlap)), 1)
+        self.window = np.hanning(size)
+        # Amplitude spectrum: a sine of amplitude A shows up as a peak of height A.
+        self.scale = 2.0 / self.window.sum()
+        self.ring = np.zeros((channels, size))
+        self.frame = np.empty((channels, size))
+        self.magnitude = np.zeros((channels, size // 2 + 1))
+        self.position = 0
+        self.filled = 0
+        self.pending = 0
+        self.frames = 0
+        self.smoothing = 0.3
+
+    def extend(self, block: np.ndarray) -> None:
+        # block is (samples, channels).
+        n = len(block)
+        if n >= self.size:
+            block = block[-self.size :]
+            n = self.size
+        end = self.position + n
+        if end <= self.size:
+            self.ring[:, self.position : end] = block.T
+        else:
+            split = self.size - self.position
+            self.ring[:, self.position :] = block[:split].T
+            self.ring[:, : end - self.size] = block[split:].T
+        self.position = end % self.size
+        self.filled = min(self.filled + n, self.size)
+        self.pending += n
+
+    def update(self) -> bool:
+        if self.filled < self.size or self.pending < self.hop:
+            return False
+        # Behind by several hops: skip straight to the newest window.
+        self.pending = 0
+        frame = self.frame
+        tail = self.size - self.position
+        frame[:, :tail] = self.ring[:, self.position :]
+        frame[:, tail:] = self.ring[:, : self.position]
+        np.nan_to_num(frame, copy=False)
+        frame -= frame.mean(axis=1, keepdims=True)
+        frame *= self.window
+        magnitude = np.abs(np.fft.rfft(frame, axis=1))
+        magnitude *= self.scale
+        if self.frames:
+            self.magnitude += self.smoothing * (magnitude - self.magnitude)
+        else:
+            self.magnitude[:] = magnitude
+        self.frames += 1
+        return True
+
+    def frequencies(self, rate_hz: float) -> np.ndarray:
+        return np.fft.rfftfreq(self.size, 1.0 / rate_hz)
+
+    def peaks(self, channel: int, rate_hz: float, count: int = 3) -> list[tuple[float, float]]:
+        # Local maxima standing well above the median floor, refined by parabolic
+        # interpolation between bins; DC and the first bin are ignored.
+        m = self.magnitude[channel]
+        floor = np.median(m[2:])
+        candidates = np.flatnonzero((m[2:-1] > m[1:-2]) & (m[2:-1] >= m[3:])) + 2
+        candidates = candidates[m[candidates] > 4.0 * floor]
+        if not candidates.size:
+            return []
+        candidates = candidates[np.argsort(m[candidates])[::-1][:count]]
+        a, b, c = m[candidates - 1], m[candidates], m[candidates + 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            offset = np.nan_to_num(0.5 * (a - c) / (a - 2 * b + c))
+        bin_hz = rate_hz / self.size
+        return [
+            (float((k + d) * bin_hz), float(v)) for k, d, v in zip(candidates, offset, b)
+        ]
+
+
+class SignalConditioner:
+    # Streaming cleanup between parsing and buffering. Non-finite values are held at the last
+    # good value, a trailing Hampel filter replaces spikes with the window median, and
+    # jittered device timestamps can be interpolated onto a uniform grid of whole multiples
+    # of the locked spacing. The filter tail, last good row and grid index carry across
+    # blocks, so output and cost per sample do not depend on how the stream is chunked.
+    # The trailing window delays a genuine step by window // 2 samples: one sample into a
+    # step looks exactly like a spike, so the target (column 0) is only filled, never
+    # filtered, to keep commanded edges where the device put them.
+    MAX_GAP_STEPS = 50
+    LOCK_STEPS = 64
+
+    def __init__(
+        self, width: int, window: int = 5, n_sigmas: float = 3.0, resample: bool = False
+    ) -> None:
+        self.width = width
+        # Odd, so the median is a single partitioned element.
+        self.window = max(int(window), 1) | 1
+        self.n_sigmas = n_sigmas
+        self.resample = resample
+        self.tail = None
+        self.quantum = np.full(width - 1, np.inf)
+        self.last_median = np.full(width - 1, np.nan)
+        self.last_good = np.full(width, np.nan)
+        self.dt_ms = None
+        self.observed_ms = None
+        self.lock_steps = []
+        self.last_time = None
+        self.last_row = None
+        self.next_index = None
+        self.samples = 0
+        self.filled = 0
+        self.outliers = 0
+
+    def process(
+        self, times: np.ndarray | None, block: np.ndarray
+    ) -> tuple[np.ndarray | None, np.ndarray, np.ndarray]:
+        # times are device milliseconds (None when the stream has none); block is
+        # (samples, width). Returns times, conditioned rows and the raw input on the same
+        # rows; resampling can change the number of rows returned.
+        raw = np.array(block, dtype=np.float64)
+        self.samples += len(raw)
+        block = self._fill(raw)
+        if self.window >= 3 and self.width > 1:
+            block = np.hstack((block[:, :1], self._hampel(block[:, 1:])))
+        if self.resample and times is not None:
+            # Raw columns ride along so they land on the same grid rows.
+            times = np.asarray(times, dtype=np.float64)
+            times, both = self._resample(times, np.hstack((block, raw)))
+            return times, both[:, : self.width], both[:, self.width :]
+        return times, block, raw
+
+    def _fill(self, block: np.ndarray) -> np.ndarray:
+        bad = ~np.isfinite(block)
+        if bad.any():
+            self.filled += int(bad.sum())
+            rows = np.arange(len(block))[:, None]
+            # Index of the most recent good row at or before each row, -1 if none yet.
+            source = np.maximum.accumulate(np.where(bad, -1, rows), axis=0)
+            held = np.take_along_axis(block, np.maximum(source, 0), axis=0)
+            block = np.where(source < 0, self.last_good, held)
+        self.last_good = np.where(np.isfinite(block[-1]), block[-1], self.last_good)
+        return block
+
+    def _hampel(self, block: np.ndarray) -> np.ndarray:
+        if self.tail is None:
+            self.tail = np.repeat(block[:1], self.window - 1, axis=0)
+        data = np.concatenate((self.tail, block))
+        self.tail = data[1 - self.window :].copy()
+        rows, columns = data.strides
+        windows = np.lib.stride_tricks.as_strided(
+            data, (len(block), block.shape[1], self.window), (rows, columns, rows), writeable=False
+        )
+        middle = self.window // 2
+        median = np.partition(windows, middle, axis=-1)[..., middle]
+        spread = np.abs(windows - median[..., None])
+        mad = 1.4826 * np.partition(spread, middle, axis=-1)[..., middle]
+        # Floor the MAD at the smallest step the median has taken on each column, so
+        # 1-count changes on quantized flat data are not spikes. The median ignores spikes,
+        # so one never sets its own floor; a column that has never moved has no floor yet.
+        steps = np.abs(np.diff(np.vstack((self.last_median, median)), axis=0))
+        steps[~(steps > 0)] = np.inf
+        quantum = np.minimum.accumulate(np.vstack((self.quantum, steps)), axis=0)[1:]
+        self.quantum = quantum[-1].copy()
+        self.last_median = median[-1].copy()
+        mad = np.maximum(mad, np.where(np.isfinite(quantum), quantum, 0.0))
+        outliers = np.abs(block - median) > self.n_sigmas * mad
+        if not outliers.any():
+            return block
+        self.outliers += int(outliers.sum())
+        return np.where(outliers, median, block)
+
+    def _resample(self, times: np.ndarray, block: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        steps = np.diff(times if self.last_time is None else np.r_[self.last_time, times])
+        if steps.size and (steps <= 0).any():
+            # Device clock wrapped or restarted inside the block: hand it through as is.
+            self._unlock()
+            return times, block
+        previous_time, previous_row = self.last_time, self.last_row
+        self.last_time = float(times[-1])
+        self.last_row = block[-1].copy()
+        if self.dt_ms is None:
+            # Samples pass through until enough steps are seen to pick the grid spacing.
+            needed = self.LOCK_STEPS - len(self.lock_steps)
+            self.lock_steps.extend(steps[:needed].tolist())
+            if len(self.lock_steps) < self.LOCK_STEPS:
+                return times, block
+            self.dt_ms = self.observed_ms = float(np.median(self.lock_steps))
+            # The sample whose step completed the lock is the last one passed through; the
+            # rest of the block is already on the grid.
+            split = needed if previous_time is None else needed - 1
+            self.next_index = self._grid_index(times[split]) + 1
+            grid, out = self._interpolate(
+                times[split + 1 :], block[split + 1 :], times[split], block[split]
+            )
+            return np.r_[times[: split + 1], grid], np.vstack((block[: split + 1], out))
+        dt = self.dt_ms
+        if steps.size:
+            step = (times[-1] - (times[0] if previous_time is None else previous_time)) / steps.size
+            self.observed_ms += 0.1 * (step - self.observed_ms)
+            if abs(self.observed_ms - dt) > 0.2 * dt:
+                # The sample time changed: relock on the new rate.
+                self._unlock()
+                return times, block
+        return self._interpolate(times, block, previous_time, previous_row)
+
+    def _grid_index(self, time_ms: float) -> int:
+        # Index of the last grid point at or before time_ms.
+        return int(np.floor(time_ms / self.dt_ms + 1e-9))
+
+    def _interpolate(
+        self, times: np.ndarray, block: np.ndarray, previous_time, previous_row
+    ) -> tuple[np.ndarray, np.ndarray]:
+        dt = self.dt_ms
+        if not len(times):
+            return times, block
+        if previous_time is None or times[0] - previous_time > self.MAX_GAP_STEPS * dt:
+            self.next_index = int(np.ceil(times[0] / dt - 1e-9))
+            source_times, source = times, block
+        else:
+            source_times = np.r_[previous_time, times]
+            source = np.vstack((previous_row, block))
+        count = self._grid_index(times[-1]) - self.next_index + 1
+        if count <= 0:
+            return times[:0], block[:0]
+        grid = (self.next_index + np.arange(count)) * dt
+        self.next_index += count
+        out = np.empty((count, block.shape[1]))
+        for column in range(block.shape[1]):
+            out[:, column] = np.interp(grid, source_times, source[:, column])
+        return grid, out
+
+    def _unlock(self) -> None:
+        self.dt_ms = None
+        self.lock_steps = []
+        self.last_time = None
+
+    def summary(self) -> str:
+        text = (
+            f"Conditioning: {self.samples} samples, {self.filled} non-finite held, "
+            f"{self.outliers} outliers replaced"
+        )
+        if self.resample and self.dt_ms is not None:
+            text += f", resampled to {self.dt_ms:.3f} ms"
+        return text
+
+
+class TraceLod:
+    # Min/max pyramid of a static trace. Each level keeps the extremes of BUCKET samples of
+    # the level below, so a redraw hands matplotlib a few points per pixel at most.
+    BUCKET = 8
+    MIN_POINTS = 2048
+
+    def __init__(self, times: np.ndarray, values: np.ndarray) -> None:
+        self.levels = [(times, values)]
+        while len(self.levels[-1][0]) > self.MIN_POINTS:
+            self.levels.append(self._decimate(*self.levels[-1]))
+
+    @classmethod
+    def _decimate(cls, times: np.ndarray, values: np.ndarray) -> tuple:
+        n = len(values) // cls.BUCKET * cls.BUCKET
+        t = times[:n].reshape(-1, cls.BUCKET)
+        v = values[:n].reshape(-1, cls.BUCKET)
+        missing = np.isnan(v)
+        lo = np.argmin(np.where(missing, np.inf, v), axis=1)
+        hi = np.argmax(np.where(missing, -np.inf, v), axis=1)
+        rows = np.arange(len(v))
+        first = np.minimum(lo, hi)
+        second = np.maximum(lo, hi)
+        out_t = np.column_stack((t[rows, first], t[rows, second]))
+        out_v = np.column_stack((v[rows, first], v[rows, second]))
+        # Keep gaps visible: a bucket that had missing samples ends in a break.
+        out_v[missing.any(axis=1), 1] = np.nan
+        return (
+            np.concatenate((out_t.ravel(), times[n:])),
+            np.concatenate((out_v.ravel(), values[n:])),
+        )
+
+    def view(self, t0: float, t1: float, pixels: int) -> tuple:
+        # Finest level that keeps the visible span within a few points per pixel.
+        for times, values in self.levels:
+            i0, i1 = np.searchsorted(times, (t0, t1))
+            if i1 - i0 <= 4 * pixels:
+                break
+        return times[max(i0 - 1, 0) : i1 + 1], values[max(i0 - 1, 0) : i1 + 1]
+
+
+class ReferenceTrace:
+    # A past run overlaid on the response window; times start at 0 like the live capture.
+    TIME_COLUMNS = ("time_s", "device_time_s", "timestamp")
+    ACTUAL_COLUMNS = ("actual", "mean")
+
+    def __init__(self, name: str, times, targets, actuals) -> None:
+        self.name = name
+        self.times = times
+        self.targets = targets
+        self.actuals = actuals
+        self.lod = TraceLod(times, actuals)
+        self.line = None
+        self.view_key = None
+        self.metrics_cache = {}
+
+    @classmethod
+    def load(cls, path: str) -> "ReferenceTrace":
+        # Response, step, ensemble and recording CSVs. Repeated header rows (schema changes
+        # mid-recording) are skipped; gap rows keep NaN values and reuse the previous time.
+        with open(path, newline="", encoding="utf-8") as handle:
+            reader = csv.reader(handle)
+            header = next(reader, [])
+            columns = {name: index for index, name in enumerate(header)}
+            try:
+                actual_index = next(columns[n] for n in cls.ACTUAL_COLUMNS if n in columns)
+                target_index = columns["target"]
+            except (StopIteration, KeyError):
+                raise ValueError("no target/actual columns") from None
+            time_indices = [columns[name] for name in cls.TIME_COLUMNS if name in columns]
+            if not time_indices:
+                raise ValueError("no time column")
+            rows = []
+            for row in reader:
+                try:
+                    rows.append(
+                        [
+                            float(row[time_indices[0]] or "nan"),
+                            float(row[time_indices[-1]] or "nan"),
+                            float(row[target_index] or "nan"),
+                            float(row[actual_index] or "nan"),
+                        ]
+                    )
+                except (ValueError, IndexError):
+                    continue
+        data = np.array(rows, dtype=np.float64).reshape(-1, 4)
+        if not len(data):
+            raise ValueError("no samples")
+        # Recordings leave device_time_s empty without a device clock; fall back to wall time.
+        times = data[:, 0] if np.isfinite(data[:, 0]).mean() > 0.5 else data[:, 1]
+        filled = np.maximum.accumulate(np.where(np.isfinite(times), times, -np.inf))
+        if not np.isfinite(filled[-1]):
+            raise ValueError("no valid timestamps")
+        filled[~np.isfinite(filled)] = filled[np.isfinite(filled)][0]
+        return cls(
+            os.path.basename(path), filled - filled[0], data[:, 2], data[:, 3]
+        )
+
+    def metrics(self, t_start: float | None, t_end: float | None) -> dict:
+        key = (t_start, t_end)
+        if key not in self.metrics_cache:
+            start = 0.0 if t_start is None else t_start
+            end = self.times[-1] if t_end is None else t_end
+            self.metrics_cache[key] = window_metrics(
+                self.times, self.targets, self.actuals, start, end
+            )
+        return self.metrics_cache[key]
+
+
+def _serial_reader(
+    port,
+    stop_event: threading.Event,
+    rx_queue: queue.Queue,
+    notify=None,
+    event_driven: bool = False,
+    on_error=None,
+    on_text=None,
+) -> None:
+    fd = None
+    if event_driven and os.name == "posix":
+        try:
+            fd = port.fileno()
+        except (AttributeError, OSError, ValueError):
+            fd = None
+    while not stop_event.is_set():
+        try:
+            if fd is not None:
+                # Sleep in the kernel until bytes arrive, then take everything buffered.
+                readable, _, _ = select.select([fd], [], [], 0.1)
+                if not readable:
+                    continue
+                data = port.read(max(port.in_waiting, 1))
+            else:
+                waiting = port.in_waiting
+                if waiting:
+                    data = port.read(waiting)
+                else:
+                    data = port.read(1)
+
+            if data:
+                try:
+                    text = data.decode("utf-8", errors="replace")
+                except UnicodeDecodeError:
+                    text = ""
+                if text:
+                    if on_text is not None:
+                        on_text(text)
+                    rx_queue.put(text)
+                    if notify is not None:
+                        notify()
+        except (serial.SerialException, OSError) as exc:
+            rx_queue.put(f"!ERR: serial read failed: {exc}\n")
+            if notify is not None:
+                notify()
+            if on_error is not None:
+                on_error(exc)
+            break
+
+
+def _probe_port(device: str, baud: int, deadline: float) -> float | None:
+    # Returns the GETPID round-trip time, or None if no PID controller answered.
+    start = time.monotonic()
+    try:
+        with serial.Serial(device, baudrate=baud, timeout=0.05, write_timeout=0.2) as port:
+            port.reset_input_buffer()
+            port.write(frame(GetPid()))
+            buffer = b""
+            while time.monotonic() < deadline:
+                buffer += port.read(port.in_waiting or 1)
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    if line.strip().startswith(b"PID="):
+                        return time.monotonic() - start
+    except (serial.SerialException, OSError, ValueError):
+        return None
+    return None
+
+
+def _probe_ports(devices: list[str], baud: int, timeout_s: float) -> dict:
+    # All ports are probed at once, so detection takes one timeout however many ports exist.
+    deadline = time.monotonic() + timeout_s
+    results = {}
+
+    def worker(device: str) -> None:
+        results[device] = _probe_port(device, baud, deadline)
+
+    threads = [
+        threading.Thread(target=worker, args=(device,), name=f"probe-{device}", daemon=True)
+        for device in devices
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()) + 0.2)
+    return {device: results.get(device) for device in devices}
+
+
+def _port_identity(info) -> tuple:
+    # Survives a USB reset that re-enumerates the device under a new name.
+    return (info.vid, info.pid, info.serial_number or info.location or info.device)
+
+
+class PortMonitor(threading.Thread):
+    INTERVAL_S = 1.0
+
+    def __init__(self, on_change) -> None:
+        super().__init__(name="port-monitor", daemon=True)
+        self.on_change = on_change
+        self.stop_event = threading.Event()
+
+    def run(self) -> None:
+        last = None
+        while not self.stop_event.is_set():
+            try:
+                infos = _list_ports()
+            except OSError:
+                infos = None
+            if infos is not None:
+                key = sorted((info.device, _port_identity(info)) for info in infos)
+                if key != last:
+                    last = key
+                    self.on_change(infos)
+            self.stop_event.wait(self.INTERVAL_S)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+
+class PortWriter(threading.Thread):
+    # One per port. Writes are queued so the Tk thread never waits on a port, and a group
+    # send releases every port's write from one barrier.
+
+    def __init__(self, write) -> None:
+        super().__init__(daemon=True)
+        self.write = write
+        self.queue = queue.Queue()
+
+    def submit(self, data: bytes, barrier=None, on_done=None) -> None:
+        self.queue.put((data, barrier, on_done))
+
+    def stop(self) -> None:
+        self.queue.put(None)
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            data, barrier, on_done = item
+            if barrier is not None:
+                try:
+                    barrier.wait(timeout=1.0)
+                except threading.BrokenBarrierError:
+                    pass
+            stamp = time.perf_counter()
+            error = None
+            try:
+                self.write(data)
+            except (serial.SerialException, OSError) as exc:
+                error = str(exc)
+            if on_done is not None:
+                on_done(stamp, error)
+
+
+def _broadcast(writers: list[PortWriter], data: bytes, on_done) -> None:
+    # on_done(skew_s, errors) runs on whichever writer thread finishes last.
+    barrier = threading.Barrier(len(writers))
+    lock = threading.Lock()
+    stamps = []
+    errors = []
+
+    def _done(stamp: float, error: str | None) -> None:
+        with lock:
+            stamps.append(stamp)
+            if error is not None:
+                errors.append(error)
+            if len(stamps) < len(writers):
+                return
+        on_done(max(stamps) - min(stamps), errors)
+
+    for writer in writers:
+        writer.submit(data, barrier, _done)
+
+
+RX_POLICIES = ["Coalesce", "Drop oldest", "Pause"]
+
+
+def _next_record_path(filepath: str) -> str:
+    # run.csv -> run_part2.csv -> run_part3.csv; a schema change starts a new file so every
+    # CSV keeps a single header.
+    base, ext = os.path.splitext(filepath)
+    stem, sep, part = base.rpartition("_part")
+    if sep and part.isdigit():
+        base, number = stem, int(part) + 1
+    else:
+        number = 2
+    while os.path.exists(f"{base}_part{number}{ext}"):
+        number += 1
+    return f"{base}_part{number}{ext}"
+
+
+def _split_channels(block: np.ndarray, schema: ChannelSchema) -> tuple[list, list, np.ndarray]:
+    # Decoded rows -> (targets, actuals, extras) in schema order.
+    return (
+        block[:, schema.target_index].tolist(),
+        block[:, schema.actual_index].tolist(),
+        block[:, schema.extra_indices],
+    )
+
+
+def _is_sample_line(line: str) -> bool:
+    return line.startswith("B,") or ("," in line and line[0] in "-+.0123456789")
+
+
+def _line_samples(line: str) -> int:
+    if line.startswith("B,"):
+        try:
+            return max(int(line.split(",", 4)[3]), 0)
+        except (IndexError, ValueError):
+            return 0
+    return 1
+
+
+class RxBuffer:
+    def __init__(
+        self, max_bytes: int = 256 * 1024, max_blocks: int = 256, max_age_s: float = 1.0
+    ) -> None:
+        self.cond = threading.Condition()
+        self.max_bytes = max_bytes
+        self.max_blocks = max_blocks
+        self.max_age_s = max_age_s
+        self.policy = "Coalesce"
+        # Set while recording: gets every complete line before any display policy applies.
+        self.recorder = None
+        self.interrupted = False
+        self.partial = ""
+        # Set after an over-long partial line was dropped, until its newline arrives.
+        self.discarding = False
+        # Display queue: [arrival time, lines, bytes]. Backlog: lines skipped for display.
+        self.blocks = deque()
+        self.bytes = 0
+        self.backlog = deque()
+        self.backlog_bytes = 0
+        self.dropped_bytes = 0
+        self.dropped_samples = 0
+        self.max_depth_bytes = 0
+        self.max_depth_blocks = 0
+        self.bytes_in = 0
+        self.pause_s = 0.0
+        self.paused = False
+        self.last_overload = None
+
+    def put(self, text: str) -> None:
+        with self.cond:
+            self.bytes_in += len(text)
+            if text.startswith("!ERR:"):
+                lines = [text.strip()]
+            else:
+                text = self.partial + text
+                self.partial = ""
+                if self.discarding:
+                    # The rest of an over-long line: drop it up to its newline.
+                    head, newline, text = text.partition("\n")
+                    self.dropped_bytes += len(head) + len(newline)
+                    self.discarding = not newline
+                body, _, partial = text.rpartition("\n")
+                if len(partial) > self.max_bytes:
+                    # No device line is this long; keeping a tail would decode as garbage.
+                    self.dropped_bytes += len(partial)
+                    self.last_overload = time.monotonic()
+                    self.discarding = True
+                else:
+                    self.partial = partial
+                lines = [line.strip() for line in body.split("\n")]
+                lines = [line for line in lines if line]
+                recorder = self.recorder
+                if recorder is not None and lines:
+                    recorder.submit(lines, time.time())
+            if not lines:
+                return
+            nbytes = sum(len(line) + 1 for line in lines)
+            if self.policy == "Pause":
+                start = time.monotonic()
+                # Stop reading the port: the OS/USB buffer pushes back on the device.
+                while self.blocks and self.bytes + nbytes > self.max_bytes and not self.interrupted:
+                    self.paused = True
+                    self.cond.wait(0.1)
+                if self.paused:
+                    self.pause_s += time.monotonic() - start
+                    self.last_overload = time.monotonic()
+                    self.paused = False
+            if self.policy != "Pause" and len(self.blocks) >= self.max_blocks:
+                # Coalesce into the newest block instead of growing the queue.
+                block = self.blocks[-1]
+                block[1].extend(lines)
+                block[2] += nbytes
+                block[3] = time.time()
+            else:
+                self.blocks.append([time.monotonic(), lines, nbytes, time.time()])
+            self.bytes += nbytes
+            while self.policy != "Pause" and self.bytes > self.max_bytes and len(self.blocks) > 1:
+                _, old_lines, old_bytes, old_wall = self.blocks.popleft()
+                self.bytes -= old_bytes
+                self._spill(old_lines, old_bytes, old_wall)
+            self.max_depth_bytes = max(self.max_depth_bytes, self.bytes)
+            self.max_depth_blocks = max(self.max_depth_blocks, len(self.blocks))
+
+    def _spill(self, lines: list[str], nbytes: int, arrived_wall: float) -> None:
+        samples = sum(_line_samples(line) for line in lines if _is_sample_line(line))
+        self.dropped_bytes += nbytes
+        self.dropped_samples += samples
+        self.last_overload = time.monotonic()
+        # Status lines (acks, schema, PID) are never dropped; only samples are, and only for
+        # display: the recorder already has them.
+        kept = [line for line in lines if not _is_sample_line(line)]
+        if kept:
+            self.backlog.append((kept, arrived_wall))
+            self.backlog_bytes += sum(len(line) + 1 for line in kept)
+
+    def drain(self) -> list[tuple[bool, list[str], float]]:
+        with self.cond:
+            items = [(True, lines, wall) for lines, wall in self.backlog]
+            now = time.monotonic()
+            for arrived, lines, nbytes, wall in self.blocks:
+                stale = self.policy == "Drop oldest" and now - arrived > self.max_age_s
+                if stale:
+                    self._count_stale(lines, nbytes)
+                items.append((stale, lines, wall))
+            self.backlog.clear()
+            self.backlog_bytes = 0
+            self.blocks.clear()
+            self.bytes = 0
+            self.cond.notify_all()
+        return items
+
+    def _count_stale(self, lines: list[str], nbytes: int) -> None:
+        self.dropped_bytes += nbytes
+        self.dropped_samples += sum(_line_samples(line) for line in lines if _is_sample_line(line))
+        self.last_overload = time.monotonic()
+
+    def interrupt(self) -> None:
+        with self.cond:
+            self.interrupted = True
+            self.cond.notify_all()
+
+    def resume(self) -> None:
+        with self.cond:
+            self.interrupted = False
+            self.partial = ""
+            self.discarding = False
+
+    def stats(self) -> dict:
+        with self.cond:
+            overloaded = self.paused or (
+                self.last_overload is not None and time.monotonic() - self.last_overload < 2.0
+            )
+            return {
+                "policy": self.policy,
+                "depth_bytes": self.bytes,
+                "max_depth_bytes": self.max_depth_bytes,
+                "max_depth_blocks": self.max_depth_blocks,
+                "dropped_bytes": self.dropped_bytes,
+                "dropped_samples": self.dropped_samples,
+                "pause_s": self.pause_s,
+                "overloaded": overloaded,
+            }
+
+
+class LatencyHistogram:
+    # Log-spaced bin edges from 0.1 ms to 10 s.
+    EDGES_MS = [0.1 * (10 ** (i / 8.0)) for i in range(41)]
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts = [0] * (len(self.EDGES_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, value_ms: float) -> None:
+        self.counts[bisect.bisect_left(self.EDGES_MS, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, fraction: float) -> float | None:
+        if not self.count:
+            return None
+        needed = fraction * self.count
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= needed:
+                # Upper edge of the bin; the overflow bin reports the observed maximum.
+                if index < len(self.EDGES_MS):
+                    return min(self.EDGES_MS[index], self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+    def summary(self) -> str:
+        if not self.count:
+            return "--"
+        return (
+            f"p50 {self.percentile(0.5):.1f} / p90 {self.percentile(0.9):.1f} / "
+            f"max {self.max_ms:.1f} ms (n={self.count})"
+        )
+
+
+LOG_SEVERITIES = ["INFO", "WARN", "ERR"]
+LOG_CATEGORIES = ["app", "rx", "tx", "data"]
+
+
+class LogRing:
+    CAPACITY = 20000
+    # Lines per second per category before messages are counted instead of shown.
+    RATE_LIMITS = {"app": 200, "rx": 100, "tx": 100, "data": 20}
+
+    def __init__(self) -> None:
+        self.entries = deque(maxlen=self.CAPACITY)
+        self.pending = []
+        self.suppressed = dict.fromkeys(LOG_CATEGORIES, 0)
+        self.windows = {category: [0.0, 0] for category in LOG_CATEGORIES}
+        self.min_severity = 0
+        self.categories = set(LOG_CATEGORIES)
+
+    def add(self, severity: int, category: str, text: str) -> None:
+        if severity < LOG_SEVERITIES.index("ERR"):
+            window = self.windows[category]
+            now = time.monotonic()
+            if now - window[0] >= 1.0:
+                window[0] = now
+                window[1] = 0
+            window[1] += 1
+            if window[1] > self.RATE_LIMITS[category]:
+                self.suppressed[category] += 1
+                return
+        entry = (severity, category, text)
+        self.entries.append(entry)
+        self.pending.append(entry)
+
+    def visible(self, entry: tuple) -> bool:
+        return entry[0] >= self.min_severity and entry[1] in self.categories
+
+    def take_pending(self) -> list[str]:
+        for category, count in self.suppressed.items():
+            if count:
+                self.suppressed[category] = 0
+                text = f"{count:,} {category} lines suppressed"
+                entry = (LOG_SEVERITIES.index("WARN"), category, text)
+                self.entries.append(entry)
+                self.pending.append(entry)
+        lines = [entry[2] for entry in self.pending if self.visible(entry)]
+        self.pending = []
+        return lines
+
+    def filtered(self, limit: int) -> list[str]:
+        lines = deque((entry[2] for entry in self.entries if self.visible(entry)), maxlen=limit)
+        return list(lines)
+
+
+class TxCommand:
+    __slots__ = (
+        "payload",
+        "key",
+        "seq",
+        "expect",
+        "confirm",
+        "retries",
+        "attempts",
+        "queued_at",
+        "sent_at",
+        "deadline",
+        "track_effect",
+    )
+
+    def __init__(
+        self,
+        payload: str,
+        seq: int | None,
+        expect: str | None,
+        retries: int,
+        track_effect: bool,
+    ) -> None:
+        self.payload = payload
+        self.key = payload.split("=", 1)[0].split(",", 1)[0].strip()
+        self.seq = seq
+        self.expect = expect
+        # Only commands with a SEQ or a known reply can be confirmed and retried.
+        self.confirm = seq is not None or expect is not None
+        self.retries = retries
+        self.attempts = 0
+        self.queued_at = time.perf_counter()
+        self.sent_at = None
+        self.deadline = None
+        self.track_effect = track_effect
+
+
+class CommandWriter:
+    # A target change later than this is not credited to a command still waiting for its effect.
+    EFFECT_TIMEOUT_S = 5.0
+    MAX_AWAITING_EFFECT = 32
+
+    def __init__(
+        self, write, on_event, max_in_flight: int = 8, timeout_s: float = 1.0, retries: int = 2
+    ) -> None:
+        self.write = write
+        self.on_event = on_event
+        self.max_in_flight = max_in_flight
+        self.timeout_s = timeout_s
+        self.retries = retries
+        self.cond = threading.Condition()
+        self.pending = deque()
+        self.in_flight = []
+        # Sent commands without a known reply; an ACK=<key> still gives a latency sample.
+        self.unconfirmed = {}
+        self.awaiting_effect = deque(maxlen=self.MAX_AWAITING_EFFECT)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.ack_hist = LatencyHistogram()
+        self.effect_hist = LatencyHistogram()
+        self.write_hist = LatencyHistogram()
+        self.sent = 0
+        self.acked = 0
+        self.timeouts = 0
+        self.failures = 0
+        # Set once the device answers a SEQ on this connection; until then nothing shows that
+        # it would drop a resent command instead of acting on it twice.
+        self.seq_acked = False
+
+    def start(self) -> None:
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        with self.cond:
+            self.pending.clear()
+            self.in_flight.clear()
+            self.unconfirmed.clear()
+            self.awaiting_effect.clear()
+            self.cond.notify_all()
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+
+    def submit(
+        self,
+        payload: str,
+        seq: int | None = None,
+        expect: str | None = None,
+        retries: int | None = None,
+        track_effect: bool = False,
+        priority: bool = False,
+    ) -> TxCommand:
+        command = TxCommand(
+            payload, seq, expect, self.retries if retries is None else retries, track_effect
+        )
+        with self.cond:
+            if priority:
+                self.pending.appendleft(command)
+            else:
+                self.pending.append(command)
+            self.cond.notify_all()
+        return command
+
+    def _next_deadline(self) -> float | None:
+        deadlines = [command.deadline for command in self.in_flight]
+        return min(deadlines) if deadlines else None
+
+    def _expire(self, now: float) -> None:
+        for command in [c for c in self.in_flight if c.deadline <= now]:
+            self.in_flight.remove(command)
+            self.timeouts += 1
+            if command.attempts <= command.retries:
+                # Resend ahead of newer commands. Only idempotent commands, or SEQ commands once
+                # the device has answered a SEQ, are queued with retries.
+                self.pending.appendleft(command)
+                self.on_event("retry", command)
+            else:
+                self.failures += 1
+                self.on_event("failed", command)
+
+    def _run(self) -> None:
+        while not self.stop_event.is_set():
+            with self.cond:
+                while not self.stop_event.is_set():
+                    now = time.perf_counter()
+                    self._expire(now)
+                    if self.pending and len(self.in_flight) < self.max_in_flight:
+                        break
+                    deadline = self._next_deadline()
+                    self.cond.wait(0.1 if deadline is None else max(deadline - now, 0.001))
+                if self.stop_event.is_set():
+                    return
+                command = self.pending.popleft()
+                command.attempts += 1
+                # Stamp before writing so a fast reply cannot beat the bookkeeping.
+                start = time.perf_counter()
+                command.sent_at = start
+                if command.confirm:
+                    command.deadline = start + self.timeout_s
+                    self.in_flight.append(command)
+                else:
+                    self.unconfirmed[command.key] = command
+                if command.track_effect and command.attempts == 1:
+                    self.awaiting_effect.append(command)
+            try:
+                self.write((command.payload + "\n").encode("utf-8"))
+            except (serial.SerialException, OSError) as exc:
+                with self.cond:
+                    if command in self.in_flight:
+                        self.in_flight.remove(command)
+                    self.unconfirmed.pop(command.key, None)
+                self.failures += 1
+                self.on_event("error", (command, str(exc)))
+                continue
+            end = time.perf_counter()
+            with self.cond:
+                self.sent += 1
+                self.write_hist.add((end - start) * 1000.0)
+
+    def on_line(self, line: str, now: float | None = None) -> bool:
+        now = time.perf_counter() if now is None else now
+        with self.cond:
+            if not self.in_flight and not self.unconfirmed:
+                return False
+            matched = None
+            ack = line[4:].strip() if line.startswith("ACK=") else None
+            for command in self.in_flight:
+                if command.sent_at is None:
+                    continue
+                if command.seq is not None and (
+                    ack == str(command.seq) or f"SEQ={command.seq}" in line
+                ):
+                    matched = command
+                    break
+                if command.expect is not None and line.startswith(command.expect):
+                    matched = command
+                    break
+            if matched is not None:
+                if matched.seq is not None:
+                    self.seq_acked = True
+                self.in_flight.remove(matched)
+                self.acked += 1
+                self.ack_hist.add((now - matched.sent_at) * 1000.0)
+                self.cond.notify_all()
+                return True
+            if ack is not None and ack in self.unconfirmed:
+                command = self.unconfirmed.pop(ack)
+                self.acked += 1
+                self.ack_hist.add((now - command.sent_at) * 1000.0)
+                return True
+        return False
+
+    def note_effect(self, now: float | None = None) -> None:
+        now = time.perf_counter() if now is None else now
+        with self.cond:
+            awaiting = self.awaiting_effect
+            while awaiting and now - awaiting[0].sent_at > self.EFFECT_TIMEOUT_S:
+                awaiting.popleft()
+            if awaiting:
+                command = awaiting.popleft()
+                self.effect_hist.add((now - command.sent_at) * 1000.0)
+
+    def reset_stats(self) -> None:
+        with self.cond:
+            self.ack_hist.reset()
+            self.effect_hist.reset()
+            self.write_hist.reset()
+            self.sent = self.acked = self.timeouts = self.failures = 0
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "sent": self.sent,
+                "acked": self.acked,
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+                "queued": len(self.pending),
+                "in_flight": len(self.in_flight),
+                "ack": self.ack_hist.summary(),
+                "effect": self.effect_hist.summary(),
+                "write": self.write_hist.summary(),
+            }
+
+
+class DeviceSession:
+    PLOT_LEN = 300
+
+    def __init__(self, port_name: str, baud: int) -> None:
+        self.port_name = port_name
+        self.baud = baud
+        self.serial_port = None
+        self.reader_thread = None
+        self.writer = None
+        self.stop_event = threading.Event()
+        self.rx_queue = RxBuffer()
+        self.tx_lock = threading.Lock()
+        self.codec = Codec()
+        self.rx_handlers = {
+            SchemaAnnounce: self._on_schema,
+            BadSchema: self._on_bad_schema,
+            Batch: self._on_batch,
+            BadBatch: self._on_bad_batch,
+            Sample: self._on_sample,
+            DeviceError: self._on_device_error,
+        }
+        self.times = deque(maxlen=self.PLOT_LEN)
+        self.target = deque(maxlen=self.PLOT_LEN)
+        self.actual = deque(maxlen=self.PLOT_LEN)
+        self.sample_index = 0
+        self.samples_total = 0
+        self.error = None
+        self.recorder = None
+        self.record_events = queue.SimpleQueue()
+        self.target_line = None
+        self.actual_line = None
+
+    def open(self, notify=None, event_driven: bool = False) -> None:
+        self.serial_port = serial.Serial(self.port_name, baudrate=self.baud, timeout=0.1)
+        self.stop_event.clear()
+        self.reader_thread = threading.Thread(
+            target=_serial_reader,
+            args=(self.serial_port, self.stop_event, self.rx_queue, notify, event_driven),
+            daemon=True,
+        )
+        self.reader_thread.start()
+        self.writer = PortWriter(self.write)
+        self.writer.start()
+        self.writer.submit(frame(GetSchema()))
+
+    def close(self) -> None:
+        self.stop_recording()
+        self.stop_event.set()
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        if self.reader_thread and self.reader_thread.is_alive():
+            self.reader_thread.join(timeout=1.0)
+        if self.serial_port:
+            self.serial_port.close()
+            self.serial_port = None
+
+    def write(self, data: bytes) -> None:
+        port = self.serial_port
+        if port is None:
+            raise serial.SerialException("port closed")
+        with self.tx_lock:
+            port.write(data)
+
+    def start_recording(self, filepath: str) -> None:
+        recorder = LineRecorder(self.schema, self._on_record_event)
+        recorder.open(filepath)
+        recorder.start()
+        self.recorder = recorder
+        self.rx_queue.recorder = recorder
+
+    def stop_recording(self) -> None:
+        self.rx_queue.recorder = None
+        if self.recorder is not None:
+            self.recorder.stop()
+        self.recorder = None
+
+    def _on_record_event(self, kind: str, detail: str) -> None:
+        if kind == "record_path":
+            detail = f"Recording continues in {detail}"
+        self.record_events.put(detail)
+
+    def drain(self) -> list[str]:
+        messages = []
+        while not self.record_events.empty():
+            messages.append(self.record_events.get())
+        decode = self.codec.decode
+        for _, lines, _ in self.rx_queue.drain():
+            for line in lines:
+                message = decode(line)
+                handler = self.rx_handlers.get(type(message))
+                text = handler(message) if handler is not None else line
+                if text:
+                    messages.append(text)
+        return messages
+
+    def _on_schema(self, message: SchemaAnnounce) -> str:
+        self.codec.schema = message.schema
+        return f"Channel schema: {self.schema.describe()}"
+
+    def _on_bad_schema(self, message: BadSchema) -> str:
+        return f"ERR: bad channel schema: {message.error}"
+
+    def _on_batch(self, message: Batch) -> None:
+        if message.block is None:
+            return None
+        targets, actuals, _ = _split_channels(message.block, self.schema)
+        self._append(message.device_times() / 1000.0, targets, actuals)
+        return None
+
+    def _on_bad_batch(self, message: BadBatch) -> None:
+        return None
+
+    def _on_sample(self, message: Sample) -> None:
+        targets, actuals, _ = _split_channels(message.row[None, :], message.schema)
+        times = np.array([self.sample_index / CdcGuiApp.RX_RATE_HZ])
+        self.sample_index += 1
+        self._append(times, targets, actuals)
+        return None
+
+    def _on_device_error(self, message: DeviceError) -> str:
+        self.error = message.encode()
+        return self.error
+
+    @property
+    def schema(self) -> ChannelSchema:
+        return self.codec.schema
+
+    def _append(self, times: np.ndarray, targets: list, actuals: list) -> None:
+        self.times.extend(times.tolist())
+        self.target.extend(targets)
+        self.actual.extend(actuals)
+        self.samples_total += len(targets)
+
+    def metrics(self) -> dict:
+        rate = None
+        if len(self.times) >= 2:
+            span = self.times[-1] - self.times[0]
+            if span > 0:
+                rate = (len(self.times) - 1) / span
+        rms = None
+        if self.times:
+            error = np.asarray(self.target) - np.asarray(self.actual)
+            rms = float(np.sqrt(np.mean(error * error)))
+        return {
+            "rate": rate,
+            "samples": self.samples_total,
+            "rms_error": rms,
+            "recording": self.recorder is not None,
+        }
+
+
+class SampleRing:
+    # Single-writer ring of float64 rows in shared memory. The writer claims rows before it
+    # copies them and publishes by bumping the row counter after, so readers never take a lock.
+    HEADER = 3
+    # Header: published rows, width, claimed rows (published plus any write in progress).
+    SEQ, WIDTH, CLAIMED = 0, 1, 2
+    # Row layout: device ms, batch dt ms, batch count (first row only), arrival wall,
+    # schema generation, values.
+    DEVICE, DT, COUNT, WALL, GEN, VALUES = 0, 1, 2, 3, 4, 5
+
+    def __init__(self, shm, rows: int, width: int) -> None:
+        self.shm = shm
+        self.rows = rows
+        self.width = width
+        self.header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=shm.buf)
+        self.data = np.ndarray(
+            (rows, width), dtype=np.float64, buffer=shm.buf, offset=self.HEADER * 8
+        )
+        self.read_seq = 0
+
+    @classmethod
+    def create(cls, rows: int, width: int) -> "SampleRing":
+        shm = shared_memory.SharedMemory(create=True, size=(cls.HEADER + rows * width) * 8)
+        ring = cls(shm, rows, width)
+        ring.header[:] = (0, width, 0)
+        # The GUI side only ever reads.
+        ring.header.flags.writeable = False
+        ring.data.flags.writeable = False
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, rows: int, width: int) -> "SampleRing":
+        return cls(shared_memory.SharedMemory(name=name), rows, width)
+
+    def published(self) -> int:
+        return int(self.header[self.SEQ])
+
+    def write(self, block: np.ndarray) -> None:
+        seq = int(self.header[self.SEQ])
+        total = len(block)
+        if total > self.rows:
+            block = block[total - self.rows:]
+        self.header[self.CLAIMED] = seq + total
+        pos = (seq + total - len(block)) % self.rows
+        first = min(len(block), self.rows - pos)
+        self.data[pos:pos + first] = block[:first]
+        self.data[:len(block) - first] = block[first:]
+        self.header[self.SEQ] = seq + total
+
+    def read(self) -> tuple[np.ndarray, int]:
+        # Rows published since the last read, and how many were overwritten before we got them.
+        end = int(self.header[self.SEQ])
+        start = max(self.read_seq, end - self.rows)
+        lost = start - self.read_seq
+        rows = self.data[np.arange(start, end) % self.rows]
+        # Rows a write claimed while we were copying, finished or not, may be torn.
+        lapped = int(self.header[self.CLAIMED]) - self.rows - start
+        if lapped > 0:
+            rows = rows[lapped:]
+            lost += lapped
+        self.read_seq = end
+        return rows, lost
+
+    def unread(self, count: int) -> None:
+        # Give back the tail of the last read; the next read returns those rows again.
+        self.read_seq -= count
+
+    def close(self) -> None:
+        # Views must go before the mapping can be released.
+        self.header = None
+        self.data = None
+        self.shm.close()
+
+
+def _ring_rows(
+    values: np.ndarray, schema: ChannelSchema, arrived: float, batch, width: int, gen: int = 0
+) -> np.ndarray:
+    rows = np.full((len(values), width), np.nan)
+    if batch is not None:
+        rows[:, SampleRing.DEVICE] = batch.device_times()
+        rows[0, SampleRing.DT] = batch.dt_ms
+        rows[0, SampleRing.COUNT] = batch.count
+    rows[:, SampleRing.WALL] = arrived
+    rows[:, SampleRing.GEN] = gen
+    columns = [schema.target_index, schema.actual_index] + schema.extra_indices
+    columns = columns[: width - SampleRing.VALUES]
+    rows[:, SampleRing.VALUES:SampleRing.VALUES + len(columns)] = values[:, columns]
+    return rows
+
+
+class CsvRecorder:
+    # Writes ring-layout rows to a CSV, stamped with arrival time or the clock-fitted
+    # device time. With conditioning on, the conditioned columns come first and the raw
+    # ones follow as <name>_raw. Rotates to a new file when the columns change mid-recording.
+
+    def __init__(self, schema: ChannelSchema, on_event) -> None:
+        self.schema = schema
+        self.on_event = on_event
+        self.clock = ClockModel()
+        # Reentrant so a rotation closes and reopens without a write slipping in between.
+        self.lock = threading.RLock()
+        self.file = None
+        self.writer = None
+        self.path = None
+        # (window, n_sigmas, resample) or None; the conditioner is rebuilt for each schema.
+        self.conditioning = None
+        self.conditioner = None
+
+    def header(self) -> list[str]:
+        names = ["target", "actual"] + self.schema.extra_names
+        if self.conditioning is not None:
+            names += [f"{name}_raw" for name in names]
+        return ["timestamp", "device_time_s"] + names
+
+    def open(self, filepath: str, append: bool = False) -> None:
+        csv_file = open(filepath, "a" if append else "w", newline="", encoding="utf-8")
+        with self.lock:
+            if self.file:
+                self.file.close()
+            self.file = csv_file
+            self.writer = csv.writer(csv_file)
+            self.path = filepath
+            if not append:
+                self.writer.writerow(self.header())
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file:
+                self.file.close()
+            self.file = None
+            self.writer = None
+
+    def apply_schema(self, schema: ChannelSchema) -> None:
+        with self.lock:
+            if schema.describe() == self.schema.describe():
+                return
+            self.schema = schema
+            self.conditioner = None
+            self._rotate()
+
+    def set_conditioning(self, settings: tuple | None) -> None:
+        with self.lock:
+            if settings == self.conditioning:
+                return
+            self.conditioning = settings
+            self.conditioner = None
+            self._rotate()
+
+    def _rotate(self) -> None:
+        if not self.writer:
+            return
+        filepath = _next_record_path(self.path)
+        self.close()
+        try:
+            self.open(filepath)
+        except OSError as exc:
+            self.on_event("log", f"ERR: failed to open {filepath}: {exc}")
+            return
+        self.on_event("record_path", filepath)
+
+    def write(self, block: np.ndarray) -> None:
+        walls = block[:, SampleRing.WALL].tolist()
+        device_s = [
+            None if raw_ms != raw_ms else self.clock.unwrap(raw_ms, wall)
+            for raw_ms, wall in zip(block[:, SampleRing.DEVICE].tolist(), walls)
+        ]
+        timed = [t for t in device_s if t is not None]
+        if timed:
+            # The last sample of a read left the device no later than the read arrived.
+            self.clock.observe(timed[-1], walls[-1])
+        with self.lock:
+            if not self.writer:
+                return
+            width = 2 + len(self.schema.extra_indices)
+            values = block[:, SampleRing.VALUES:SampleRing.VALUES + width]
+            if self.conditioning is not None:
+                device_s, walls, values = self._condition(device_s, walls, values)
+            rows = []
+            for t, wall, row in zip(device_s, walls, values.tolist()):
+                if t is None:
+                    rows.append([f"{wall:.6f}", "", *row])
+                else:
+                    stamp = self.clock.to_host(t) if self.clock.valid else wall
+                    rows.append([f"{stamp:.6f}", f"{t:.6f}", *row])
+            self.writer.writerows(rows)
+
+    def _condition(self, device_s: list, walls: list, values: np.ndarray) -> tuple:
+        if self.conditioner is None:
+            self.conditioner = SignalConditioner(values.shape[1], *self.conditioning)
+        # Unwrapped device time, so a wrap does not look like a restart to the resampler.
+        source = None if None in device_s else np.array(device_s) * 1000.0
+        times, conditioned, raw = self.conditioner.process(source, values)
+        if times is not None and not np.array_equal(times, source):
+            # Resampled rows get the arrival time interpolated between their neighbours.
+            walls = np.interp(times / 1000.0, device_s, walls).tolist()
+            device_s = (times / 1000.0).tolist()
+        return device_s, walls, np.hstack((conditioned, raw))
+
+    def mark_gap(self) -> None:
+        with self.lock:
+            if self.writer:
+                width = len(self.header()) - 2
+                self.writer.writerow([f"{time.time():.6f}", ""] + ["nan"] * width)
+
+
+class LineRecorder(threading.Thread):
+    # In-process recording: the reader thread hands over every complete line with its
+    # arrival time, ahead of the display queue, so overload policies only cost plot samples.
+
+    def __init__(self, schema: ChannelSchema, on_event) -> None:
+        super().__init__(name="recorder", daemon=True)
+        self.codec = Codec(schema)
+        self.csv = CsvRecorder(schema, on_event)
+        self.queue = queue.SimpleQueue()
+
+    def open(self, filepath: str, append: bool = False) -> None:
+        self.csv.open(filepath, append)
+
+    @property
+    def path(self) -> str:
+        return self.csv.path
+
+    def set_conditioning(self, settings: tuple | None) -> None:
+        self.csv.set_conditioning(settings)
+
+    def submit(self, lines: list[str], arrived: float) -> None:
+        self.queue.put((lines, arrived))
+
+    def mark_gap(self) -> None:
+        self.queue.put((None, None))
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        if self.is_alive():
+            self.join(timeout=2.0)
+        self.csv.close()
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            lines, arrived = item
+            if lines is None:
+                self.csv.mark_gap()
+                continue
+            blocks = []
+            for line in lines:
+                message = self.codec.decode(line)
+                kind = type(message)
+                schema = self.codec.schema
+                width = SampleRing.VALUES + schema.width
+                if kind is Batch and message.block is not None:
+                    blocks.append(_ring_rows(message.block, schema, arrived, message, width))
+                elif kind is Sample:
+                    blocks.append(
+                        _ring_rows(message.row[None, :], message.schema, arrived, None, width)
+                    )
+                elif kind is SchemaAnnounce:
+                    # Rows decoded under the old schema go to the old file.
+                    if blocks:
+                        self.csv.write(np.concatenate(blocks))
+                        blocks = []
+                    self.codec.schema = message.schema
+                    self.csv.apply_schema(message.schema)
+            if blocks:
+                self.csv.write(np.concatenate(blocks))
+
+
+class AcquisitionWorker:
+    # Runs in the acquisition process: owns the port, parses and records every sample,
+    # and publishes them to the ring. Status lines go back to the GUI over a pipe.
+
+    def __init__(self, port, ring: SampleRing, events) -> None:
+        self.port = port
+        self.ring = ring
+        self.events = events
+        self.events_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.codec = Codec()
+        # Bumped on every schema change and stamped on each ring row; see AcquisitionProcess.
+        self.schema_gen = 0
+        self.recorder = CsvRecorder(self.codec.schema, self.send)
+
+    def send(self, kind: str, detail) -> None:
+        with self.events_lock:
+            try:
+                self.events.send((kind, detail))
+            except (OSError, ValueError):
+                self.stop_event.set()
+
+    def serve_commands(self, commands) -> None:
+        while not self.stop_event.is_set():
+            try:
+                command, arg = commands.recv()
+            except (EOFError, OSError):
+                command, arg = "close", None
+            if command == "write":
+                try:
+                    self.port.write(arg)
+                except (serial.SerialException, OSError) as exc:
+                    self.send("log", f"ERR: serial write failed: {exc}")
+            elif command == "record":
+                try:
+                    self.recorder.open(*arg)
+                except OSError as exc:
+                    self.send("log", f"ERR: failed to open CSV: {exc}")
+            elif command == "stop_record":
+                self.recorder.close()
+            elif command == "condition":
+                self.recorder.set_conditioning(arg)
+            elif command == "close":
+                self.stop_event.set()
+
+    def run(self) -> None:
+        partial = ""
+        discarding = False
+        while not self.stop_event.is_set():
+            try:
+                data = self.port.read(self.port.in_waiting or 1)
+            except (serial.SerialException, OSError) as exc:
+                self.recorder.mark_gap()
+                self.send("lost", str(exc))
+                break
+            if not data:
+                continue
+            arrived = time.time()
+            text = partial + data.decode("utf-8", errors="replace")
+            if discarding:
+                # The rest of an over-long line: drop it up to its newline.
+                _, newline, text = text.partition("\n")
+                discarding = not newline
+            body, _, partial = text.rpartition("\n")
+            if len(partial) > 65536:
+                # No device line is this long; keeping a tail would decode as garbage.
+                partial = ""
+                discarding = True
+            if not body:
+                continue
+            lines = [line.strip() for line in body.split("\n")]
+            self._handle_lines([line for line in lines if line], arrived)
+        self.recorder.close()
+        self.port.close()
+
+    def _handle_lines(self, lines: list[str], arrived: float) -> None:
+        blocks = []
+        status = []
+        for line in lines:
+            message = self.codec.decode(line)
+            kind = type(message)
+            # Rows carry every channel for the recorder; the ring keeps what fits.
+            width = max(self.ring.width, SampleRing.VALUES + self.codec.schema.width)
+            if kind is Batch and message.block is not None:
+                blocks.append(
+                    _ring_rows(
+                        message.block, self.codec.schema, arrived, message, width,
+                        self.schema_gen,
+                    )
+                )
+            elif kind is Sample:
+                blocks.append(
+                    _ring_rows(
+                        message.row[None, :], message.schema, arrived, None, width,
+                        self.schema_gen,
+                    )
+                )
+            else:
+                if kind is SchemaAnnounce:
+                    # Rows decoded under the old schema go out at the old width and file.
+                    self._publish(blocks)
+                    blocks = []
+                    self._apply_schema(message.schema)
+                # Bad or truncated batches go to the GUI too, which counts them for link stats.
+                status.append(line)
+        if status:
+            # Sent before the rows so a schema change reaches the GUI ahead of its samples.
+            self.send("lines", status)
+        self._publish(blocks)
+
+    def _publish(self, blocks: list) -> None:
+        if not blocks:
+            return
+        block = np.concatenate(blocks)
+        self.ring.write(block[:, : self.ring.width])
+        self.recorder.write(block)
+
+    def _apply_schema(self, schema: ChannelSchema) -> None:
+        if schema.describe() == self.codec.schema.describe():
+            return
+        self.codec.schema = schema
+        self.schema_gen += 1
+        # Goes out before any row stamped with the new generation reaches the ring.
+        self.send("schema", (self.schema_gen, schema.describe()))
+        self.recorder.apply_schema(schema)
+        room = self.ring.width - SampleRing.VALUES
+        channels = 2 + len(schema.extra_indices)
+        if channels > room:
+            self.send(
+                "log",
+                f"ERR: schema has {channels} channels but the acquisition ring holds {room}; "
+                f"channels past the first {room} are recorded but not displayed",
+            )
+
+
+def _acquisition_main(
+    port_name: str, baud: int, ring_name: str, rows: int, width: int, commands, events
+) -> None:
+    ring = SampleRing.attach(ring_name, rows, width)
+    try:
+        port = serial.Serial(port_name, baudrate=baud, timeout=0.05)
+    except serial.SerialException as exc:
+        events.send(("error", str(exc)))
+        ring.close()
+        return
+    worker = AcquisitionWorker(port, ring, events)
+    worker.send("opened", None)
+    threading.Thread(target=worker.serve_commands, args=(commands,), daemon=True).start()
+    worker.run()
+    ring.close()
+
+
+class AcquisitionProcess:
+    # Stands in for the serial.Serial object when a child process owns the port.
+    RING_ROWS = 1 << 18
+    RING_WIDTH = 20
+    OPEN_TIMEOUT_S = 10.0
+
+    def __init__(self, port_name: str, baud: int) -> None:
+        self.port = port_name
+        self.ring = SampleRing.create(self.RING_ROWS, self.RING_WIDTH)
+        self.opened = False
+        # Schema per ring generation, filled from the event pipe; the worker starts on the default.
+        self.schemas = {0: DEFAULT_SCHEMA}
+        self.applied_gen = 0
+        # spawn: forking a process that runs Tk and several threads is not safe.
+        context = multiprocessing.get_context("spawn")
+        command_reader, self.commands = context.Pipe(duplex=False)
+        self.events, event_writer = context.Pipe(duplex=False)
+        self.send_lock = threading.Lock()
+        self.process = context.Process(
+            target=_acquisition_main,
+            args=(
+                port_name,
+                baud,
+                self.ring.shm.name,
+                self.RING_ROWS,
+                self.RING_WIDTH,
+                command_reader,
+                event_writer,
+            ),
+            name=f"acquisition {port_name}",
+            daemon=True,
+        )
+        self.process.start()
+        command_reader.close()
+        event_writer.close()
+
+    @property
+    def is_open(self) -> bool:
+        return self.process.is_alive()
+
+    def _send(self, command: str, arg=None) -> None:
+        with self.send_lock:
+            try:
+                self.commands.send((command, arg))
+            except (OSError, ValueError) as exc:
+                raise serial.SerialException(f"acquisition process gone: {exc}")
+
+    def write(self, data: bytes) -> None:
+        self._send("write", data)
+
+    def record(self, filepath: str, append: bool = False) -> None:
+        self._send("record", (filepath, append))
+
+    def stop_record(self) -> None:
+        self._send("stop_record")
+
+    def condition(self, settings: tuple | None) -> None:
+        self._send("condition", settings)
+
+    def close(self) -> None:
+        try:
+            self._send("close")
+        except serial.SerialException:
+            pass
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1.0)
+        self.commands.close()
+        self.events.close()
+        self.ring.close()
+        self.ring.shm.unlink()
+
+
+# Telemetry frames: <u8 kind><u32 payload bytes><payload>, little-endian.
+TELEMETRY_SAMPLES = 1  # <u16 columns><u32 rows>, then rows of f64 in TELEMETRY_SCHEMA order
+TELEMETRY_STATUS = 2  # UTF-8 status line received from the device
+TELEMETRY_SCHEMA = 3  # UTF-8 comma-separated column names; sent on connect and on change
+TELEMETRY_GAP = 4  # <u32 frames this subscriber missed because it fell behind
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _telemetry_frame(kind: int, payload: bytes) -> bytes:
+    return struct.pack("<BI", kind, len(payload)) + payload
+
+
+def _telemetry_samples(rows: np.ndarray) -> bytes:
+    body = struct.pack("<HI", rows.shape[1], rows.shape[0]) + rows.astype("<f8").tobytes()
+    return _telemetry_frame(TELEMETRY_SAMPLES, body)
+
+
+def _ws_header(length: int) -> bytes:
+    # Unmasked binary frame, server to client.
+    if length < 126:
+        return struct.pack("!BB", 0x82, length)
+    if length < 1 << 16:
+        return struct.pack("!BBH", 0x82, 126, length)
+    return struct.pack("!BBQ", 0x82, 127, length)
+
+
+def _local_listener(address: str) -> socket.socket:
+    # "host:port" listens on TCP; anything else is a Unix socket path.
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host or "127.0.0.1", int(port)))
+    else:
+        if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+            # Left behind by an earlier run that did not shut down cleanly.
+            os.unlink(address)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(address)
+    sock.listen(16)
+    sock.setblocking(False)
+    return sock
+
+
+class TelemetryClient:
+    def __init__(self, sock: socket.socket, websocket: bool) -> None:
+        self.sock = sock
+        self.websocket = websocket
+        self.ready = not websocket
+        self.request = b""
+        # Frames are shared with every other client; only the send offset is per client.
+        self.queue = deque()
+        self.bytes = 0
+        self.dropped = 0
+        self.dropped_total = 0
+
+    def enqueue(self, frame: bytes, limit: int) -> bool:
+        if self.bytes + len(frame) > limit:
+            self.dropped += 1
+            self.dropped_total += 1
+            return False
+        if self.websocket:
+            self._push(_ws_header(len(frame)))
+        self._push(memoryview(frame))
+        return True
+
+    def _push(self, data) -> None:
+        self.queue.append(data)
+        self.bytes += len(data)
+
+    def flush(self) -> None:
+        while self.queue:
+            head = self.queue[0]
+            sent = self.sock.send(head)
+            self.bytes -= sent
+            if sent < len(head):
+                self.queue[0] = memoryview(head)[sent:]
+                return
+            self.queue.popleft()
+        if self.dropped:
+            # Tell the subscriber where its stream has a hole once it has caught up.
+            self.enqueue(_telemetry_frame(TELEMETRY_GAP, struct.pack("<I", self.dropped)), 1 << 30)
+            self.dropped = 0
+
+    def handshake(self, data: bytes) -> bool | None:
+        # WebSocket upgrade; None while the request is incomplete, False if it is not one.
+        self.request += data
+        if b"\r\n\r\n" not in self.request:
+            return None if len(self.request) < 8192 else False
+        key = None
+        for line in self.request.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"sec-websocket-key":
+                key = value.strip().decode("ascii", errors="replace")
+        if key is None:
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest())
+        self._push(
+            b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+        )
+        self.ready = True
+        return True
+
+
+class TelemetryServer(threading.Thread):
+    # Rebroadcasts sample blocks and status lines to local subscribers. publish() only
+    # appends to a deque, so nothing a subscriber does can block the caller.
+    CLIENT_LIMIT_BYTES = 1 << 20
+
+    def __init__(self, address: str, websocket: bool = False) -> None:
+        super().__init__(name="telemetry", daemon=True)
+        self.address = address
+        self.websocket = websocket
+        self.listener = _local_listener(address)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+        self.pending = deque()
+        self.clients = {}
+        self.schema_frame = _telemetry_frame(TELEMETRY_SCHEMA, b"")
+        self.frames = 0
+        self.stop_event = threading.Event()
+
+    def publish(self, frame: bytes) -> None:
+        self.pending.append(frame)
+        try:
+            self.wake_w.send(b"\x00")
+        except OSError:
+            # Socket buffer full means a wake-up is already outstanding.
+            pass
+
+    def set_columns(self, names: list[str]) -> None:
+        self.schema_frame = _telemetry_frame(TELEMETRY_SCHEMA, ",".join(names).encode("utf-8"))
+        self.publish(self.schema_frame)
+
+    def stats(self) -> dict:
+        clients = list(self.clients.values())
+        return {
+            "clients": len(clients),
+            "frames": self.frames,
+            "dropped": sum(client.dropped_total for client in clients),
+            "queued_bytes": sum(client.bytes for client in clients),
+        }
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            for key, events in self.selector.select(0.5):
+                if key.fileobj is self.listener:
+                    self._accept()
+                elif key.fileobj is self.wake_r:
+                    self._distribute()
+                else:
+                    self._service(key.data, events)
+        for client in list(self.clients.values()):
+            self._drop(client)
+        self.selector.close()
+        self.listener.close()
+        self.wake_r.close()
+        self.wake_w.close()
+        if self.listener.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.publish(b"")
+
+    def _accept(self) -> None:
+        try:
+            sock, _ = self.listener.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        client = TelemetryClient(sock, self.websocket)
+        self.clients[sock] = client
+        if client.ready:
+            client.enqueue(self.schema_frame, self.CLIENT_LIMIT_BYTES)
+        self.selector.register(sock, self._interest(client), client)
+
+    def _interest(self, client: TelemetryClient) -> int:
+        return selectors.EVENT_READ | (selectors.EVENT_WRITE if client.queue else 0)
+
+    def _distribute(self) -> None:
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except OSError:
+            pass
+        while self.pending:
+            frame = self.pending.popleft()
+            if not frame:
+                continue
+            self.frames += 1
+            for client in self.clients.values():
+                if client.ready:
+                    client.enqueue(frame, self.CLIENT_LIMIT_BYTES)
+        for client in list(self.clients.values()):
+            self._flush(client)
+
+    def _service(self, client: TelemetryClient, events: int) -> None:
+        if events & selectors.EVENT_READ:
+            try:
+                data = client.sock.recv(4096)
+            except OSError:
+                data = b""
+            if not data:
+                self._drop(client)
+                return
+            if not client.ready:
+                result = client.handshake(data)
+                if result is False:
+                    self._drop(client)
+                    return
+                if result:
+                    client.enqueue(self.schema_frame, self.CLIENT_LIMIT_BYTES)
+            # Anything else a subscriber sends (WebSocket pings included) is ignored.
+        self._flush(client)
+
+    def _flush(self, client: TelemetryClient) -> None:
+        if client.sock not in self.clients:
+            return
+        try:
+            client.flush()
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(client)
+            return
+        self.selector.modify(client.sock, self._interest(client), client)
+
+    def _drop(self, client: TelemetryClient) -> None:
+        self.clients.pop(client.sock, None)
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+
+class RpcServer(threading.Thread):
+    # Newline-delimited JSON-RPC 2.0 on a local socket. Each request line (or batch array)
+    # goes to dispatch with a reply callback; replies may come from any thread.
+    def __init__(self, address: str, dispatch) -> None:
+        super().__init__(name="rpc", daemon=True)
+        self.address = address
+        self.dispatch = dispatch
+        self.listener = _local_listener(address)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+        self.replies = deque()
+        # socket -> [unparsed input, unsent output]
+        self.connections = {}
+        self.calls = 0
+        self.stop_event = threading.Event()
+
+    def reply(self, sock: socket.socket, text: str) -> None:
+        self.replies.append((sock, text.encode("utf-8") + b"\n"))
+        try:
+            self.wake_w.send(b"\x00")
+        except OSError:
+            pass
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        try:
+            self.wake_w.send(b"\x00")
+        except OSError:
+            pass
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            for key, events in self.selector.select(0.5):
+                if key.fileobj is self.listener:
+                    self._accept()
+                elif key.fileobj is self.wake_r:
+                    self._send_replies()
+                else:
+                    self._service(key.fileobj, events)
+        for sock in list(self.connections):
+            self._drop(sock)
+        self.selector.close()
+        self.listener.close()
+        self.wake_r.close()
+        self.wake_w.close()
+        if self.listener.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _accept(self) -> None:
+        try:
+            sock, _ = self.listener.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        if sock.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections[sock] = [bytearray(), bytearray()]
+        self.selector.register(sock, selectors.EVENT_READ)
+
+    def _send_replies(self) -> None:
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except OSError:
+            pass
+        while self.replies:
+            sock, data = self.replies.popleft()
+            if sock in self.connections:
+                self.connections[sock][1] += data
+                self._flush(sock)
+
+    def _service(self, sock: socket.socket, events: int) -> None:
+        if events & selectors.EVENT_READ:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                self._drop(sock)
+                return
+            buffer = self.connections[sock][0]
+            buffer += data
+            if b"\n" in buffer:
+                *lines, rest = bytes(buffer).split(b"\n")
+                buffer[:] = rest
+                for line in lines:
+                    self._handle(sock, line)
+        self._flush(sock)
+
+    def _handle(self, sock: socket.socket, line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            payload = json.loads(line)
+        except ValueError as exc:
+            self.reply(sock, json.dumps(_rpc_error(None, -32700, f"parse error: {exc}")))
+            return
+        self.calls += len(payload) if isinstance(payload, list) else 1
+        self.dispatch(payload, lambda text: self.reply(sock, text))
+
+    def _flush(self, sock: socket.socket) -> None:
+        connection = self.connections.get(sock)
+        if connection is None:
+            return
+        out = connection[1]
+        try:
+            while out:
+                sent = sock.send(out)
+                del out[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(sock)
+            return
+        interest = selectors.EVENT_READ | (selectors.EVENT_WRITE if out else 0)
+        self.selector.modify(sock, interest)
+
+    def _drop(self, sock: socket.socket) -> None:
+        self.connections.pop(sock, None)
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
+
+
+def _rpc_error(request_id, code: int, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+class GuiLink(SampleTap):
+    # Experiment link over the GUI's own connection. Commands run on the Tk thread; samples
+    # arrive through feed() from _ingest_samples/_on_sample.
+    def __init__(self, app) -> None:
+        super().__init__()
+        self.app = app
+
+    @property
+    def error(self) -> str | None:
+        port = self.app.serial_port
+        return None if port is not None and port.is_open else "not connected"
+
+    def send(self, message) -> None:
+        self.app.ui_events.put((self.app._experiment_send, (message,)))
+        self.app._notify_rx()
+
+    def respond(self, kind: str, values: tuple, duration: float | None, capture) -> None:
+        self.app.ui_events.put((self._respond, (kind, values, duration, capture)))
+        self.app._notify_rx()
+
+    def _respond(self, kind: str, values: tuple, duration: float | None, capture) -> None:
+        self.mark(capture)
+        self.app._experiment_respond(kind, values, duration)
+
+
+class ClockModel:
+    WRAP_MS = 2.0 ** 32
+    # A backward jump larger than this is a wrap or a reset, not reordering.
+    JUMP_MS = 1000.0
+    WINDOW_S = 1.0
+    MAX_POINTS = 120
+
+    def __init__(self) -> None:
+        self.epoch_ms = 0.0
+        self.last_raw_ms = None
+        self.wraps = 0
+        self.resets = 0
+        self.points = deque(maxlen=self.MAX_POINTS)
+        self.window_start = None
+        self.window_best = None
+        self.reference_s = 0.0
+        self.offset_s = None
+        self.drift = 0.0
+        self.residual_ms = None
+
+    def unwrap(self, raw_ms: float, host_s: float | None = None) -> float:
+        if self.last_raw_ms is not None and raw_ms < self.last_raw_ms - self.JUMP_MS:
+            if self.last_raw_ms > 0.75 * self.WRAP_MS and raw_ms < 0.25 * self.WRAP_MS:
+                self.wraps += 1
+                self.epoch_ms += self.WRAP_MS
+            else:
+                # Device restarted its clock: continue the timebase from where host time says it is.
+                self.resets += 1
+                if self.offset_s is not None and host_s is not None:
+                    continued_ms = self.to_device(host_s) * 1000.0
+                else:
+                    continued_ms = self.last_raw_ms + self.epoch_ms
+                self.epoch_ms = continued_ms - raw_ms
+                self.points.clear()
+                self.window_start = None
+                self.window_best = None
+        self.last_raw_ms = raw_ms
+        return (raw_ms + self.epoch_ms) / 1000.0
+
+    def observe(self, device_s: float, host_s: float) -> None:
+        # Arrival = send time + non-negative delay, so the per-window minimum tracks the clock.
+        delta = host_s - device_s
+        if self.window_start is None or device_s - self.window_start >= self.WINDOW_S:
+            if self.window_best is not None:
+                self.points.append(self.window_best)
+                self._fit()
+            self.window_start = device_s
+            self.window_best = None
+        if self.window_best is None or delta < self.window_best[1]:
+            self.window_best = (device_s, delta)
+        if self.offset_s is None or len(self.points) < 3:
+            best = min([delta] + [point[1] for point in self.points])
+            self.reference_s = device_s
+            self.offset_s = best if self.offset_s is None else min(self.offset_s, best)
+
+    def _fit(self) -> None:
+        if len(self.points) < 3:
+            return
+        data = np.asarray(self.points)
+        reference = data[-1, 0]
+        x = data[:, 0] - reference
+        y = data[:, 1]
+        keep = np.ones(len(x), dtype=bool)
+        for _ in range(2):
+            slope, intercept = np.polyfit(x[keep], y[keep], 1)
+            residuals = y - (intercept + slope * x)
+            mad = np.median(np.abs(residuals[keep] - np.median(residuals[keep])))
+            new_keep = np.abs(residuals) <= max(3.0 * 1.4826 * mad, 1e-4)
+            if new_keep.sum() < 3 or np.array_equal(new_keep, keep):
+                break
+            keep = new_keep
+        self.reference_s = float(reference)
+        self.offset_s = float(intercept)
+        self.drift = float(slope)
+        self.residual_ms = float(np.sqrt(np.mean(residuals[keep] ** 2)) * 1000.0)
+
+    @property
+    def valid(self) -> bool:
+        return self.offset_s is not None
+
+    def to_host(self, device_s: float) -> float:
+        return device_s + self.offset_s + self.drift * (device_s - self.reference_s)
+
+    def to_device(self, host_s: float) -> float:
+        return (host_s - self.offset_s + self.drift * self.reference_s) / (1.0 + self.drift)
+
+    def summary(self) -> str:
+        if not self.valid:
+            return "Clock: --"
+        residual = f"{self.residual_ms:.3f}" if self.residual_ms is not None else "--"
+        return (
+            f"Clock: drift {self.drift * 1e6:+.1f} ppm, fit residual {residual} ms, "
+            f"{len(self.points)} points, {self.wraps} wraps, {self.resets} resets"
+        )
+
+
+class LinkMonitor:
+    WRAP_MS = ClockModel.WRAP_MS
+    # Backward jumps larger than this are device resets, not reordered batches.
+    RESET_MS = 1000.0
+    RECENT = 256
+    JITTER_EDGES_MS = np.array([0.0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, np.inf])
+    COUNTERS = (
+        "batches", "samples", "lost", "duplicated", "reordered", "truncated", "malformed", "resets",
+    )
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.next_ms = None
+        self.recent_t0 = deque(maxlen=self.RECENT)
+        self.recent_dt = deque(maxlen=self.RECENT)
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.jitter_counts = np.zeros(len(self.JITTER_EDGES_MS) - 1, dtype=np.int64)
+        self.max_jitter_ms = 0.0
+
+    def observe(self, t0_ms, dt_ms, counts) -> None:
+        t0 = np.asarray(t0_ms, dtype=float)
+        dt = np.asarray(dt_ms, dtype=float)
+        counts = np.asarray(counts, dtype=np.int64)
+        while len(t0):
+            split = self._observe_segment(t0, dt, counts)
+            if split is None:
+                break
+            # Device reset: restart continuity at the first batch of the new timebase.
+            self.resets += 1
+            self.next_ms = None
+            self.recent_t0.clear()
+            t0, dt, counts = t0[split:], dt[split:], counts[split:]
+
+    def _observe_segment(self, t0: np.ndarray, dt: np.ndarray, counts: np.ndarray) -> int | None:
+        base = t0[0] if self.next_ms is None else self.next_ms
+        half = self.WRAP_MS / 2.0
+        rel = (t0 - base + half) % self.WRAP_MS - half
+        ends = rel + counts * dt
+        expected = np.maximum.accumulate(np.concatenate(([0.0], ends[:-1])))
+        gap = rel - expected
+        # Resets first: a restarted device repeats timestamps that are still in recent_t0.
+        reset = gap < -self.RESET_MS
+        split = int(np.argmax(reset)) if reset.any() else None
+        if split is not None:
+            if not split:
+                return split
+            t0, dt, counts, rel, ends, expected, gap = (
+                t0[:split], dt[:split], counts[:split], rel[:split], ends[:split],
+                expected[:split], gap[:split],
+            )
+        duplicate = np.isin(t0, np.fromiter(self.recent_t0, dtype=float))
+        _, first = np.unique(t0, return_index=True)
+        repeated = np.ones(len(t0), dtype=bool)
+        repeated[first] = False
+        duplicate |= repeated
+        tol = 0.5 * np.maximum(dt, 1e-6)
+        forward = ~duplicate & (gap > tol)
+        backward = ~duplicate & (gap < -tol)
+        contiguous = ~duplicate & ~forward & ~backward
+        self.batches += len(t0)
+        self.samples += int(counts[~duplicate].sum())
+        self.lost += int(np.rint(gap[forward] / dt[forward]).sum())
+        self.duplicated += int(counts[duplicate].sum())
+        # A late batch fills a hole that was already counted as lost.
+        late = int(counts[backward].sum())
+        self.reordered += late
+        self.lost = max(0, self.lost - late)
+        self.recent_dt.extend(dt[~duplicate].tolist())
+        if self.recent_dt:
+            nominal = float(np.median(np.fromiter(self.recent_dt, dtype=float)))
+            jitter = np.abs(np.concatenate((dt[~duplicate] - nominal, gap[contiguous])))
+            if len(jitter):
+                self.jitter_counts += np.histogram(jitter, bins=self.JITTER_EDGES_MS)[0]
+                self.max_jitter_ms = max(self.max_jitter_ms, float(jitter.max()))
+        self.recent_t0.extend(t0.tolist())
+        self.next_ms = float((base + max(expected[-1], ends[-1])) % self.WRAP_MS)
+        return split
+
+    def snapshot(self) -> dict:
+        data = {name: getattr(self, name) for name in self.COUNTERS}
+        data["jitter_counts"] = self.jitter_counts.copy()
+        return data
+
+    def jitter_percentile(self, pct: float, counts: np.ndarray | None = None) -> float | None:
+        counts = self.jitter_counts if counts is None else counts
+        total = int(counts.sum())
+        if not total:
+            return None
+        index = int(np.searchsorted(np.cumsum(counts), pct / 100.0 * total))
+        return min(float(self.JITTER_EDGES_MS[index + 1]), self.max_jitter_ms)
+
+    def summary(self, since: dict | None = None) -> str:
+        current = self.snapshot()
+        if since is not None:
+            for name in self.COUNTERS:
+                current[name] -= since[name]
+            current["jitter_counts"] = current["jitter_counts"] - since["jitter_counts"]
+        if not current["batches"]:
+            return "Link: --"
+        expected = current["samples"] + current["lost"]
+        loss = 100.0 * current["lost"] / expected if expected else 0.0
+        p99 = self.jitter_percentile(99.0, current["jitter_counts"])
+        jitter = f"{p99:.3f}" if p99 is not None else "--"
+        return (
+            f"Link: {current['samples']} samples, {current['lost']} lost ({loss:.2f}%), "
+            f"{current['duplicated']} dup, {current['reordered']} reordered, "
+            f"{current['truncated']} truncated, {current['malformed']} malformed, "
+            f"{current['resets']} resets, dt jitter p99 {jitter} ms"
+        )
+
+
+class TimingRing:
+    # Recent values for percentiles; count/total/max cover the whole session.
+    CAPACITY = 4096
+
+    def __init__(self, unit: str = "ms") -> None:
+        self.unit = unit
+        self.values = np.zeros(self.CAPACITY)
+        self.reset()
+
+    def reset(self) -> None:
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.CAPACITY
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentiles(self, pcts: list[float]) -> list[float] | None:
+        filled = min(self.count, self.CAPACITY)
+        if not filled:
+            return None
+        return np.percentile(self.values[:filled], pcts).tolist()
+
+
+class PerfMonitor:
+    RATE_WINDOW_S = 2.0
+    FIELDS = ["metric", "unit", "rate_per_s", "count", "mean", "p50", "p90", "p99", "max"]
+
+    def __init__(self) -> None:
+        self.counters = {}
+        self.timers = {}
+        self.history = deque()
+        self.rates = {}
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add(self, name: str, value: float, unit: str = "ms") -> None:
+        ring = self.timers.get(name)
+        if ring is None:
+            ring = self.timers[name] = TimingRing(unit)
+        ring.add(value)
+
+    def tick(self, now: float) -> None:
+        self.history.append((now, dict(self.counters)))
+        while len(self.history) > 2 and now - self.history[1][0] >= self.RATE_WINDOW_S:
+            self.history.popleft()
+        start, first = self.history[0]
+        span = now - start
+        if span > 0:
+            self.rates = {
+                name: (total - first.get(name, 0)) / span for name, total in self.counters.items()
+            }
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.timers.clear()
+        self.history.clear()
+        self.rates = {}
+
+    def rows(self) -> list[dict]:
+        rows = []
+        for name in sorted(self.counters):
+            rows.append({
+                "metric": name,
+                "unit": "count",
+                "rate_per_s": self.rates.get(name),
+                "count": self.counters[name],
+            })
+        for name in sorted(self.timers):
+            ring = self.timers[name]
+            pcts = ring.percentiles([50, 90, 99]) or [None] * 3
+            rows.append({
+                "metric": name,
+                "unit": ring.unit,
+                "count": ring.count,
+                "mean": ring.total / ring.count if ring.count else None,
+                "p50": pcts[0],
+                "p90": pcts[1],
+                "p99": pcts[2],
+                "max": ring.max,
+            })
+        for row in rows:
+            for field in self.FIELDS:
+                row.setdefault(field, None)
+        return rows
+
+
+def _time_canvas_draws(canvas, on_draw) -> None:
+    # draw_idle() defers to canvas.draw(); wrapping it times the actual render.
+    draw = canvas.draw
+
+    def timed_draw() -> None:
+        start = time.perf_counter()
+        draw()
+        on_draw((time.perf_counter() - start) * 1000.0)
+
+    canvas.draw = timed_draw
+
+
+class SamplingProfiler(threading.Thread):
+    INTERVAL_S = 0.005
+
+    def __init__(self, duration_s: float, on_done) -> None:
+        super().__init__(name="sampling-profiler", daemon=True)
+        self.duration_s = duration_s
+        self.on_done = on_done
+        self.stop_event = threading.Event()
+        self.counts = {}
+        self.samples = 0
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        end = time.monotonic() + self.duration_s
+        while time.monotonic() < end and not self.stop_event.wait(self.INTERVAL_S):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, stack_frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while stack_frame is not None:
+                    code = stack_frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    stack_frame = stack_frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+        self.on_done()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def write_collapsed(self, filepath: str) -> None:
+        # One "frame;frame;frame count" line per stack, as consumed by flamegraph tools.
+        with open(filepath, "w", encoding="utf-8") as f:
+            for key, count in sorted(self.counts.items()):
+                f.write(f"{key} {count}\n")
+
+
+class StallDetector(threading.Thread):
+    def __init__(self, thread_ident: int, period_s: float, threshold_s: float, on_stall) -> None:
+        super().__init__(name="stall-detector", daemon=True)
+        self.thread_ident = thread_ident
+        self.period_s = period_s
+        self.threshold_s = threshold_s
+        self.on_stall = on_stall
+        self.stop_event = threading.Event()
+        self.last_beat = time.monotonic()
+        self.reported = False
+
+    def beat(self) -> None:
+        self.last_beat = time.monotonic()
+        self.reported = False
+
+    def run(self) -> None:
+        while not self.stop_event.wait(max(self.threshold_s / 4.0, 0.01)):
+            # The watched loop beats once per period; anything beyond that is blocked time.
+            blocked = time.monotonic() - self.last_beat - self.period_s
+            if blocked <= self.threshold_s or self.reported:
+                continue
+            self.reported = True
+            frame = sys._current_frames().get(self.thread_ident)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.on_stall(blocked, stack)
+
+    def stop(self) -> None:
+        self.stop_event.set()
 
 
 class CdcGuiApp:
     RX_RATE_HZ = 50.0
+    PROBE_TIMEOUT_S = 0.5
+    LOG_WIDGET_LINES = 2000
+    RECONNECT_BASE_S = 0.25
+    RECONNECT_MAX_S = 10.0
+    MIN_REDRAW_S = 0.03
     def __init__(self, root: tk.Tk) -> None:
         self.root = root
         self.root.title("PID Tuner")
@@ -23,16 +3049,25 @@ class CdcGuiApp:
         self.root.minsize(800, 600)
 
         self.serial_port = None
+        self.acquisition = None
+        self.record_path = None
         self.reader_thread = None
         self.stop_event = threading.Event()
-        self.rx_queue = queue.Queue()
-        self.rx_buffer = ""
+        self.rx_queue = RxBuffer()
+        self.ui_events = queue.Queue()
+        self.tx_lock = threading.Lock()
         self.last_rx_line = None
         self.last_rx_pair = None
+        self.rx_pair = None
+        self.log_ring = LogRing()
 
         self.plot_times = deque(maxlen=300)
         self.plot_target = deque(maxlen=300)
         self.plot_actual = deque(maxlen=300)
+        self.raw_times = deque(maxlen=300)
+        self.raw_actual = deque(maxlen=300)
+        self.raw_line = None
+        self.conditioner = None
         self.actual_history = deque()
         self.plot_index = 0
         self.last_device_time = None
@@ -61,6 +3096,10 @@ class CdcGuiApp:
         self.response_cursor_active = None
         self.response_cursor_dragging = None
         self.response_metrics_var = tk.StringVar(value="Cursors: --")
+        self.response_baseline_var = tk.StringVar(value="")
+        self.response_references = []
+        self.response_reference_tree = None
+        self.response_baseline_combo = None
         self.response_seq = 0
         self.response_plot_times = deque()
         self.response_plot_target = deque()
@@ -69,106 +3108,692 @@ class CdcGuiApp:
         self.response_plot_axes = None
         self.response_plot_target_line = None
         self.response_plot_actual_line = None
+        self.profile_streamer = None
+        self.profile_csv_path = None
+        self.profile_period = None
+        self.profile_sample_time_s = None
+        self.profile_count = None
+        self.frf_window = None
+        self.frf_result = None
+        self.trigger = TriggerEngine()
+        self.codec = Codec()
+        self.rx_handlers = {
+            PidStatus: self._on_pid_status,
+            TuneStatus: self._on_tune_status,
+            ProfileStatus: self._on_profile_status,
+            SchemaAnnounce: self._on_schema,
+            BadSchema: self._on_bad_schema,
+            Batch: self._on_batch,
+            BadBatch: self._on_bad_batch,
+            Sample: self._on_sample,
+        }
+        self.rpc_methods = {
+            "ping": self._rpc_ping,
+            "get_status": self._rpc_get_status,
+            "get_metrics": self._rpc_get_metrics,
+            "get_pid": self._send_get_pid,
+            "set_gains": self._rpc_set_gains,
+            "set_sample_time": self._rpc_set_sample_time,
+            "tune": self._rpc_tune,
+            "stop_tune": self._send_tune_stop,
+            "setpoint": self._rpc_setpoint,
+            "step": self._rpc_step,
+            "ramp": self._rpc_ramp,
+            "accel": self._rpc_accel,
+            "sine": self._rpc_sine,
+            "open_response": self._rpc_open_response,
+            "estop": self._send_estop,
+            "start_recording": self._rpc_start_recording,
+            "stop_recording": self._stop_recording,
+            "run_experiment": self._rpc_run_experiment,
+            "abort_experiment": self._abort_experiment,
+        }
+        self.extra_ring = ChannelRing(300, 0)
+        self.extra_lines = {}
+        self.figure = None
+        self.axes = None
+        self.canvas = None
+        self.target_line = None
+        self.actual_line = None
+        self.extra_axes = None
+        self.channel_visible_vars = {}
+        self.response_plot_extras = deque()
+        self.sessions = {}
+        self.group_writer = None
+        self.event_driven = False
+        self.plot_dirty = False
+        self.last_redraw = 0.0
+        self.wake_pending = threading.Event()
+        self.wake_pipe = None
+        self.tx_writer = None
+        self.tx_stats_var = tk.StringVar(value="TX: --")
+        self.clock = ClockModel()
+        self.clock_var = tk.StringVar(value="Clock: --")
+        self.link = LinkMonitor()
+        self.link_var = tk.StringVar(value="Link: --")
+        self.link_headers = []
+        self.link_record_mark = None
+        self.perf = PerfMonitor()
+        self.perf_bytes_mark = 0
+        self.diag_tree = None
+        self.diag_next_update = 0.0
+        self.profiler = None
+        self.sampler = None
+        self.profile_base = None
+        self.stall_detector = None
+        self.port_infos = []
+        self.port_monitor = None
+        self.telemetry = None
+        self.rpc = None
+        self.rpc_errors = None
+        self.experiment = None
+        self.ensemble_window = None
+        self.spectrum = None
+        self.spectrum_window = None
+        self.connected_identity = None
+        self.reconnect_identity = None
+        self.reconnect_port = None
+        self.reconnect_attempt = 0
+        self.reconnect_after_id = None
+        self.reconnect_started = None
+        self.probe_thread = None
+        self.rx_arrival_wall = None
+        self.startup_started = time.perf_counter()
+        self.startup_painted = None
+        self.startup_exit = False
+        self.trigger_dir = None
+        self.trigger_capture_count = 0
 
         self.recording = False
-        self.csv_file = None
-        self.csv_writer = None
+        self.recorder = None
+
+        self.step_active = False
+        self.step_target = None
+        self.step_start_time = None
+        self.settle_start_time = None
+        self.settled_time = None
+        self.overshoot_max = 0.0
+
+        self._build_ui()
+        self._setup_wakeup()
+        self._poll_rx_queue()
+        self.startup_binding = self.root.bind("<Expose>", self._on_first_expose, add="+")
+        # Fallback for a window that starts iconified and never gets an expose.
+        self.root.after(3000, self._on_first_expose, None)
+
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _build_ui(self) -> None:
+        container = ttk.Frame(self.root)
+        container.pack(fill=tk.BOTH, expand=True)
+
+        canvas = tk.Canvas(container, highlightthickness=0)
+        h_scroll = ttk.Scrollbar(container, orient=tk.HORIZONTAL, command=canvas.xview)
+        v_scroll = ttk.Scrollbar(container, orient=tk.VERTICAL, command=canvas.yview)
+        canvas.configure(xscrollcommand=h_scroll.set, yscrollcommand=v_scroll.set)
+
+        canvas.grid(row=0, column=0, sticky="nsew")
+        v_scroll.grid(row=0, column=1, sticky="ns")
+        h_scroll.grid(row=1, column=0, sticky="ew")
+
+        container.rowconfigure(0, weight=1)
+        container.columnconfigure(0, weight=1)
+
+        main = ttk.Frame(canvas, padding=12)
+        canvas_window = canvas.create_window((0, 0), window=main, anchor="nw")
+
+        def _on_frame_configure(event):
+            main.update_idletasks()
+            canvas.configure(scrollregion=canvas.bbox("all"))
+
+        def _on_canvas_configure(event):
+            main.update_idletasks()
+            desired_height = max(event.height, main.winfo_reqheight())
+            canvas.itemconfigure(canvas_window, width=event.width, height=desired_height)
+
+        main.bind("<Configure>", _on_frame_configure)
+        canvas.bind("<Configure>", _on_canvas_configure)
+
+        notebook = ttk.Notebook(main)
+        notebook.pack(fill=tk.X)
+        notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        self.lazy_tabs = {}
+
+        connection_tab = ttk.Frame(notebook, padding=10)
+        controller_tab = ttk.Frame(notebook, padding=10)
+        response_tab = ttk.Frame(notebook, padding=10)
+        trigger_tab = ttk.Frame(notebook, padding=10)
+        diagnostics_tab = ttk.Frame(notebook, padding=10)
+
+        notebook.add(connection_tab, text="Connection")
+        notebook.add(controller_tab, text="Controller Settings")
+        notebook.add(response_tab, text="Response Generator")
+        notebook.add(trigger_tab, text="Trigger")
+        notebook.add(diagnostics_tab, text="Diagnostics")
+
+        connection_frame = ttk.LabelFrame(connection_tab, text="Connection", padding=10)
+        connection_frame.pack(fill=tk.X)
+
+        ttk.Label(connection_frame, text="COM Port:").grid(row=0, column=0, sticky=tk.W)
+        self.port_var = tk.StringVar()
+        self.port_combo = ttk.Combobox(
+            connection_frame, textvariable=self.port_var, width=16, state="readonly"
+        )
+        self.port_combo.grid(row=0, column=1, padx=6, sticky=tk.W)
+
+        ttk.Label(connection_frame, text="VID:").grid(row=0, column=2, sticky=tk.W)
+        self.vid_var = tk.StringVar(value="0483")
+        ttk.Entry(connection_frame, textvariable=self.vid_var, width=6).grid(
+            row=0, column=3, padx=4, sticky=tk.W
+        )
+
+        ttk.Label(connection_frame, text="PID:").grid(row=0, column=4, sticky=tk.W)
+        self.pid_var = tk.StringVar(value="5740")
+        ttk.Entry(connection_frame, textvariable=self.pid_var, width=6).grid(
+            row=0, column=5, padx=4, sticky=tk.W
+        )
+
+        ttk.Label(connection_frame, text="Baud:").grid(row=0, column=6, sticky=tk.W)
+        self.baud_var = tk.StringVar(value="115200")
+        ttk.Entry(connection_frame, textvariable=self.baud_var, width=10).grid(
+            row=0, column=7, padx=6, sticky=tk.W
+        )
+
+        ttk.Button(
+            connection_frame, text="Refresh", command=self._refresh_ports
+        ).grid(row=0, column=8, padx=4)
+
+        ttk.Button(
+            connection_frame, text="Auto Detect", command=self._auto_detect_port
+        ).grid(row=0, column=9, padx=4)
+
+        self.connect_button = ttk.Button(
+            connection_frame, text="Connect", command=self._toggle_connection
+        )
+        self.connect_button.grid(row=0, column=10, padx=6)
+        self.event_driven_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            connection_frame, text="Event-driven I/O", variable=self.event_driven_var
+        ).grid(row=1, column=0, columnspan=3, sticky=tk.W, pady=(6, 0))
+        ttk.Label(connection_frame, text="Overload:").grid(row=1, column=3, sticky=tk.W, pady=(6, 0))
+        self.rx_policy_var = tk.StringVar(value="Coalesce")
+        rx_policy_combo = ttk.Combobox(
+            connection_frame,
+            textvariable=self.rx_policy_var,
+            state="readonly",
+            width=11,
+            values=RX_POLICIES,
+        )
+        rx_policy_combo.grid(row=1, column=4, columnspan=2, padx=4, sticky=tk.W, pady=(6, 0))
+        rx_policy_combo.bind("<<ComboboxSelected>>", self._apply_rx_policy)
+        ttk.Label(connection_frame, text="Queue (KB):").grid(
+            row=1, column=6, sticky=tk.W, pady=(6, 0)
+        )
+        self.rx_queue_kb_var = tk.StringVar(value="256")
+        rx_queue_entry = ttk.Entry(connection_frame, textvariable=self.rx_queue_kb_var, width=8)
+        rx_queue_entry.grid(row=1, column=7, padx=6, sticky=tk.W, pady=(6, 0))
+        rx_queue_entry.bind("<Return>", self._apply_rx_policy)
+        rx_queue_entry.bind("<FocusOut>", self._apply_rx_policy)
+        self.hotplug_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            connection_frame,
+            text="Watch for port changes",
+            variable=self.hotplug_var,
+            command=self._toggle_port_monitor,
+        ).grid(row=2, column=0, columnspan=3, sticky=tk.W, pady=(6, 0))
+        self.auto_reconnect_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            connection_frame, text="Reconnect after USB reset", variable=self.auto_reconnect_var
+        ).grid(row=2, column=3, columnspan=4, sticky=tk.W, pady=(6, 0))
+        self.acquisition_process_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            connection_frame,
+            text="Acquire in separate process",
+            variable=self.acquisition_process_var,
+        ).grid(row=2, column=7, columnspan=4, sticky=tk.W, pady=(6, 0))
+
+        clock_frame = ttk.LabelFrame(connection_tab, text="Clock Sync", padding=10)
+        clock_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(clock_frame, textvariable=self.clock_var).pack(anchor=tk.W)
+
+        link_frame = ttk.LabelFrame(connection_tab, text="Link Quality", padding=10)
+        link_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(link_frame, textvariable=self.link_var).pack(side=tk.LEFT)
+        ttk.Button(link_frame, text="Reset", command=self._reset_link_stats).pack(side=tk.RIGHT)
+
+        conditioning_frame = ttk.LabelFrame(connection_tab, text="Signal Conditioning", padding=10)
+        conditioning_frame.pack(fill=tk.X, pady=(10, 0))
+        self.conditioning_enabled_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            conditioning_frame,
+            text="Enable",
+            variable=self.conditioning_enabled_var,
+            command=self._configure_conditioning,
+        ).grid(row=0, column=0, sticky=tk.W)
+        ttk.Label(conditioning_frame, text="Median window:").grid(row=0, column=1, sticky=tk.W)
+        self.conditioning_window_var = tk.StringVar(value="5")
+        ttk.Entry(conditioning_frame, textvariable=self.conditioning_window_var, width=6).grid(
+            row=0, column=2, padx=6, sticky=tk.W
+        )
+        ttk.Label(conditioning_frame, text="Threshold (MAD):").grid(row=0, column=3, sticky=tk.W)
+        self.conditioning_sigmas_var = tk.StringVar(value="3.0")
+        ttk.Entry(conditioning_frame, textvariable=self.conditioning_sigmas_var, width=6).grid(
+            row=0, column=4, padx=6, sticky=tk.W
+        )
+        self.conditioning_resample_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            conditioning_frame,
+            text="Resample to uniform dt",
+            variable=self.conditioning_resample_var,
+        ).grid(row=0, column=5, padx=6, sticky=tk.W)
+        ttk.Button(conditioning_frame, text="Apply", command=self._configure_conditioning).grid(
+            row=0, column=6, padx=6
+        )
+        self.conditioning_var = tk.StringVar(value="Conditioning: off")
+        ttk.Label(conditioning_frame, textvariable=self.conditioning_var).grid(
+            row=1, column=0, columnspan=7, sticky=tk.W, pady=(6, 0)
+        )
+
+        telemetry_frame = ttk.LabelFrame(connection_tab, text="Telemetry Server", padding=10)
+        telemetry_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(telemetry_frame, text="Listen (host:port or socket path):").grid(
+            row=0, column=0, sticky=tk.W
+        )
+        self.telemetry_address_var = tk.StringVar(value="127.0.0.1:5760")
+        ttk.Entry(telemetry_frame, textvariable=self.telemetry_address_var, width=28).grid(
+            row=0, column=1, padx=6, sticky=tk.W
+        )
+        self.telemetry_ws_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(telemetry_frame, text="WebSocket", variable=self.telemetry_ws_var).grid(
+            row=0, column=2, padx=6, sticky=tk.W
+        )
+        self.telemetry_button = ttk.Button(
+            telemetry_frame, text="Start", command=self._toggle_telemetry
+        )
+        self.telemetry_button.grid(row=0, column=3, padx=6)
+        self.telemetry_var = tk.StringVar(value="Telemetry: off")
+        ttk.Label(telemetry_frame, textvariable=self.telemetry_var).grid(
+            row=1, column=0, columnspan=4, sticky=tk.W, pady=(6, 0)
+        )
+
+        rpc_frame = ttk.LabelFrame(connection_tab, text="Scripting API", padding=10)
+        rpc_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(rpc_frame, text="JSON-RPC (host:port or socket path):").grid(
+            row=0, column=0, sticky=tk.W
+        )
+        self.rpc_address_var = tk.StringVar(value="127.0.0.1:5761")
+        ttk.Entry(rpc_frame, textvariable=self.rpc_address_var, width=28).grid(
+            row=0, column=1, padx=6, sticky=tk.W
+        )
+        self.rpc_button = ttk.Button(rpc_frame, text="Start", command=self._toggle_rpc)
+        self.rpc_button.grid(row=0, column=2, padx=6)
+        self.rpc_var = tk.StringVar(value="Scripting API: off")
+        ttk.Label(rpc_frame, textvariable=self.rpc_var).grid(
+            row=1, column=0, columnspan=3, sticky=tk.W, pady=(6, 0)
+        )
+
+        tx_frame = ttk.LabelFrame(connection_tab, text="Command Latency", padding=10)
+        tx_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(tx_frame, textvariable=self.tx_stats_var, justify=tk.LEFT).grid(
+            row=0, column=0, sticky=tk.W
+        )
+        ttk.Button(tx_frame, text="Reset", command=self._reset_tx_stats).grid(
+            row=0, column=1, padx=6, sticky=tk.N
+        )
+
+        sessions_frame = ttk.LabelFrame(connection_tab, text="Additional Devices", padding=10)
+        sessions_frame.pack(fill=tk.X, pady=(10, 0))
+
+        ttk.Label(sessions_frame, text="COM Port:").grid(row=0, column=0, sticky=tk.W)
+        self.session_port_var = tk.StringVar()
+        self.session_port_combo = ttk.Combobox(
+            sessions_frame, textvariable=self.session_port_var, width=16, state="readonly"
+        )
+        self.session_port_combo.grid(row=0, column=1, padx=6, sticky=tk.W)
+        ttk.Button(sessions_frame, text="Add", command=self._add_session).grid(
+            row=0, column=2, padx=4
+        )
+        ttk.Button(sessions_frame, text="Remove", command=self._remove_session).grid(
+            row=0, column=3, padx=4
+        )
+        ttk.Button(sessions_frame, text="Record", command=self._toggle_session_recording).grid(
+            row=0, column=4, padx=4
+        )
+
+        self.session_tree = ttk.Treeview(
+            sessions_frame,
+            columns=("rate", "samples", "rms", "recording"),
+            height=4,
+        )
+        self.session_tree.heading("#0", text="Port")
+        self.session_tree.heading("rate", text="Rate (Hz)")
+        self.session_tree.heading("samples", text="Samples")
+        self.session_tree.heading("rms", text="RMS Error")
+        self.session_tree.heading("recording", text="Recording")
+        for column in ("rate", "samples", "rms", "recording"):
+            self.session_tree.column(column, width=90, anchor=tk.E)
+        self.session_tree.grid(row=1, column=0, columnspan=8, sticky="ew", pady=(6, 0))
+
+        ttk.Label(sessions_frame, text="Broadcast:").grid(row=2, column=0, sticky=tk.W, pady=(6, 0))
+        self.broadcast_var = tk.StringVar(value="ESTOP")
+        ttk.Combobox(
+            sessions_frame,
+            textvariable=self.broadcast_var,
+            width=24,
+            values=["ESTOP", "P=1.2,I=0.5,D=0.01", "TS=2", "STEP=1.0,2.0"],
+        ).grid(row=2, column=1, columnspan=2, padx=6, sticky=tk.W, pady=(6, 0))
+        self.broadcast_primary_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            sessions_frame, text="Include primary", variable=self.broadcast_primary_var
+        ).grid(row=2, column=3, padx=4, sticky=tk.W, pady=(6, 0))
+        ttk.Button(sessions_frame, text="Send to Group", command=self._broadcast_command).grid(
+            row=2, column=4, padx=4, pady=(6, 0)
+        )
+
+        self.sample_time_var = tk.StringVar(value="2")
+        self.p_var = tk.StringVar(value="1.2")
+        self.i_var = tk.StringVar(value="0.5")
+        self.d_var = tk.StringVar(value="0.01")
+        self.current_p_var = tk.StringVar(value="--")
+        self.current_i_var = tk.StringVar(value="--")
+        self.current_d_var = tk.StringVar(value="--")
+        self.tuning_method_var = tk.StringVar(value="Nicholas Ziegler")
+        self.tune_status_var = tk.StringVar(value="Tune: --")
+        self.relay_sp_var = tk.StringVar(value="0.0")
+        self.relay_fs_var = tk.StringVar(value="100")
+        self.relay_d_var = tk.StringVar(value="7")
+        self.relay_h_var = tk.StringVar(value="1")
+        self.relay_cycles_var = tk.StringVar(value="6")
+        self.relay_pvmin_var = tk.StringVar(value="0")
+        self.relay_pvmax_var = tk.StringVar(value="360")
+        self._defer_tab(controller_tab, self._build_controller_tab)
+
+        self.response_type_var = tk.StringVar(value="Setpoint")
+        self.setpoint_var = tk.StringVar(value="0.0")
+        self.step_var = tk.StringVar(value="0.0")
+        self.ramp_var = tk.StringVar(value="0.0")
+        self.accel_var = tk.StringVar(value="0.0")
+        self.sine_amp_var = tk.StringVar(value="0.0")
+        self.sine_freq_var = tk.StringVar(value="1.0")
+        self.sine_offset_var = tk.StringVar(value="0.0")
+        self.response_time_var = tk.StringVar(value="2.0")
+        self.use_time_var = tk.BooleanVar(value=True)
+        self.experiment_var = tk.StringVar(value="Sequence: --")
+        self.ensemble_runs_var = tk.StringVar(value="20")
+        self.profile_shape_var = tk.StringVar(value="Chirp")
+        self.profile_format_var = tk.StringVar(value="ASCII")
+        self.profile_chunk_var = tk.StringVar(value="64")
+        self.profile_amp_var = tk.StringVar(value="1.0")
+        self.profile_offset_var = tk.StringVar(value="0.0")
+        self.profile_duration_var = tk.StringVar(value="10.0")
+        self.profile_f0_var = tk.StringVar(value="0.1")
+        self.profile_f1_var = tk.StringVar(value="10.0")
+        self.profile_tones_var = tk.StringVar(value="16")
+        self.profile_hold_var = tk.StringVar(value="1")
+        self.profile_ramp_var = tk.StringVar(value="1.0")
+        self.profile_csv_var = tk.StringVar(value="No file")
+        self.profile_status_var = tk.StringVar(value="Profile: idle")
+        self._defer_tab(response_tab, self._build_response_tab)
+
+        trigger_frame = ttk.LabelFrame(trigger_tab, text="Trigger Capture", padding=10)
+        trigger_frame.pack(fill=tk.X)
+
+        ttk.Label(trigger_frame, text="Mode:").grid(row=0, column=0, sticky=tk.W)
+        self.trigger_mode_var = tk.StringVar(value="Single")
+        ttk.Combobox(
+            trigger_frame,
+            textvariable=self.trigger_mode_var,
+            state="readonly",
+            width=8,
+            values=TRIGGER_MODES,
+        ).grid(row=0, column=1, padx=6, sticky=tk.W)
+        ttk.Label(trigger_frame, text="Condition:").grid(row=0, column=2, sticky=tk.W)
+        self.trigger_condition_var = tk.StringVar(value="Target change")
+        ttk.Combobox(
+            trigger_frame,
+            textvariable=self.trigger_condition_var,
+            state="readonly",
+            width=14,
+            values=TRIGGER_CONDITIONS,
+        ).grid(row=0, column=3, padx=6, sticky=tk.W)
+        ttk.Label(trigger_frame, text="Level:").grid(row=0, column=4, sticky=tk.W)
+        self.trigger_level_var = tk.StringVar(value="0.0")
+        ttk.Entry(trigger_frame, textvariable=self.trigger_level_var, width=8).grid(
+            row=0, column=5, padx=6, sticky=tk.W
+        )
 
-        self.step_active = False
-        self.step_target = None
-        self.step_start_time = None
-        self.settle_start_time = None
-        self.settled_time = None
-        self.overshoot_max = 0.0
+        ttk.Label(trigger_frame, text="Pre (s):").grid(row=1, column=0, sticky=tk.W, pady=(6, 0))
+        self.trigger_pre_var = tk.StringVar(value="1.0")
+        ttk.Entry(trigger_frame, textvariable=self.trigger_pre_var, width=8).grid(
+            row=1, column=1, padx=6, sticky=tk.W, pady=(6, 0)
+        )
+        ttk.Label(trigger_frame, text="Post (s):").grid(row=1, column=2, sticky=tk.W, pady=(6, 0))
+        self.trigger_post_var = tk.StringVar(value="2.0")
+        ttk.Entry(trigger_frame, textvariable=self.trigger_post_var, width=8).grid(
+            row=1, column=3, padx=6, sticky=tk.W, pady=(6, 0)
+        )
+        ttk.Label(trigger_frame, text="Output:").grid(row=1, column=4, sticky=tk.W, pady=(6, 0))
+        self.trigger_output_var = tk.StringVar(value="Window")
+        ttk.Combobox(
+            trigger_frame,
+            textvariable=self.trigger_output_var,
+            state="readonly",
+            width=8,
+            values=["Window", "File"],
+        ).grid(row=1, column=5, padx=6, sticky=tk.W, pady=(6, 0))
+        ttk.Button(trigger_frame, text="Folder...", command=self._choose_trigger_dir).grid(
+            row=1, column=6, padx=6, pady=(6, 0)
+        )
 
-        self._build_ui()
-        self._poll_rx_queue()
+        ttk.Button(trigger_frame, text="Arm", command=self._arm_trigger).grid(
+            row=0, column=6, padx=6
+        )
+        ttk.Button(trigger_frame, text="Disarm", command=self._disarm_trigger).grid(
+            row=0, column=7, padx=6
+        )
+        self.trigger_status_var = tk.StringVar(value="Trigger: idle")
+        ttk.Label(trigger_frame, textvariable=self.trigger_status_var).grid(
+            row=2, column=0, columnspan=6, sticky=tk.W, pady=(6, 0)
+        )
 
-        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        diag_frame = ttk.LabelFrame(diagnostics_tab, text="Performance", padding=10)
+        diag_frame.pack(fill=tk.X)
+        columns = PerfMonitor.FIELDS[1:]
+        self.diag_tree = ttk.Treeview(diag_frame, columns=columns, height=10)
+        self.diag_tree.heading("#0", text="Metric")
+        self.diag_tree.column("#0", width=170)
+        for column in columns:
+            self.diag_tree.heading(column, text=column)
+            self.diag_tree.column(column, width=80, anchor=tk.E)
+        self.diag_tree.pack(fill=tk.X)
+        diag_buttons = ttk.Frame(diag_frame)
+        diag_buttons.pack(fill=tk.X, pady=(6, 0))
+        ttk.Button(diag_buttons, text="Reset", command=self.perf.reset).pack(side=tk.LEFT)
+        ttk.Button(diag_buttons, text="Export...", command=self._export_diagnostics).pack(
+            side=tk.LEFT, padx=6
+        )
 
-    def _build_ui(self) -> None:
-        container = ttk.Frame(self.root)
-        container.pack(fill=tk.BOTH, expand=True)
+        profiler_frame = ttk.LabelFrame(diagnostics_tab, text="Profiler", padding=10)
+        profiler_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(profiler_frame, text="Duration (s):").grid(row=0, column=0, sticky=tk.W)
+        self.profiler_duration_var = tk.StringVar(value="10")
+        ttk.Entry(profiler_frame, textvariable=self.profiler_duration_var, width=8).grid(
+            row=0, column=1, padx=6, sticky=tk.W
+        )
+        self.profile_button = ttk.Button(
+            profiler_frame, text="Capture Profile...", command=self._start_profile_capture
+        )
+        self.profile_button.grid(row=0, column=2, padx=6)
+        self.profiler_status_var = tk.StringVar(value="Profiler: idle")
+        ttk.Label(profiler_frame, textvariable=self.profiler_status_var).grid(
+            row=0, column=3, padx=6, sticky=tk.W
+        )
+        self.stall_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            profiler_frame,
+            text="Stall detector",
+            variable=self.stall_var,
+            command=self._toggle_stall_detector,
+        ).grid(row=1, column=0, sticky=tk.W, pady=(6, 0))
+        ttk.Label(profiler_frame, text="Threshold (ms):").grid(
+            row=1, column=1, sticky=tk.W, pady=(6, 0)
+        )
+        self.stall_threshold_var = tk.StringVar(value="250")
+        ttk.Entry(profiler_frame, textvariable=self.stall_threshold_var, width=8).grid(
+            row=1, column=2, padx=6, sticky=tk.W, pady=(6, 0)
+        )
 
-        canvas = tk.Canvas(container, highlightthickness=0)
-        h_scroll = ttk.Scrollbar(container, orient=tk.HORIZONTAL, command=canvas.xview)
-        v_scroll = ttk.Scrollbar(container, orient=tk.VERTICAL, command=canvas.yview)
-        canvas.configure(xscrollcommand=h_scroll.set, yscrollcommand=v_scroll.set)
+        self.settling_time_var = tk.StringVar(value="--")
+        self.overshoot_var = tk.StringVar(value="--")
+        self.sse_var = tk.StringVar(value="--")
+        self.sse_percent_var = tk.BooleanVar(value=False)
 
-        canvas.grid(row=0, column=0, sticky="nsew")
-        v_scroll.grid(row=0, column=1, sticky="ns")
-        h_scroll.grid(row=1, column=0, sticky="ew")
+        toggle_frame = ttk.Frame(main)
+        toggle_frame.pack(fill=tk.X, pady=(10, 0))
+        self.show_plot_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            toggle_frame,
+            text="Show Graph",
+            variable=self.show_plot_var,
+            command=self._toggle_plot,
+        ).pack(side=tk.LEFT)
+        self.show_log_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            toggle_frame,
+            text="Show Log",
+            variable=self.show_log_var,
+            command=self._toggle_log,
+        ).pack(side=tk.LEFT, padx=10)
 
-        container.rowconfigure(0, weight=1)
-        container.columnconfigure(0, weight=1)
+        self.paned = ttk.Panedwindow(main, orient=tk.HORIZONTAL)
+        self.paned.pack(fill=tk.BOTH, expand=True, pady=(6, 0))
 
-        main = ttk.Frame(canvas, padding=12)
-        canvas_window = canvas.create_window((0, 0), window=main, anchor="nw")
+        self.plot_frame = ttk.LabelFrame(self.paned, text="Target vs Actual", padding=10)
 
-        def _on_frame_configure(event):
-            main.update_idletasks()
-            canvas.configure(scrollregion=canvas.bbox("all"))
+        # The live figure is built after the window first paints (_build_live_plot).
+        self.live_plot_host = ttk.Frame(self.plot_frame, height=250)
+        self.live_plot_host.pack(fill=tk.BOTH, expand=True)
 
-        def _on_canvas_configure(event):
-            main.update_idletasks()
-            desired_height = max(event.height, main.winfo_reqheight())
-            canvas.itemconfigure(canvas_window, width=event.width, height=desired_height)
+        capture_frame = ttk.Frame(self.plot_frame)
+        capture_frame.pack(fill=tk.X, pady=(8, 0))
 
-        main.bind("<Configure>", _on_frame_configure)
-        canvas.bind("<Configure>", _on_canvas_configure)
+        self.record_button = ttk.Button(
+            capture_frame, text="Start Recording", command=self._start_recording
+        )
+        self.record_button.pack(side=tk.LEFT)
 
-        notebook = ttk.Notebook(main)
-        notebook.pack(fill=tk.X)
+        self.stop_button = ttk.Button(
+            capture_frame, text="Stop Recording", command=self._stop_recording, state="disabled"
+        )
+        self.stop_button.pack(side=tk.LEFT, padx=6)
 
-        connection_tab = ttk.Frame(notebook, padding=10)
-        controller_tab = ttk.Frame(notebook, padding=10)
-        response_tab = ttk.Frame(notebook, padding=10)
+        self.channels_button = ttk.Menubutton(capture_frame, text="Channels")
+        self.channels_menu = tk.Menu(self.channels_button, tearoff=0)
+        self.channels_button.configure(menu=self.channels_menu)
+        self.channels_button.pack(side=tk.LEFT, padx=6)
+        self.spectrum_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            capture_frame,
+            text="Spectrum",
+            variable=self.spectrum_var,
+            command=self._toggle_spectrum,
+        ).pack(side=tk.LEFT, padx=6)
 
-        notebook.add(connection_tab, text="Connection")
-        notebook.add(controller_tab, text="Controller Settings")
-        notebook.add(response_tab, text="Response Generator")
+        self.rx_rate_label = ttk.Label(capture_frame, textvariable=self.rx_rate_var)
+        self.rx_rate_label.pack(side=tk.RIGHT)
+        self.rx_overload_var = tk.StringVar(value="")
+        self.rx_overload_label = ttk.Label(
+            capture_frame, textvariable=self.rx_overload_var, foreground="red"
+        )
+        self.rx_overload_label.pack(side=tk.RIGHT, padx=6)
 
-        connection_frame = ttk.LabelFrame(connection_tab, text="Connection", padding=10)
-        connection_frame.pack(fill=tk.X)
+        self.log_frame = ttk.LabelFrame(self.paned, text="RX/TX Log", padding=10)
 
-        ttk.Label(connection_frame, text="COM Port:").grid(row=0, column=0, sticky=tk.W)
-        self.port_var = tk.StringVar()
-        self.port_combo = ttk.Combobox(
-            connection_frame, textvariable=self.port_var, width=16, state="readonly"
+        log_filters = ttk.Frame(self.log_frame)
+        log_filters.pack(side=tk.TOP, fill=tk.X, pady=(0, 6))
+        ttk.Label(log_filters, text="Show:").pack(side=tk.LEFT)
+        self.log_severity_var = tk.StringVar(value="INFO")
+        log_severity_combo = ttk.Combobox(
+            log_filters,
+            textvariable=self.log_severity_var,
+            state="readonly",
+            width=6,
+            values=LOG_SEVERITIES,
         )
-        self.port_combo.grid(row=0, column=1, padx=6, sticky=tk.W)
+        log_severity_combo.pack(side=tk.LEFT, padx=4)
+        log_severity_combo.bind("<<ComboboxSelected>>", self._apply_log_filters)
+        self.log_category_vars = {}
+        for category in LOG_CATEGORIES:
+            var = tk.BooleanVar(value=True)
+            self.log_category_vars[category] = var
+            ttk.Checkbutton(
+                log_filters, text=category.upper(), variable=var, command=self._apply_log_filters
+            ).pack(side=tk.LEFT, padx=2)
 
-        ttk.Label(connection_frame, text="VID:").grid(row=0, column=2, sticky=tk.W)
-        self.vid_var = tk.StringVar(value="0483")
-        ttk.Entry(connection_frame, textvariable=self.vid_var, width=6).grid(
-            row=0, column=3, padx=4, sticky=tk.W
-        )
+        self.log_text = tk.Text(self.log_frame, height=12, wrap="word", state="disabled")
+        self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        ttk.Label(connection_frame, text="PID:").grid(row=0, column=4, sticky=tk.W)
-        self.pid_var = tk.StringVar(value="5740")
-        ttk.Entry(connection_frame, textvariable=self.pid_var, width=6).grid(
-            row=0, column=5, padx=4, sticky=tk.W
-        )
+        scrollbar = ttk.Scrollbar(self.log_frame, command=self.log_text.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.log_text.configure(yscrollcommand=scrollbar.set)
 
-        ttk.Label(connection_frame, text="Baud:").grid(row=0, column=6, sticky=tk.W)
-        self.baud_var = tk.StringVar(value="115200")
-        ttk.Entry(connection_frame, textvariable=self.baud_var, width=10).grid(
-            row=0, column=7, padx=6, sticky=tk.W
-        )
+        self.paned.add(self.log_frame, weight=2)
+        self.paned.add(self.plot_frame, weight=3)
 
-        ttk.Button(
-            connection_frame, text="Refresh", command=self._refresh_ports
-        ).grid(row=0, column=8, padx=4)
+    def _on_first_expose(self, event) -> None:
+        if self.startup_painted is not None:
+            return
+        self.startup_painted = time.perf_counter()
+        self.root.unbind("<Expose>", self.startup_binding)
+        # Runs after the idle redraws queued by this expose, i.e. after the first paint.
+        self.root.after_idle(self._finish_startup)
 
-        ttk.Button(
-            connection_frame, text="Auto Detect", command=self._auto_detect_port
-        ).grid(row=0, column=9, padx=4)
+    def _finish_startup(self) -> None:
+        self._refresh_ports()
+        self._toggle_port_monitor()
+        self._build_live_plot()
+        ready = time.perf_counter()
+        first_paint_ms = (self.startup_painted - self.startup_started) * 1000.0
+        ready_ms = (ready - self.startup_started) * 1000.0
+        self.perf.add("startup_first_paint", first_paint_ms)
+        self.perf.add("startup_ready", ready_ms)
+        self._log(f"Startup: first paint {first_paint_ms:.0f} ms, plot ready {ready_ms:.0f} ms")
+        if self.startup_exit:
+            print(json.dumps({"first_paint_ms": first_paint_ms, "ready_ms": ready_ms}), flush=True)
+            self.root.after(0, self._on_close)
+
+    def _build_live_plot(self) -> None:
+        if self.canvas is not None:
+            return
+        Figure, FigureCanvasTkAgg = _plotting()
+        self.figure = Figure(figsize=(5, 2.5), dpi=100)
+        self.axes = self.figure.add_subplot(111)
+        self.axes.set_xlabel("Time (s)")
+        self.axes.set_ylabel("Value")
+        self.axes.grid(True, alpha=0.3)
+        self.target_line, = self.axes.plot([], [], label="Target")
+        self.actual_line, = self.axes.plot([], [], label="Actual")
+        self.raw_line = None
+        self.axes.legend(loc="upper right")
+        self._sync_extra_lines()
 
-        self.connect_button = ttk.Button(
-            connection_frame, text="Connect", command=self._toggle_connection
-        )
-        self.connect_button.grid(row=0, column=10, padx=6)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.live_plot_host)
+        _time_canvas_draws(self.canvas, lambda ms: self.perf.add("plot_draw", ms))
+        self.canvas.draw()
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.plot_dirty = True
+
+    def _defer_tab(self, frame, builder) -> None:
+        self.lazy_tabs[str(frame)] = (frame, builder)
+
+    def _on_tab_changed(self, event) -> None:
+        # Tab contents are built on first visit; their variables already exist.
+        entry = self.lazy_tabs.pop(event.widget.select(), None)
+        if entry is not None:
+            frame, builder = entry
+            builder(frame)
 
+    def _build_controller_tab(self, controller_tab) -> None:
         formula_frame = ttk.LabelFrame(controller_tab, text="Compensator Formula", padding=10)
         formula_frame.pack(fill=tk.X)
         ttk.Label(
@@ -179,6 +3804,7 @@ class CdcGuiApp:
 
         controller_tabs = ttk.Notebook(controller_tab)
         controller_tabs.pack(fill=tk.X, pady=(10, 0))
+        controller_tabs.bind("<<NotebookTabChanged>>", self._on_tab_changed)
 
         settings_tab = ttk.Frame(controller_tabs, padding=10)
         current_pid_tab = ttk.Frame(controller_tabs, padding=10)
@@ -194,23 +3820,19 @@ class CdcGuiApp:
         ttk.Label(control_frame, text="Sample Time (ms):").grid(
             row=0, column=0, sticky=tk.W
         )
-        self.sample_time_var = tk.StringVar(value="2")
         self.sample_time_entry = ttk.Entry(
             control_frame, textvariable=self.sample_time_var, width=8, state="disabled"
         )
         self.sample_time_entry.grid(row=0, column=1, padx=(12, 4), sticky=tk.W)
         ttk.Label(control_frame, text="Proportional (P):").grid(row=1, column=0, sticky=tk.W, pady=(6, 0))
-        self.p_var = tk.StringVar(value="1.2")
         ttk.Entry(control_frame, textvariable=self.p_var, width=8).grid(
             row=1, column=1, padx=(12, 4), sticky=tk.W, pady=(6, 0)
         )
         ttk.Label(control_frame, text="Integral (I):").grid(row=2, column=0, sticky=tk.W, pady=(6, 0))
-        self.i_var = tk.StringVar(value="0.5")
         ttk.Entry(control_frame, textvariable=self.i_var, width=8).grid(
             row=2, column=1, padx=(12, 4), sticky=tk.W, pady=(6, 0)
         )
         ttk.Label(control_frame, text="Derivative (D):").grid(row=3, column=0, sticky=tk.W, pady=(6, 0))
-        self.d_var = tk.StringVar(value="0.01")
         ttk.Entry(control_frame, textvariable=self.d_var, width=8).grid(
             row=3, column=1, padx=(12, 4), sticky=tk.W, pady=(6, 0)
         )
@@ -220,9 +3842,6 @@ class CdcGuiApp:
 
         current_pid_frame = ttk.LabelFrame(current_pid_tab, text="Current PID", padding=10)
         current_pid_frame.pack(fill=tk.X)
-        self.current_p_var = tk.StringVar(value="--")
-        self.current_i_var = tk.StringVar(value="--")
-        self.current_d_var = tk.StringVar(value="--")
         ttk.Label(current_pid_frame, text="Proportional (P):").grid(row=0, column=0, sticky=tk.W)
         ttk.Label(current_pid_frame, textvariable=self.current_p_var).grid(
             row=0, column=1, padx=(12, 0), sticky=tk.W
@@ -238,11 +3857,12 @@ class CdcGuiApp:
         ttk.Button(current_pid_frame, text="Get Controller Parameters ", command=self._send_get_pid).grid(
             row=3, column=0, padx=6, pady=(8, 0), sticky=tk.W
         )
+        self._defer_tab(tuning_pid_tab, self._build_tuning_tab)
 
+    def _build_tuning_tab(self, tuning_pid_tab) -> None:
         tuning_pid_frame = ttk.LabelFrame(tuning_pid_tab, text="Automated Tuning", padding=10)
         tuning_pid_frame.pack(fill=tk.X)
         ttk.Label(tuning_pid_frame, text="Method:").grid(row=0, column=0, sticky=tk.W)
-        self.tuning_method_var = tk.StringVar(value="Nicholas Ziegler")
         tuning_combo = ttk.Combobox(
             tuning_pid_frame,
             textvariable=self.tuning_method_var,
@@ -259,7 +3879,6 @@ class CdcGuiApp:
             row=0, column=3, padx=6
         )
 
-        self.tune_status_var = tk.StringVar(value="Tune: --")
         ttk.Label(tuning_pid_frame, textvariable=self.tune_status_var).grid(
             row=2, column=0, columnspan=3, sticky=tk.W, pady=(6, 0)
         )
@@ -268,14 +3887,6 @@ class CdcGuiApp:
         relay_frame.grid(row=1, column=0, columnspan=3, sticky="ew", pady=(8, 0))
         relay_frame.columnconfigure(0, weight=1)
 
-        self.relay_sp_var = tk.StringVar(value="0.0")
-        self.relay_fs_var = tk.StringVar(value="100")
-        self.relay_d_var = tk.StringVar(value="7")
-        self.relay_h_var = tk.StringVar(value="1")
-        self.relay_cycles_var = tk.StringVar(value="6")
-        self.relay_pvmin_var = tk.StringVar(value="0")
-        self.relay_pvmax_var = tk.StringVar(value="360")
-
         ttk.Label(relay_frame, text="Setpoint:").grid(row=0, column=0, sticky=tk.W)
         ttk.Entry(relay_frame, textvariable=self.relay_sp_var, width=10).grid(
             row=0, column=1, padx=6, sticky=tk.W
@@ -309,11 +3920,11 @@ class CdcGuiApp:
         self.relay_frame = relay_frame
         self._update_tune_fields()
 
+    def _build_response_tab(self, response_tab) -> None:
         response_frame = ttk.LabelFrame(response_tab, text="Response Generator", padding=10)
         response_frame.pack(fill=tk.X)
 
         ttk.Label(response_frame, text="Type:").grid(row=0, column=0, sticky=tk.W)
-        self.response_type_var = tk.StringVar(value="Setpoint")
         self.response_type_combo = ttk.Combobox(
             response_frame,
             textvariable=self.response_type_var,
@@ -324,16 +3935,6 @@ class CdcGuiApp:
         self.response_type_combo.grid(row=0, column=1, padx=6, sticky=tk.W)
         self.response_type_combo.bind("<<ComboboxSelected>>", self._update_response_fields)
 
-        self.setpoint_var = tk.StringVar(value="0.0")
-        self.step_var = tk.StringVar(value="0.0")
-        self.ramp_var = tk.StringVar(value="0.0")
-        self.accel_var = tk.StringVar(value="0.0")
-        self.sine_amp_var = tk.StringVar(value="0.0")
-        self.sine_freq_var = tk.StringVar(value="1.0")
-        self.sine_offset_var = tk.StringVar(value="0.0")
-        self.response_time_var = tk.StringVar(value="2.0")
-        self.use_time_var = tk.BooleanVar(value=True)
-
         self.setpoint_label = ttk.Label(response_frame, text="Setpoint:")
         self.setpoint_entry = ttk.Entry(response_frame, textvariable=self.setpoint_var, width=10)
 
@@ -378,119 +3979,214 @@ class CdcGuiApp:
 
         self._update_response_fields()
 
-        self.settling_time_var = tk.StringVar(value="--")
-        self.overshoot_var = tk.StringVar(value="--")
-        self.sse_var = tk.StringVar(value="--")
-        self.sse_percent_var = tk.BooleanVar(value=False)
-
-        toggle_frame = ttk.Frame(main)
-        toggle_frame.pack(fill=tk.X, pady=(10, 0))
-        self.show_plot_var = tk.BooleanVar(value=True)
-        ttk.Checkbutton(
-            toggle_frame,
-            text="Show Graph",
-            variable=self.show_plot_var,
-            command=self._toggle_plot,
-        ).pack(side=tk.LEFT)
-        self.show_log_var = tk.BooleanVar(value=True)
-        ttk.Checkbutton(
-            toggle_frame,
-            text="Show Log",
-            variable=self.show_log_var,
-            command=self._toggle_log,
-        ).pack(side=tk.LEFT, padx=10)
-
-        self.paned = ttk.Panedwindow(main, orient=tk.HORIZONTAL)
-        self.paned.pack(fill=tk.BOTH, expand=True, pady=(6, 0))
-
-        self.plot_frame = ttk.LabelFrame(self.paned, text="Target vs Actual", padding=10)
-
-        self.figure = Figure(figsize=(5, 2.5), dpi=100)
-        self.axes = self.figure.add_subplot(111)
-        self.axes.set_xlabel("Time (s)")
-        self.axes.set_ylabel("Value")
-        self.axes.grid(True, alpha=0.3)
-        self.target_line, = self.axes.plot([], [], label="Target")
-        self.actual_line, = self.axes.plot([], [], label="Actual")
-        self.axes.legend(loc="upper right")
-
-        self.canvas = FigureCanvasTkAgg(self.figure, master=self.plot_frame)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-
-        capture_frame = ttk.Frame(self.plot_frame)
-        capture_frame.pack(fill=tk.X, pady=(8, 0))
-
-        self.record_button = ttk.Button(
-            capture_frame, text="Start Recording", command=self._start_recording
+        experiment_frame = ttk.LabelFrame(response_tab, text="Experiment Sequence", padding=10)
+        experiment_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(experiment_frame, text="Run Plan...", command=self._run_experiment).grid(
+            row=0, column=0, padx=(0, 6)
         )
-        self.record_button.pack(side=tk.LEFT)
-
-        self.stop_button = ttk.Button(
-            capture_frame, text="Stop Recording", command=self._stop_recording, state="disabled"
+        ttk.Button(experiment_frame, text="Abort", command=self._abort_experiment).grid(
+            row=0, column=1, padx=6
+        )
+        ttk.Label(experiment_frame, text="Runs:").grid(row=0, column=2, padx=(12, 0))
+        ttk.Entry(experiment_frame, textvariable=self.ensemble_runs_var, width=6).grid(
+            row=0, column=3, padx=6
+        )
+        ttk.Button(
+            experiment_frame, text="Repeat && Average Step", command=self._run_ensemble
+        ).grid(row=0, column=4, padx=6)
+        ttk.Label(experiment_frame, textvariable=self.experiment_var).grid(
+            row=1, column=0, columnspan=5, sticky=tk.W, pady=(6, 0)
         )
-        self.stop_button.pack(side=tk.LEFT, padx=6)
 
-        self.rx_rate_label = ttk.Label(capture_frame, textvariable=self.rx_rate_var)
-        self.rx_rate_label.pack(side=tk.RIGHT)
+        profile_frame = ttk.LabelFrame(response_tab, text="Streamed Profile", padding=10)
+        profile_frame.pack(fill=tk.X, pady=(10, 0))
 
-        self.log_frame = ttk.LabelFrame(self.paned, text="RX/TX Log", padding=10)
+        ttk.Label(profile_frame, text="Shape:").grid(row=0, column=0, sticky=tk.W)
+        profile_combo = ttk.Combobox(
+            profile_frame,
+            textvariable=self.profile_shape_var,
+            state="readonly",
+            width=12,
+            values=PROFILE_SHAPES,
+        )
+        profile_combo.grid(row=0, column=1, padx=6, sticky=tk.W)
+        profile_combo.bind("<<ComboboxSelected>>", self._update_profile_fields)
 
-        self.log_text = tk.Text(self.log_frame, height=12, wrap="word", state="disabled")
-        self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        ttk.Label(profile_frame, text="Format:").grid(row=0, column=2, sticky=tk.W)
+        ttk.Combobox(
+            profile_frame,
+            textvariable=self.profile_format_var,
+            state="readonly",
+            width=8,
+            values=["ASCII", "Binary"],
+        ).grid(row=0, column=3, padx=6, sticky=tk.W)
+        ttk.Label(profile_frame, text="Chunk:").grid(row=0, column=4, sticky=tk.W)
+        ttk.Entry(profile_frame, textvariable=self.profile_chunk_var, width=6).grid(
+            row=0, column=5, padx=6, sticky=tk.W
+        )
+        self.profile_stream_button = ttk.Button(
+            profile_frame, text="Stream", command=self._start_profile_stream
+        )
+        self.profile_stream_button.grid(row=0, column=6, padx=6)
+        ttk.Button(profile_frame, text="Stop Stream", command=self._stop_profile_stream).grid(
+            row=0, column=7, padx=6
+        )
+        ttk.Button(profile_frame, text="Identify", command=self._identify_frf).grid(
+            row=0, column=8, padx=6
+        )
 
-        scrollbar = ttk.Scrollbar(self.log_frame, command=self.log_text.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.log_text.configure(yscrollcommand=scrollbar.set)
+        profile_fields = [
+            ("amp", "Amplitude:", self.profile_amp_var),
+            ("offset", "Offset:", self.profile_offset_var),
+            ("duration", "Duration (s):", self.profile_duration_var),
+            ("f0", "Freq Lo (Hz):", self.profile_f0_var),
+            ("f1", "Freq Hi (Hz):", self.profile_f1_var),
+            ("tones", "Tones:", self.profile_tones_var),
+            ("hold", "Hold (samples):", self.profile_hold_var),
+            ("ramp", "Ramp (s):", self.profile_ramp_var),
+        ]
+        self.profile_widgets = {}
+        for key, text, var in profile_fields:
+            self.profile_widgets[key] = (
+                ttk.Label(profile_frame, text=text),
+                ttk.Entry(profile_frame, textvariable=var, width=10),
+            )
+        self.profile_csv_button = ttk.Button(
+            profile_frame, text="Load CSV...", command=self._choose_profile_csv
+        )
+        self.profile_csv_label = ttk.Label(profile_frame, textvariable=self.profile_csv_var)
 
-        self.paned.add(self.log_frame, weight=2)
-        self.paned.add(self.plot_frame, weight=3)
+        ttk.Label(profile_frame, textvariable=self.profile_status_var).grid(
+            row=3, column=0, columnspan=6, sticky=tk.W, pady=(6, 0)
+        )
+        self._update_profile_fields()
 
-        self._refresh_ports()
+    def _log(
+        self, message: str, category: str | None = None, severity: str | None = None
+    ) -> None:
+        # Messages are buffered in the ring and written to the widget once per tick (_flush_log).
+        if severity is None:
+            if message.startswith(("ERR", "!ERR")):
+                severity = "ERR"
+            elif message.startswith(("WARN", "Stall", "Device")):
+                severity = "WARN"
+            else:
+                severity = "INFO"
+        if severity == "ERR" and self.rpc_errors is not None:
+            self.rpc_errors.append(message)
+        severity = LOG_SEVERITIES.index(severity)
+        if category is None:
+            if message.startswith("RX:"):
+                category = "rx"
+            elif message.startswith("TX:"):
+                category = "tx"
+            else:
+                category = "app"
+        self.log_ring.add(severity, category, message)
 
-    def _log(self, message: str) -> None:
+    def _flush_log(self) -> None:
+        lines = self.log_ring.take_pending()
+        if not lines:
+            return
+        self.log_text.configure(state="normal")
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        self._trim_log_widget()
+        self.log_text.see(tk.END)
+        self.log_text.configure(state="disabled")
+
+    def _trim_log_widget(self) -> None:
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - self.LOG_WIDGET_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+
+    def _apply_log_filters(self, event=None) -> None:
+        ring = self.log_ring
+        ring.min_severity = LOG_SEVERITIES.index(self.log_severity_var.get())
+        ring.categories = {name for name, var in self.log_category_vars.items() if var.get()}
+        self._flush_log()
+        lines = ring.filtered(self.LOG_WIDGET_LINES)
         self.log_text.configure(state="normal")
-        self.log_text.insert(tk.END, message + "\n")
+        self.log_text.delete("1.0", tk.END)
+        if lines:
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
         self.log_text.see(tk.END)
         self.log_text.configure(state="disabled")
 
     def _toggle_connection(self) -> None:
+        if self.reconnect_port is not None:
+            self._cancel_reconnect()
+            return
         if self.serial_port:
             self._disconnect()
         else:
             self._connect()
 
-    def _connect(self) -> None:
+    def _connect(self, resume: bool = False) -> bool:
         port = self.port_var.get().strip()
         if not port:
             self._log("ERR: COM port is empty.")
-            return
+            return False
 
         try:
             baud = int(self.baud_var.get())
         except ValueError:
             self._log("ERR: baud must be a number.")
-            return
+            return False
 
         try:
-            self.serial_port = serial.Serial(port, baudrate=baud, timeout=0.1)
+            if self.acquisition_process_var.get():
+                # The child owns the port; the proxy takes writes and status like a serial.Serial.
+                # It reports "opened" on its event pipe; a failure arrives as a lost link.
+                self.acquisition = AcquisitionProcess(port, baud)
+                self.serial_port = self.acquisition
+            else:
+                self.serial_port = serial.Serial(port, baudrate=baud, timeout=0.1)
         except serial.SerialException as exc:
             self._log(f"ERR: failed to open {port}: {exc}")
             self.serial_port = None
-            return
+            self.acquisition = None
+            return False
 
         self.stop_event.clear()
-        self.reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
+        self.rx_queue.resume()
+        if not resume:
+            # A reconnect keeps the timebase so samples after the gap line up with those before.
+            self.clock = ClockModel()
+            self.link.next_ms = None
+            self.last_device_time = None
+        # The device may have restarted while we were away; its timestamps start over.
+        self.link.recent_t0.clear()
+        self.event_driven = self.event_driven_var.get()
+        self.reader_thread = threading.Thread(
+            target=self._reader_loop, name="serial-reader", daemon=True
+        )
         self.reader_thread.start()
 
         self.connect_button.configure(text="Disconnect")
-        self._log(f"Connected to {port} @ {baud}")
+        mode = " (acquisition process)" if self.acquisition is not None else ""
+        self._log(f"Connected to {port} @ {baud}{mode}")
+        self._route_recording()
+        self.connected_identity = None
+        for info in self.port_infos or _list_ports():
+            if info.device == port:
+                self.connected_identity = _port_identity(info)
+        self.tx_writer = CommandWriter(self._write_serial, self._post_tx_event)
+        self.tx_writer.start()
+        # Firmware with a channel schema announces it; older firmware ignores the request.
+        self._queue_command(GetSchema().encode(), expect="SCHEMA=", retries=0)
+        return True
 
     def _disconnect(self) -> None:
+        self._stop_profile_stream()
+        if self.tx_writer is not None:
+            self.tx_writer.stop()
+            self.tx_writer = None
         self.stop_event.set()
+        self.rx_queue.interrupt()
         if self.reader_thread and self.reader_thread.is_alive():
             self.reader_thread.join(timeout=1.0)
 
+        self.acquisition = None
         if self.serial_port:
             self.serial_port.close()
             self.serial_port = None
@@ -498,17 +4194,197 @@ class CdcGuiApp:
         self.connect_button.configure(text="Connect")
         self._log("Disconnected.")
 
+    def _route_recording(self) -> None:
+        # The file is written by whoever sees every sample: the acquisition process if there is one.
+        if not self.recording:
+            return
+        if self.acquisition is not None:
+            self._stop_recorder()
+            self.acquisition.condition(self._record_conditioning())
+            self.acquisition.record(self.record_path, append=True)
+        elif self.recorder is None:
+            try:
+                self._start_recorder(self.record_path, append=True)
+            except OSError as exc:
+                self._log(f"ERR: failed to reopen CSV: {exc}")
+                self._stop_recording()
+
     def _refresh_ports(self) -> None:
-        ports = [info.device for info in list_ports.comports()]
+        self._set_port_list(_list_ports())
+
+    def _set_port_list(self, infos) -> None:
+        self.port_infos = list(infos)
+        ports = [info.device for info in self.port_infos]
         self.port_combo["values"] = ports
+        self.session_port_combo["values"] = ports
         if ports and not self.port_var.get():
             self.port_var.set(ports[0])
 
+    def _toggle_port_monitor(self) -> None:
+        if self.port_monitor is not None:
+            self.port_monitor.stop()
+            self.port_monitor = None
+        if self.hotplug_var.get():
+            self.port_monitor = PortMonitor(self._post_ports_changed)
+            self.port_monitor.start()
+
+    def _post_ports_changed(self, infos) -> None:
+        self.ui_events.put((self._on_ports_changed, (infos,)))
+        self._notify_rx()
+
+    def _on_ports_changed(self, infos) -> None:
+        self._set_port_list(infos)
+        identities = {_port_identity(info): info.device for info in infos}
+        if self.serial_port is not None:
+            port = self.serial_port.port
+            if port not in identities.values():
+                self._on_link_lost(f"device {port} was removed")
+        if self.reconnect_identity is not None and self.reconnect_identity in identities:
+            # The device is back; try now instead of waiting out the backoff.
+            self._attempt_reconnect()
+
+    def _post_link_lost(self, port, exc) -> None:
+        # Called from the reader thread after its last data has been queued.
+        self.ui_events.put((self._on_link_lost, (str(exc), port)))
+        self._notify_rx()
+
+    def _on_link_lost(self, reason: str, port=None) -> None:
+        # A late error from a reader whose port was already replaced is ignored.
+        if self.serial_port is None or (port is not None and port is not self.serial_port):
+            return
+        port = self.serial_port.port
+        self._log(f"ERR: connection to {port} lost: {reason}")
+        self._mark_gap()
+        self._disconnect()
+        if not self.auto_reconnect_var.get():
+            return
+        if self.reconnect_port is not None:
+            # An acquisition process that never opened the port: the attempt failed.
+            self._reconnect_failed()
+            return
+        self.reconnect_port = port
+        self.reconnect_identity = self.connected_identity
+        self.reconnect_attempt = 0
+        self.reconnect_started = time.monotonic()
+        self.connect_button.configure(text="Cancel Reconnect")
+        self._schedule_reconnect()
+
+    def _schedule_reconnect(self) -> float:
+        delay = min(self.RECONNECT_BASE_S * (2 ** self.reconnect_attempt), self.RECONNECT_MAX_S)
+        self.reconnect_after_id = self.root.after(int(delay * 1000), self._attempt_reconnect)
+        return delay
+
+    def _attempt_reconnect(self) -> None:
+        if self.reconnect_after_id is not None:
+            self.root.after_cancel(self.reconnect_after_id)
+            self.reconnect_after_id = None
+        if self.reconnect_port is None or self.serial_port is not None:
+            return
+        device = self.reconnect_port
+        for info in self.port_infos:
+            if _port_identity(info) == self.reconnect_identity:
+                device = info.device
+        self.reconnect_attempt += 1
+        self.port_var.set(device)
+        if not self._connect(resume=True):
+            self._reconnect_failed()
+            return
+        if self.acquisition is None:
+            self._finish_reconnect()
+
+    def _reconnect_failed(self) -> None:
+        delay = self._schedule_reconnect()
+        self.connect_button.configure(text="Cancel Reconnect")
+        self._log(f"Reconnect attempt {self.reconnect_attempt} failed; retrying in {delay:.2f} s.")
+
+    def _finish_reconnect(self) -> None:
+        gap_s = time.monotonic() - self.reconnect_started
+        self._log(
+            f"Reconnected to {self.serial_port.port} after {gap_s:.1f} s "
+            f"({self.reconnect_attempt} attempts); restoring gains and sample time."
+        )
+        self.reconnect_port = None
+        self.reconnect_identity = None
+        self._update_controller()
+
+    def _on_acquisition_opened(self, link: AcquisitionProcess) -> None:
+        if link is not self.acquisition:
+            return
+        self._log(f"Acquisition process opened {link.port}.")
+        if self.reconnect_port is not None:
+            self._finish_reconnect()
+
+    def _cancel_reconnect(self) -> None:
+        if self.reconnect_after_id is not None:
+            self.root.after_cancel(self.reconnect_after_id)
+            self.reconnect_after_id = None
+        self.reconnect_port = None
+        self.reconnect_identity = None
+        self.connect_button.configure(text="Connect")
+        self._log("Reconnect cancelled.")
+
+    def _mark_gap(self) -> None:
+        # NaN rows break plotted lines and tell CSV readers that samples are missing here.
+        if self.recorder is not None:
+            self.recorder.mark_gap()
+        if self.plot_times:
+            self.plot_times.append(self.plot_times[-1])
+            self.plot_target.append(float("nan"))
+            self.plot_actual.append(float("nan"))
+            self._extend_extras(None, 1)
+            self.plot_dirty = True
+
     def _auto_detect_port(self) -> None:
+        if self.probe_thread is not None and self.probe_thread.is_alive():
+            return
+        try:
+            baud = int(self.baud_var.get())
+        except ValueError:
+            self._log("ERR: baud must be a number.")
+            return
+        candidates = _list_ports()
+        busy = set(self.sessions)
+        if self.serial_port is not None:
+            busy.add(self.serial_port.port)
+        devices = [info.device for info in candidates if info.device not in busy]
+        self._log(f"Probing {len(devices)} port(s) for a PID controller...")
+
+        def probe() -> None:
+            results = _probe_ports(devices, baud, self.PROBE_TIMEOUT_S)
+            self.ui_events.put((self._on_probe_done, (candidates, results)))
+            self._notify_rx()
+
+        self.probe_thread = threading.Thread(target=probe, name="port-probe", daemon=True)
+        self.probe_thread.start()
+
+    def _on_probe_done(self, candidates, results: dict) -> None:
+        target_vid = self._parse_hex(self.vid_var.get())
+        target_pid = self._parse_hex(self.pid_var.get())
+        responders = []
+        for info in candidates:
+            latency = results.get(info.device)
+            if latency is None:
+                continue
+            matches = (target_vid is None or info.vid == target_vid) and (
+                target_pid is None or info.pid == target_pid
+            )
+            responders.append((not matches, latency, info.device))
+        responders.sort()
+        if responders:
+            ranking = ", ".join(
+                f"{device} {latency * 1000.0:.0f} ms" for _, latency, device in responders
+            )
+            best = responders[0][2]
+            self.port_var.set(best)
+            self._log(f"Auto-detected port: {best} (responders: {ranking})")
+            return
+        self._log("No port answered GETPID; falling back to USB descriptors.")
+        self._detect_port_by_descriptor(candidates)
+
+    def _detect_port_by_descriptor(self, candidates) -> None:
         target_vid = self._parse_hex(self.vid_var.get())
         target_pid = self._parse_hex(self.pid_var.get())
 
-        candidates = list_ports.comports()
         best = None
 
         for info in candidates:
@@ -541,6 +4417,119 @@ class CdcGuiApp:
         else:
             self._log("ERR: no COM ports found.")
 
+    def _add_session(self) -> None:
+        port = self.session_port_var.get().strip()
+        if not port:
+            self._log("ERR: choose a port for the additional device.")
+            return
+        if port in self.sessions or (self.serial_port and port == self.port_var.get().strip()):
+            self._log(f"ERR: {port} is already open.")
+            return
+        try:
+            baud = int(self.baud_var.get())
+        except ValueError:
+            self._log("ERR: baud must be a number.")
+            return
+        session = DeviceSession(port, baud)
+        try:
+            session.open(self._notify_rx, self.event_driven_var.get())
+        except serial.SerialException as exc:
+            self._log(f"ERR: failed to open {port}: {exc}")
+            session.close()
+            return
+        self._build_live_plot()
+        session.target_line, = self.axes.plot([], [], linestyle="--", label=f"{port} target")
+        session.actual_line, = self.axes.plot([], [], label=f"{port} actual")
+        self.axes.legend(loc="upper right")
+        self.sessions[port] = session
+        self.session_tree.insert("", tk.END, iid=port, text=port, values=("--", 0, "--", "no"))
+        self._log(f"Connected additional device {port} @ {baud}")
+
+    def _remove_session(self) -> None:
+        for port in self.session_tree.selection():
+            session = self.sessions.pop(port, None)
+            if session is None:
+                continue
+            session.close()
+            session.target_line.remove()
+            session.actual_line.remove()
+            self.session_tree.delete(port)
+            self._log(f"Disconnected additional device {port}")
+        self.axes.legend(loc="upper right")
+
+    def _toggle_session_recording(self) -> None:
+        for port in self.session_tree.selection():
+            session = self.sessions.get(port)
+            if session is None:
+                continue
+            if session.recorder is not None:
+                session.stop_recording()
+                self._log(f"[{port}] Recording stopped.")
+                continue
+            filepath = filedialog.asksaveasfilename(
+                title=f"Save CSV for {port}",
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv")],
+            )
+            if not filepath:
+                continue
+            try:
+                session.start_recording(filepath)
+            except OSError as exc:
+                self._log(f"ERR: failed to open CSV: {exc}")
+                continue
+            self._log(f"[{port}] Recording started: {filepath}")
+
+    def _poll_sessions(self) -> None:
+        for port, session in self.sessions.items():
+            for message in session.drain():
+                self._log(f"[{port}] {message}")
+            metrics = session.metrics()
+            self.session_tree.item(
+                port,
+                values=(
+                    f"{metrics['rate']:.1f}" if metrics["rate"] is not None else "--",
+                    metrics["samples"],
+                    f"{metrics['rms_error']:.4g}" if metrics["rms_error"] is not None else "--",
+                    "yes" if metrics["recording"] else "no",
+                ),
+            )
+
+    def _broadcast_command(self) -> None:
+        command = self.broadcast_var.get().strip()
+        if not command:
+            self._log("ERR: broadcast command is empty.")
+            return
+        writers = [session.writer for session in self.sessions.values()]
+        if self.broadcast_primary_var.get() and self.serial_port and self.serial_port.is_open:
+            if self.group_writer is None:
+                self.group_writer = PortWriter(self._write_serial)
+                self.group_writer.start()
+            writers.append(self.group_writer)
+        if not writers:
+            self._log("ERR: no devices to broadcast to.")
+            return
+        count = len(writers)
+        _broadcast(
+            writers,
+            f"{command}\n".encode("utf-8"),
+            lambda skew_s, errors: self._post_broadcast_done(command, count, skew_s, errors),
+        )
+
+    def _post_broadcast_done(
+        self, command: str, count: int, skew_s: float, errors: list[str]
+    ) -> None:
+        # Called from the last writer thread to finish.
+        self.ui_events.put((self._on_broadcast_done, (command, count, skew_s, errors)))
+        self._notify_rx()
+
+    def _on_broadcast_done(
+        self, command: str, count: int, skew_s: float, errors: list[str]
+    ) -> None:
+        for error in errors:
+            self._log(f"ERR: broadcast write failed: {error}")
+        self._log(f"TX (group of {count}): {command} (skew {skew_s * 1e6:.0f} us)")
+
     @staticmethod
     def _parse_hex(value: str) -> int | None:
         text = value.strip().lower()
@@ -566,18 +4555,9 @@ class CdcGuiApp:
             self._log("ERR: PID values must be numbers.")
             return False
 
-        payload = f"P={p_val},I={i_val},D={d_val}\n"
-        self.serial_port.write(payload.encode("utf-8"))
-        self._log(f"TX: {payload.strip()}")
-        if response_type == "Step":
-            self.pending_step_start = True
-            self.last_target = None
-        else:
-            self.step_active = False
-            self.step_target = None
-            self.step_start_time = None
-        if duration is not None:
-            self._set_response_plot_duration(duration)
+        payload = SetGains(p_val, i_val, d_val).encode()
+        self._queue_command(payload)
+        self._log(f"TX: {payload}")
         return True
 
     def _send_sample_time(self) -> bool:
@@ -589,9 +4569,9 @@ class CdcGuiApp:
             self._log("ERR: not connected.")
             return False
 
-        payload = f"TS={sample_time_ms}\n"
-        self.serial_port.write(payload.encode("utf-8"))
-        self._log(f"TX: {payload.strip()}")
+        payload = SetSampleTime(sample_time_ms).encode()
+        self._queue_command(payload)
+        self._log(f"TX: {payload}")
         return True
 
     def _update_controller(self) -> None:
@@ -618,22 +4598,20 @@ class CdcGuiApp:
             except ValueError:
                 self._log("ERR: relay tuning parameters must be numeric.")
                 return
-            payload = (
-                f"TUNE=RELAY,SP={sp},FS={fs},D={d},H={h},CYC={cycles},"
-                f"PV_MIN={pv_min},PV_MAX={pv_max}\n"
-            )
+            payload = StartRelayTune(sp, fs, d, h, cycles, pv_min, pv_max).encode()
         else:
-            payload = f"TUNE={method}\n"
-        self.serial_port.write(payload.encode("utf-8"))
-        self._log(f"TX: {payload.strip()}")
+            payload = StartTune(method).encode()
+        # A resend would restart the autotune on the plant.
+        self._queue_command(payload, expect="TUNE=", retries=0)
+        self._log(f"TX: {payload}")
 
     def _send_tune_stop(self) -> None:
         if not self.serial_port or not self.serial_port.is_open:
             self._log("ERR: not connected.")
             return
-        payload = "TUNE=STOP\n"
-        self.serial_port.write(payload.encode("utf-8"))
-        self._log("TX: TUNE=STOP")
+        payload = StopTune().encode()
+        self._queue_command(payload)
+        self._log(f"TX: {payload}")
 
     def _update_tune_fields(self, event=None) -> None:
         method = self.tuning_method_var.get().strip()
@@ -646,17 +4624,18 @@ class CdcGuiApp:
         if not self.serial_port or not self.serial_port.is_open:
             self._log("ERR: not connected.")
             return
-        payload = "GETPID\n"
-        self.serial_port.write(payload.encode("utf-8"))
-        self._log("TX: GETPID")
+        payload = GetPid().encode()
+        self._queue_command(payload, expect="PID=")
+        self._log(f"TX: {payload}")
 
     def _send_estop(self) -> None:
+        self._stop_profile_stream()
         if not self.serial_port or not self.serial_port.is_open:
             self._log("ERR: not connected.")
             return
-        payload = "ESTOP\n"
-        self.serial_port.write(payload.encode("utf-8"))
-        self._log("TX: ESTOP")
+        payload = EStop().encode()
+        self._queue_command(payload, priority=True)
+        self._log(f"TX: {payload}")
 
     def _validate_sample_time(self) -> float | None:
         try:
@@ -751,28 +4730,25 @@ class CdcGuiApp:
 
             if response_type == "Setpoint":
                 setpoint = float(self.setpoint_var.get())
-                if duration is None:
-                    payload = f"SETPOINT={setpoint},SEQ={seq}\n"
-                else:
-                    payload = f"SETPOINT={setpoint},{duration},SEQ={seq}\n"
+                message = Response("SETPOINT", (setpoint,), duration, seq)
             elif response_type == "Step":
                 if duration is None:
                     self._log("ERR: response time is required.")
                     return
                 amplitude = float(self.step_var.get())
-                payload = f"STEP={amplitude},{duration},SEQ={seq}\n"
+                message = Response("STEP", (amplitude,), duration, seq)
             elif response_type == "Ramp":
                 if duration is None:
                     self._log("ERR: response time is required.")
                     return
                 slope = float(self.ramp_var.get())
-                payload = f"RAMP={slope},{duration},SEQ={seq}\n"
+                message = Response("RAMP", (slope,), duration, seq)
             elif response_type == "Accel":
                 if duration is None:
                     self._log("ERR: response time is required.")
                     return
                 accel = float(self.accel_var.get())
-                payload = f"ACCEL={accel},{duration},SEQ={seq}\n"
+                message = Response("ACCEL", (accel,), duration, seq)
             elif response_type == "Sine":
                 if duration is None:
                     self._log("ERR: response time is required.")
@@ -787,7 +4763,7 @@ class CdcGuiApp:
                 if freq > max_freq:
                     self._log(f"ERR: sine frequency must be <= {max_freq:g} Hz.")
                     return
-                payload = f"SINE={amp},{freq},{offset},{duration},SEQ={seq}\n"
+                message = Response("SINE", (amp, freq, offset), duration, seq)
                 if freq >= 0.5 * self.RX_RATE_HZ:
                     self._log(
                         f"WARN: sine freq {freq:g} Hz is near/above Nyquist "
@@ -797,160 +4773,1482 @@ class CdcGuiApp:
                 self._log("ERR: unknown response type.")
                 return
         except ValueError:
-            self._log("ERR: response parameters must be numbers.")
+            self._log("ERR: response parameters must be numbers.")
+            return
+
+        self._queue_response(message)
+
+    def _queue_response(self, message: Response) -> None:
+        payload = message.encode()
+        # A resend re-fires the excitation unless the device is known to drop duplicate SEQs.
+        writer = self.tx_writer
+        retries = None if writer is not None and writer.seq_acked else 0
+        self._queue_command(payload, seq=message.seq, retries=retries, track_effect=True)
+        self._log(f"TX: {payload}")
+        if message.kind == "STEP":
+            self.pending_step_start = True
+            self.last_target = None
+        else:
+            self.step_active = False
+            self.step_target = None
+            self.step_start_time = None
+        if message.duration is not None:
+            self._set_response_plot_duration(message.duration)
+
+    def _update_profile_fields(self, event=None) -> None:
+        for label, entry in self.profile_widgets.values():
+            label.grid_remove()
+            entry.grid_remove()
+        self.profile_csv_button.grid_remove()
+        self.profile_csv_label.grid_remove()
+
+        shape = self.profile_shape_var.get()
+        if shape == "Chirp":
+            keys = ["amp", "offset", "duration", "f0", "f1"]
+        elif shape == "PRBS":
+            keys = ["amp", "offset", "duration", "f0", "hold"]
+        elif shape == "Multisine":
+            keys = ["amp", "offset", "duration", "f0", "f1", "tones"]
+        elif shape == "Trapezoid":
+            keys = ["amp", "offset", "duration", "ramp"]
+        else:
+            keys = []
+            self.profile_csv_button.grid(row=1, column=0, sticky=tk.W, pady=(6, 0))
+            self.profile_csv_label.grid(
+                row=1, column=1, columnspan=5, padx=6, sticky=tk.W, pady=(6, 0)
+            )
+        for i, key in enumerate(keys):
+            label, entry = self.profile_widgets[key]
+            row = 1 + i // 4
+            column = (i % 4) * 2
+            label.grid(row=row, column=column, sticky=tk.W, pady=(6, 0))
+            entry.grid(row=row, column=column + 1, padx=6, sticky=tk.W, pady=(6, 0))
+
+    def _choose_profile_csv(self) -> None:
+        filepath = filedialog.askopenfilename(
+            title="Load Profile CSV",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+        )
+        if not filepath:
+            return
+        self.profile_csv_path = filepath
+        self.profile_csv_var.set(filepath)
+
+    def _build_profile(self, sample_time_s: float) -> np.ndarray | None:
+        shape = self.profile_shape_var.get()
+        self.profile_period = None
+        self.profile_sample_time_s = sample_time_s
+        try:
+            if shape == "CSV":
+                if not self.profile_csv_path:
+                    self._log("ERR: choose a profile CSV first.")
+                    return None
+                return _load_csv_profile(self.profile_csv_path, sample_time_s)
+            amp = float(self.profile_amp_var.get())
+            offset = float(self.profile_offset_var.get())
+            duration = float(self.profile_duration_var.get())
+            if shape == "Chirp":
+                f0 = float(self.profile_f0_var.get())
+                f1 = float(self.profile_f1_var.get())
+                return _chirp_profile(amp, offset, f0, f1, duration, sample_time_s)
+            if shape == "PRBS":
+                f0 = float(self.profile_f0_var.get())
+                hold = int(float(self.profile_hold_var.get()))
+                values, self.profile_period = _prbs_profile(
+                    amp, offset, f0, hold, duration, sample_time_s
+                )
+                return values
+            if shape == "Multisine":
+                f0 = float(self.profile_f0_var.get())
+                f1 = float(self.profile_f1_var.get())
+                tones = int(float(self.profile_tones_var.get()))
+                values, self.profile_period = _multisine_profile(
+                    amp, offset, f0, f1, tones, duration, sample_time_s
+                )
+                return values
+            if shape == "Trapezoid":
+                ramp = float(self.profile_ramp_var.get())
+                return _trapezoid_profile(amp, offset, ramp, duration, sample_time_s)
+        except OSError as exc:
+            self._log(f"ERR: failed to read profile CSV: {exc}")
+            return None
+        except ValueError as exc:
+            self._log(f"ERR: invalid profile parameters: {exc}")
+            return None
+        self._log("ERR: unknown profile shape.")
+        return None
+
+    def _identify_frf(self) -> None:
+        if self.profile_period is None or self.profile_sample_time_s is None:
+            self._log("ERR: stream a PRBS or Multisine profile before identifying.")
+            return
+        if len(self.response_plot_times) < 2:
+            self._log("ERR: no response capture to identify from.")
+            return
+        start = time.perf_counter()
+        try:
+            freqs, response, coherence = _estimate_frf(
+                self.response_plot_times,
+                self.response_plot_target,
+                self.response_plot_actual,
+                self.profile_sample_time_s,
+                self.profile_period,
+                self.profile_count,
+            )
+        except ValueError as exc:
+            self._log(f"ERR: identification failed: {exc}")
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        self.frf_result = (freqs, response, coherence)
+        self._log(
+            f"FRF: {len(freqs)} lines {freqs[0]:.3g}-{freqs[-1]:.3g} Hz, "
+            f"mean coherence {np.mean(coherence):.3f} ({elapsed_ms:.1f} ms)"
+        )
+        self._show_frf_plot()
+
+    def _show_frf_plot(self) -> None:
+        if self.frf_result is None:
+            return
+        if self.frf_window is not None:
+            try:
+                self.frf_window.destroy()
+            except tk.TclError:
+                pass
+        freqs, response, coherence = self.frf_result
+        self.frf_window = tk.Toplevel(self.root)
+        self.frf_window.title("Frequency Response")
+        self.frf_window.geometry("700x500")
+
+        Figure, FigureCanvasTkAgg = _plotting()
+        figure = Figure(figsize=(5, 4), dpi=100)
+        mag_axes = figure.add_subplot(211)
+        phase_axes = figure.add_subplot(212, sharex=mag_axes)
+        magnitude_db = 20.0 * np.log10(np.maximum(np.abs(response), 1e-12))
+        phase_deg = np.degrees(np.unwrap(np.angle(response)))
+        mag_axes.semilogx(freqs, magnitude_db, ".-")
+        mag_axes.set_ylabel("Magnitude (dB)")
+        mag_axes.grid(True, which="both", alpha=0.3)
+        phase_axes.semilogx(freqs, phase_deg, ".-")
+        phase_axes.set_xlabel("Frequency (Hz)")
+        phase_axes.set_ylabel("Phase (deg)")
+        phase_axes.grid(True, which="both", alpha=0.3)
+        figure.tight_layout()
+
+        canvas = FigureCanvasTkAgg(figure, master=self.frf_window)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        controls = ttk.Frame(self.frf_window, padding=(8, 4))
+        controls.pack(fill=tk.X)
+        ttk.Button(controls, text="Save CSV", command=self._save_frf_data).pack(side=tk.LEFT)
+        ttk.Label(
+            controls, text=f"Mean coherence: {np.mean(coherence):.3f}"
+        ).pack(side=tk.LEFT, padx=10)
+
+    def _save_frf_data(self) -> None:
+        if self.frf_result is None:
+            return
+        filepath = filedialog.asksaveasfilename(
+            title="Save Frequency Response CSV",
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv")],
+        )
+        if not filepath:
+            return
+        freqs, response, coherence = self.frf_result
+        try:
+            with open(filepath, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["freq_hz", "magnitude", "phase_deg", "coherence"])
+                for freq, value, coh in zip(freqs, response, coherence):
+                    writer.writerow(
+                        [
+                            f"{freq:.6f}",
+                            f"{abs(value):.6g}",
+                            f"{np.degrees(np.angle(value)):.3f}",
+                            f"{coh:.4f}",
+                        ]
+                    )
+        except OSError as exc:
+            self._log(f"ERR: failed to save frequency response: {exc}")
+            return
+        self._log(f"Saved frequency response: {filepath}")
+
+    def _choose_trigger_dir(self) -> None:
+        directory = filedialog.askdirectory(title="Trigger Capture Folder")
+        if directory:
+            self.trigger_dir = directory
+            self._log(f"Trigger captures will be saved to {directory}")
+
+    def _arm_trigger(self) -> None:
+        try:
+            level = float(self.trigger_level_var.get())
+            pre_s = float(self.trigger_pre_var.get())
+            post_s = float(self.trigger_post_var.get())
+            self.trigger.configure(
+                self.trigger_mode_var.get(),
+                self.trigger_condition_var.get(),
+                level,
+                pre_s,
+                post_s,
+            )
+        except ValueError as exc:
+            self._log(f"ERR: invalid trigger settings: {exc}")
+            return
+        if self.trigger_output_var.get() == "File" and not self.trigger_dir:
+            self._choose_trigger_dir()
+            if not self.trigger_dir:
+                return
+        self.trigger.arm()
+        self.trigger_status_var.set(
+            f"Trigger: armed ({self.trigger.mode}, {self.trigger.condition})"
+        )
+
+    def _disarm_trigger(self) -> None:
+        self.trigger.disarm()
+        self.trigger_status_var.set("Trigger: idle")
+
+    def _feed_trigger(self, times, targets, actuals) -> None:
+        if not times:
+            return
+        for capture in self.trigger.push(times, targets, actuals):
+            self._on_trigger_capture(capture)
+
+    def _on_trigger_capture(self, capture: tuple) -> None:
+        trigger_time, forced, times, targets, actuals = capture
+        self.trigger_capture_count += 1
+        label = "auto" if forced else "trigger"
+        self.trigger_status_var.set(
+            f"Trigger: {self.trigger_capture_count} captures, last {label} @ {trigger_time:.3f}s"
+            + ("" if self.trigger.armed else " (stopped)")
+        )
+        if self.trigger_output_var.get() == "File" and self.trigger_dir:
+            stamp = time.strftime("%Y%m%d_%H%M%S")
+            filepath = os.path.join(
+                self.trigger_dir, f"trigger_{stamp}_{self.trigger_capture_count:04d}.csv"
+            )
+            try:
+                self._write_response_csv(filepath, times, targets, actuals)
+            except OSError as exc:
+                self._log(f"ERR: failed to save trigger capture: {exc}")
+                return
+            self._log(f"Saved trigger capture: {filepath}")
+        else:
+            self._show_trigger_capture(trigger_time, times, targets, actuals)
+
+    def _show_trigger_capture(self, trigger_time: float, times, targets, actuals) -> None:
+        window = tk.Toplevel(self.root)
+        window.title(f"Trigger Capture {self.trigger_capture_count} @ {trigger_time:.3f}s")
+        window.geometry("700x400")
+        Figure, FigureCanvasTkAgg = _plotting()
+        figure = Figure(figsize=(5, 3), dpi=100)
+        axes = figure.add_subplot(111)
+        axes.plot(times, targets, label="Target")
+        axes.plot(times, actuals, label="Actual")
+        axes.axvline(0.0, color="gray", linestyle="--", linewidth=1.0)
+        axes.set_xlabel("Time from trigger (s)")
+        axes.set_ylabel("Value")
+        axes.grid(True, alpha=0.3)
+        axes.legend(loc="upper right")
+        canvas = FigureCanvasTkAgg(figure, master=window)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        def _save() -> None:
+            filepath = filedialog.asksaveasfilename(
+                title="Save Trigger Capture",
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv")],
+            )
+            if not filepath:
+                return
+            try:
+                self._write_response_csv(filepath, times, targets, actuals)
+            except OSError as exc:
+                self._log(f"ERR: failed to save trigger capture: {exc}")
+                return
+            self._log(f"Saved trigger capture: {filepath}")
+
+        controls = ttk.Frame(window, padding=(8, 4))
+        controls.pack(fill=tk.X)
+        ttk.Button(controls, text="Save CSV", command=_save).pack(side=tk.LEFT)
+
+    def _queue_command(
+        self,
+        payload: str,
+        seq: int | None = None,
+        expect: str | None = None,
+        retries: int | None = None,
+        track_effect: bool = False,
+        priority: bool = False,
+    ) -> None:
+        if self.tx_writer is None:
+            self._write_serial((payload + "\n").encode("utf-8"))
+            return
+        self.tx_writer.submit(
+            payload,
+            seq=seq,
+            expect=expect,
+            retries=retries,
+            track_effect=track_effect,
+            priority=priority,
+        )
+
+    def _post_tx_event(self, kind: str, detail) -> None:
+        # Called from the writer thread; hand off to the Tk thread.
+        self.ui_events.put((self._on_tx_event, (kind, detail)))
+        self._notify_rx()
+
+    def _on_tx_event(self, kind: str, detail) -> None:
+        if kind == "retry":
+            self._log(
+                f"WARN: no ACK for {detail.payload}, retry {detail.attempts}", severity="WARN"
+            )
+        elif kind == "failed":
+            self._log(f"ERR: no ACK for {detail.payload} after {detail.attempts} attempts")
+        elif kind == "error":
+            command, message = detail
+            self._log(f"ERR: write of {command.payload} failed: {message}")
+
+    def _update_tx_stats(self) -> None:
+        if self.tx_writer is None:
+            return
+        stats = self.tx_writer.stats()
+        self.tx_stats_var.set(
+            f"TX {stats['sent']} sent, {stats['acked']} acked, {stats['queued']} queued, "
+            f"{stats['in_flight']} in flight, {stats['timeouts']} timeouts, "
+            f"{stats['failures']} failed\n"
+            f"TX->ACK: {stats['ack']}\n"
+            f"TX->effect: {stats['effect']}\n"
+            f"Write: {stats['write']}"
+        )
+
+    def _reset_tx_stats(self) -> None:
+        if self.tx_writer is not None:
+            self.tx_writer.reset_stats()
+        self.tx_stats_var.set("TX: --")
+
+    def _write_serial(self, data: bytes) -> None:
+        port = self.serial_port
+        if port is None:
+            raise serial.SerialException("port closed")
+        with self.tx_lock:
+            port.write(data)
+
+    def _start_profile_stream(self) -> None:
+        if not self.serial_port or not self.serial_port.is_open:
+            self._log("ERR: not connected.")
+            return
+        if self.profile_streamer is not None and self.profile_streamer.is_alive():
+            self._log("ERR: a profile is already streaming.")
+            return
+        sample_time_ms = self._validate_sample_time()
+        if sample_time_ms is None:
+            return
+        try:
+            chunk = int(float(self.profile_chunk_var.get()))
+            if chunk <= 0:
+                raise ValueError
+        except ValueError:
+            self._log("ERR: chunk must be a positive integer.")
+            return
+        values = self._build_profile(sample_time_ms / 1000.0)
+        if values is None:
+            return
+        if len(values) == 0:
+            self._log("ERR: profile is empty.")
+            return
+        duration = len(values) * sample_time_ms / 1000.0
+        self.profile_count = len(values)
+        self.response_seq += 1
+        self.profile_streamer = ProfileStreamer(
+            values,
+            sample_time_ms,
+            self._write_serial,
+            self._post_profile_event,
+            seq=self.response_seq,
+            chunk=chunk,
+            binary=self.profile_format_var.get() == "Binary",
+        )
+        self._open_response_plot(max(duration + 1.0, 2.0))
+        self.profile_streamer.start()
+        self.profile_status_var.set(f"Profile: streaming {len(values)} samples ({duration:.2f}s)")
+        self._log(
+            f"TX: PROFILE {self.profile_shape_var.get()} N={len(values)} TS={sample_time_ms:g} "
+            f"SEQ={self.response_seq}"
+        )
+
+    def _stop_profile_stream(self) -> None:
+        if self.profile_streamer is not None and self.profile_streamer.is_alive():
+            self.profile_streamer.stop()
+
+    def _post_profile_event(self, kind: str, message: str | None) -> None:
+        # Called from the streamer thread; hand off to the Tk thread.
+        self.ui_events.put((self._on_profile_event, (kind, message)))
+        self._notify_rx()
+
+    def _on_profile_event(self, kind: str, message: str | None) -> None:
+        if kind == "done":
+            self.profile_status_var.set("Profile: done")
+            self._log("Profile stream complete.")
+            if self.profile_period is not None:
+                self._identify_frf()
+        elif kind == "stopped":
+            self.profile_status_var.set("Profile: stopped")
+            self._log("TX: PROFILE=ABORT")
+        else:
+            self.profile_status_var.set("Profile: error")
+            self._log(f"ERR: {message}")
+
+    def _on_profile_ack(self, message: ProfileAck) -> None:
+        # The reader thread already credited the streamer (_route_profile_text); crediting
+        # again here could roll FREE back to an older value.
+        streamer = self.profile_streamer
+        if streamer is None:
+            return
+        self.profile_status_var.set(
+            f"Profile: {streamer.sent}/{len(streamer.values)} sent, device free {message.free}"
+        )
+
+    def _on_profile_status(self, message: ProfileStatus) -> None:
+        streamer = self.profile_streamer
+        if streamer is None:
+            return
+        if message.state == "READY":
+            if message.capacity is None or message.capacity <= 0:
+                streamer.on_error(f"bad profile capacity: {message.encode()}")
+            else:
+                streamer.on_ready(message.capacity)
+        elif message.state.startswith("DONE"):
+            streamer.on_done()
+        elif message.state.startswith("ERR"):
+            streamer.on_error(f"device rejected profile: {message.encode()}")
+
+    def _toggle_time_entry(self) -> None:
+        state = "normal" if self.use_time_var.get() else "disabled"
+        self.time_entry.configure(state=state)
+
+    def _reader_loop(self) -> None:
+        if self.acquisition is not None:
+            self._acquisition_events(self.acquisition)
+            return
+        port = self.serial_port
+        _serial_reader(
+            port,
+            self.stop_event,
+            self.rx_queue,
+            self._notify_rx if self.event_driven else None,
+            self.event_driven,
+            lambda exc: self._post_link_lost(port, exc),
+            self._route_profile_text,
+        )
+
+    def _route_profile_text(self, text: str) -> None:
+        streamer = self.profile_streamer
+        if streamer is not None and streamer.is_alive():
+            streamer.feed_text(text)
+
+    def _acquisition_events(self, link: AcquisitionProcess) -> None:
+        # Status lines from the child join the normal RX path; samples stay in the ring.
+        seen = 0
+        deadline = time.monotonic() + link.OPEN_TIMEOUT_S
+        while not self.stop_event.is_set():
+            try:
+                event = link.events.recv() if link.events.poll(0.02) else None
+            except (EOFError, OSError) as exc:
+                event = ("lost", f"acquisition process exited: {exc}")
+            if event is None and not link.opened and time.monotonic() > deadline:
+                event = ("error", "acquisition process did not start")
+            if event is not None:
+                kind, detail = event
+                if kind == "opened":
+                    link.opened = True
+                    self.ui_events.put((self._on_acquisition_opened, (link,)))
+                elif kind == "error":
+                    self._post_link_lost(link, f"failed to open port: {detail}")
+                    return
+                elif kind == "schema":
+                    gen, spec = detail
+                    # Registered before the SCHEMA line is queued and before rows of this
+                    # generation can be read; see _drain_ring.
+                    link.schemas[gen] = ChannelSchema.parse(spec)
+                elif kind == "lines":
+                    text = "\n".join(detail) + "\n"
+                    self._route_profile_text(text)
+                    self.rx_queue.put(text)
+                elif kind == "log":
+                    self.ui_events.put((self._log, (detail,)))
+                elif kind == "record_path":
+                    self.ui_events.put((self._on_record_rotated, (detail,)))
+                elif kind == "lost":
+                    self.rx_queue.put(f"!ERR: serial read failed: {detail}\n")
+                    self._post_link_lost(link, detail)
+                    return
+            published = link.ring.published()
+            if self.event_driven and (event is not None or published != seen):
+                seen = published
+                self._notify_rx()
+
+    def _setup_wakeup(self) -> None:
+        if os.name == "posix":
+            try:
+                read_fd, write_fd = os.pipe()
+                os.set_blocking(read_fd, False)
+                os.set_blocking(write_fd, False)
+                self.root.tk.createfilehandler(read_fd, tk.READABLE, self._on_rx_wake)
+            except (AttributeError, OSError, tk.TclError):
+                self.wake_pipe = None
+            else:
+                self.wake_pipe = (read_fd, write_fd)
+                return
+        self.root.bind("<<RxReady>>", self._on_rx_wake)
+
+    def _notify_rx(self) -> None:
+        # Called from worker threads; coalesce so only one wake-up is outstanding.
+        if self.wake_pending.is_set():
+            return
+        self.wake_pending.set()
+        try:
+            if self.wake_pipe is not None:
+                os.write(self.wake_pipe[1], b"\x00")
+            else:
+                self.root.event_generate("<<RxReady>>", when="tail")
+        except (OSError, RuntimeError, tk.TclError):
+            pass
+
+    def _on_rx_wake(self, *args) -> None:
+        if self.wake_pipe is not None:
+            try:
+                while os.read(self.wake_pipe[0], 4096):
+                    pass
+            except (BlockingIOError, OSError):
+                pass
+        # Clear before draining so data queued meanwhile schedules another wake-up.
+        self.wake_pending.clear()
+        self._drain_queues()
+        if self.plot_dirty and time.monotonic() - self.last_redraw >= self.MIN_REDRAW_S:
+            self._update_plot()
+
+    def _drain_queues(self) -> None:
+        for skipped, lines, arrived_wall in self.rx_queue.drain():
+            self.rx_arrival_wall = arrived_wall
+            if skipped:
+                # Dropped for display; the recorder has the samples, status lines still count.
+                lines = [line for line in lines if not _is_sample_line(line)]
+            else:
+                self.plot_dirty = True
+            if lines:
+                self._handle_rx_lines(lines)
+        if self.acquisition is not None:
+            self._drain_ring()
+        if self.link_headers:
+            t0_ms, dt_ms, counts = zip(*self.link_headers)
+            self.link_headers = []
+            self.link.observe(t0_ms, dt_ms, counts)
+
+        while True:
+            try:
+                callback, args = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+
+        if self.sessions:
+            self._poll_sessions()
+            self.plot_dirty = True
+
+    def _poll_rx_queue(self) -> None:
+        if self.stall_detector is not None:
+            self.stall_detector.beat()
+        start = time.perf_counter()
+        self._drain_queues()
+        if self.plot_dirty:
+            self._update_plot()
+        self._update_overload_status()
+        self._update_tx_stats()
+        self.clock_var.set(self.clock.summary())
+        self._update_telemetry_status()
+        self._update_rpc_status()
+        self.link_var.set(self.link.summary())
+        self._update_diagnostics()
+        self._flush_log()
+        self.perf.add("poll_tick", (time.perf_counter() - start) * 1000.0)
+        self.root.after(100, self._poll_rx_queue)
+
+    def _update_diagnostics(self) -> None:
+        bytes_in = self.rx_queue.bytes_in
+        self.perf.count("bytes_read", bytes_in - self.perf_bytes_mark)
+        self.perf_bytes_mark = bytes_in
+        self.perf.add("queue_depth", self.rx_queue.bytes / 1024.0, unit="KB")
+        now = time.monotonic()
+        self.perf.tick(now)
+        if now < self.diag_next_update:
+            return
+        self.diag_next_update = now + 0.5
+        rows = self.perf.rows()
+        for row in rows:
+            name = row["metric"]
+            values = [self._format_metric(row[field]) for field in PerfMonitor.FIELDS[1:]]
+            if self.diag_tree.exists(name):
+                self.diag_tree.item(name, values=values)
+            else:
+                self.diag_tree.insert("", tk.END, iid=name, text=name, values=values)
+        known = {row["metric"] for row in rows}
+        for item in self.diag_tree.get_children():
+            if item not in known:
+                self.diag_tree.delete(item)
+
+    def _start_profile_capture(self) -> None:
+        if self.sampler is not None:
+            return
+        try:
+            duration = float(self.profiler_duration_var.get())
+            if duration <= 0:
+                raise ValueError
+        except ValueError:
+            self._log("ERR: profile duration must be a positive number of seconds.")
+            return
+        filepath = filedialog.asksaveasfilename(
+            title="Save Profile",
+            defaultextension=".pstats",
+            filetypes=[("pstats files", "*.pstats")],
+        )
+        if not filepath:
+            return
+        self.profile_base = os.path.splitext(filepath)[0]
+        # cProfile hooks only the calling thread; the sampler covers the reader and workers too.
+        self.profiler = cProfile.Profile()
+        self.sampler = SamplingProfiler(duration, self._post_profile_done)
+        self.profiler.enable()
+        self.sampler.start()
+        self.profile_button.configure(state="disabled")
+        self.profiler_status_var.set(f"Profiler: capturing {duration:g} s...")
+
+    def _post_profile_done(self) -> None:
+        self.ui_events.put((self._finish_profile_capture, ()))
+        self._notify_rx()
+
+    def _finish_profile_capture(self) -> None:
+        if self.sampler is None:
+            return
+        self.profiler.disable()
+        pstats_path = f"{self.profile_base}.pstats"
+        folded_path = f"{self.profile_base}.folded"
+        try:
+            self.profiler.dump_stats(pstats_path)
+            self.sampler.write_collapsed(folded_path)
+        except OSError as exc:
+            self._log(f"ERR: failed to save profile: {exc}")
+        else:
+            self._log(
+                f"Profile saved: {pstats_path}, {folded_path} ({self.sampler.samples} samples)"
+            )
+        self.profiler = None
+        self.sampler = None
+        self.profile_button.configure(state="normal")
+        self.profiler_status_var.set("Profiler: idle")
+
+    def _toggle_stall_detector(self) -> None:
+        if self.stall_detector is not None:
+            self.stall_detector.stop()
+            self.stall_detector = None
+        if not self.stall_var.get():
+            return
+        try:
+            threshold_ms = float(self.stall_threshold_var.get())
+            if threshold_ms <= 0:
+                raise ValueError
+        except ValueError:
+            self._log("ERR: stall threshold must be a positive number of ms.")
+            self.stall_var.set(False)
             return
+        self.stall_detector = StallDetector(
+            threading.get_ident(), 0.1, threshold_ms / 1000.0, self._post_stall
+        )
+        self.stall_detector.start()
 
-        self.serial_port.write(payload.encode("utf-8"))
-        self._log(f"TX: {payload.strip()}")
+    def _post_stall(self, blocked_s: float, stack: str) -> None:
+        # The stack is captured while the Tk thread is still blocked; it is logged once it recovers.
+        self.ui_events.put((self._on_stall, (blocked_s, stack)))
+        self._notify_rx()
 
-    def _toggle_time_entry(self) -> None:
-        state = "normal" if self.use_time_var.get() else "disabled"
-        self.time_entry.configure(state=state)
+    def _on_stall(self, blocked_s: float, stack: str) -> None:
+        self.perf.count("stalls")
+        self._log(f"Stall: Tk loop blocked for >{blocked_s * 1000.0:.0f} ms at:\n{stack.rstrip()}")
 
-    def _reader_loop(self) -> None:
-        while not self.stop_event.is_set():
-            try:
-                waiting = self.serial_port.in_waiting if self.serial_port else 0
-                if waiting:
-                    data = self.serial_port.read(waiting)
+    @staticmethod
+    def _format_metric(value) -> str:
+        if value is None:
+            return "--"
+        if isinstance(value, (int, str)):
+            return str(value)
+        return f"{value:.3f}" if abs(value) < 100 else f"{value:.0f}"
+
+    def _export_diagnostics(self) -> None:
+        filepath = filedialog.asksaveasfilename(
+            title="Export Diagnostics",
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv")],
+        )
+        if not filepath:
+            return
+        rows = self.perf.rows()
+        try:
+            with open(filepath, "w", newline="", encoding="utf-8") as f:
+                if filepath.lower().endswith(".csv"):
+                    writer = csv.DictWriter(f, fieldnames=PerfMonitor.FIELDS)
+                    writer.writeheader()
+                    writer.writerows(rows)
                 else:
-                    data = self.serial_port.read(1)
-
-                if data:
-                    try:
-                        text = data.decode("utf-8", errors="replace")
-                    except UnicodeDecodeError:
-                        text = ""
-                    if text:
-                        self.rx_queue.put(text)
-            except serial.SerialException as exc:
-                self.rx_queue.put(f"!ERR: serial read failed: {exc}\n")
-                break
-
-    def _poll_rx_queue(self) -> None:
-        while True:
-            try:
-                message = self.rx_queue.get_nowait()
-            except queue.Empty:
-                break
-            else:
-                self._handle_rx_text(message)
-
-        self._update_plot()
-        self.root.after(100, self._poll_rx_queue)
-
-    def _handle_rx_text(self, text: str) -> None:
-        self.rx_buffer += text
-        if "!ERR:" in text:
-            self._log(text.strip())
-
-        while "\n" in self.rx_buffer:
-            line, self.rx_buffer = self.rx_buffer.split("\n", 1)
-            line = line.strip()
-            if not line:
-                continue
-            if self._should_log_rx(line):
-                self._log(f"RX: {line}")
-            if self._parse_pid_status(line):
-                continue
-            if self._parse_tune_status(line):
+                    json.dump({"timestamp": time.time(), "metrics": rows}, f, indent=2)
+        except OSError as exc:
+            self._log(f"ERR: failed to export diagnostics: {exc}")
+            return
+        self._log(f"Diagnostics exported: {filepath}")
+
+    def _handle_rx_lines(self, lines: list[str]) -> None:
+        self.perf.count("lines_parsed", len(lines))
+        decode = self.codec.decode
+        for line in lines:
+            start = time.perf_counter()
+            message = decode(line)
+            kind = type(message)
+            if kind is Batch:
+                self.perf.add("batch_parse", (time.perf_counter() - start) * 1000.0)
+            elif kind is DeviceError:
+                self._log(line)
                 continue
-            if self._parse_batch(line):
+            if self.tx_writer is not None:
+                self.tx_writer.on_line(line)
+            if kind is ProfileAck:
+                # Flow-control acks arrive per block; keep them out of the log.
+                self._on_profile_ack(message)
                 continue
-            self._parse_target_actual(line)
+            self.rx_pair = None
+            handler = self.rx_handlers.get(kind)
+            if handler is not None:
+                handler(message)
+            if self.telemetry is not None and kind is not Batch and kind is not Sample:
+                self.telemetry.publish(
+                    _telemetry_frame(TELEMETRY_STATUS, line.encode("utf-8", errors="replace"))
+                )
+            if self._should_log_rx(line):
+                self._log(f"RX: {line}", "rx" if self.rx_pair is None else "data")
 
-    def _parse_target_actual(self, line: str) -> None:
-        if "," not in line:
-            return
-        left, right = line.split(",", 1)
+    def _apply_rx_policy(self, event=None) -> None:
         try:
-            target = float(left.strip())
-            actual = float(right.strip())
+            max_kb = float(self.rx_queue_kb_var.get())
+            if max_kb <= 0:
+                raise ValueError
         except ValueError:
+            self._log("ERR: queue size must be a positive number of KB.")
+            return
+        with self.rx_queue.cond:
+            self.rx_queue.policy = self.rx_policy_var.get()
+            self.rx_queue.max_bytes = int(max_kb * 1024)
+            self.rx_queue.cond.notify_all()
+
+    def _update_overload_status(self) -> None:
+        stats = self.rx_queue.stats()
+        if not stats["overloaded"] and not stats["dropped_samples"]:
+            self.rx_overload_var.set("")
             return
-        self._append_sample(target, actual)
+        text = (
+            f"Dropped {stats['dropped_samples']} samples / {stats['dropped_bytes']} B, "
+            f"max queue {stats['max_depth_bytes'] // 1024} KB"
+        )
+        if stats["pause_s"]:
+            text += f", paused {stats['pause_s']:.1f}s"
+        if stats["overloaded"]:
+            text = "OVERLOAD: " + text
+        self.rx_overload_var.set(text)
+
+    def _on_sample(self, message: Sample) -> None:
+        schema = message.schema
+        row = message.row
+        target = float(row[schema.target_index])
+        actual = float(row[schema.actual_index])
+        self.rx_pair = (target, actual)
+        extras = row[schema.extra_indices] if schema is self.schema else None
+        if self.conditioner is not None:
+            self._ingest_samples(
+                [target], [actual], [None], extras[None, :] if extras is not None else None
+            )
+            return
+        elapsed = self._append_sample(target, actual, extras=extras)
+        self._extend_extras(extras[None, :] if extras is not None else None, 1)
+        self._feed_trigger([elapsed], [target], [actual])
+        if self.telemetry is not None:
+            self._publish_samples(
+                [elapsed], [target], [actual], extras[None, :] if extras is not None else None
+            )
+        if self.experiment is not None:
+            self.experiment.link.feed([elapsed], [target], [actual])
+        if self.spectrum is not None:
+            self._feed_spectrum([target], [actual])
 
     def _should_log_rx(self, line: str) -> bool:
-        if line.startswith("B,"):
-            parts = line.split(",")
-            if len(parts) >= 6:
-                try:
-                    target = float(parts[4].strip())
-                    actual = float(parts[5].strip())
-                except ValueError:
-                    target = actual = None
-                pair = (target, actual)
-                if pair == self.last_rx_pair:
-                    return False
-                self.last_rx_pair = pair
-        else:
-            if "," in line:
-                left, right = line.split(",", 1)
-                try:
-                    target = float(left.strip())
-                    actual = float(right.strip())
-                except ValueError:
-                    target = actual = None
-                pair = (target, actual)
-                if pair == self.last_rx_pair:
-                    return False
-                self.last_rx_pair = pair
+        # rx_pair is the first (target, actual) the data parsers decoded from this line.
+        if self.rx_pair is not None:
+            if self.rx_pair == self.last_rx_pair:
+                return False
+            self.last_rx_pair = self.rx_pair
         if line == self.last_rx_line:
             return False
         self.last_rx_line = line
         return True
 
-    def _parse_batch(self, line: str) -> bool:
-        if not line.startswith("B,"):
+    def _accept_batch(self, message: Batch) -> bool:
+        # Feeds the header to the link monitor; False when there are no samples to use.
+        if message.count <= 0:
             return False
-        parts = line.split(",")
-        if len(parts) < 5:
-            return True
+        self.link_headers.append((message.t0_ms, message.dt_ms, message.count))
+        if message.error == "truncated":
+            self.link.truncated += message.count
+        elif message.error is not None:
+            self.link.malformed += 1
+        return message.block is not None
+
+    def _on_bad_batch(self, message: BadBatch) -> None:
+        self.link.malformed += 1
+
+    def _on_batch(self, message: Batch) -> None:
+        if not self._accept_batch(message):
+            return
+        schema = self.schema
+        block = message.block
+        count = message.count
+        targets, actuals, extras = _split_channels(block, schema)
+        self.rx_pair = (targets[0], actuals[0])
+        self.perf.count("batches_parsed")
+        self.perf.count("samples_parsed", count)
+        self._ingest_samples(targets, actuals, message.device_times().tolist(), extras)
+
+    def _drain_ring(self) -> None:
+        link = self.acquisition
+        rows, lost = link.ring.read()
+        if lost:
+            # Only the display missed these; the acquisition process recorded them.
+            with self.rx_queue.cond:
+                self.rx_queue.dropped_samples += lost
+                self.rx_queue.last_overload = time.monotonic()
+        if not len(rows):
+            return
+        gens = rows[:, SampleRing.GEN]
+        for run in np.split(np.arange(len(rows)), np.flatnonzero(np.diff(gens)) + 1):
+            gen = int(gens[run[0]])
+            schema = link.schemas.get(gen)
+            if schema is None:
+                # The schema event is still in the pipe; read these rows again next time.
+                link.ring.unread(len(rows) - run[0])
+                break
+            if gen > link.applied_gen:
+                # Rows can overtake the SCHEMA status line; a later apply of it is a no-op.
+                link.applied_gen = gen
+                self._apply_schema(schema)
+            self._drain_ring_rows(rows[run], schema)
+
+    def _drain_ring_rows(self, rows: np.ndarray, schema: ChannelSchema) -> None:
+        self.plot_dirty = True
+        heads = rows[:, SampleRing.COUNT] > 0
+        self.link_headers.extend(
+            zip(
+                rows[heads, SampleRing.DEVICE].tolist(),
+                rows[heads, SampleRing.DT].tolist(),
+                rows[heads, SampleRing.COUNT].astype(int).tolist(),
+            )
+        )
+        self.perf.count("batches_parsed", int(heads.sum()))
+        self.perf.count("samples_parsed", len(rows))
+        width = 2 + len(schema.extra_indices)
+        values = rows[:, SampleRing.VALUES:SampleRing.VALUES + width]
+        if values.shape[1] < width:
+            # Channels past the ring width were only recorded; keep the ones that fit.
+            values = np.hstack((values, np.full((len(rows), width - values.shape[1]), np.nan)))
+        # One chunk per serial read, so the clock sees the same arrival times as in-process.
+        walls = rows[:, SampleRing.WALL]
+        for chunk in np.split(np.arange(len(rows)), np.flatnonzero(np.diff(walls)) + 1):
+            self.rx_arrival_wall = float(walls[chunk[0]])
+            device_times = [
+                None if t_ms != t_ms else t_ms for t_ms in rows[chunk, SampleRing.DEVICE].tolist()
+            ]
+            self._ingest_samples(
+                values[chunk, 0].tolist(),
+                values[chunk, 1].tolist(),
+                device_times,
+                values[chunk, 2:],
+            )
+
+    def _ingest_samples(self, targets, actuals, device_times, extras: np.ndarray) -> None:
+        raw = None
+        if self.conditioner is not None:
+            raw = (actuals, device_times)
+            targets, actuals, device_times, extras = self._condition(
+                targets, actuals, device_times, extras
+            )
+            if not targets:
+                return
+        parsed = time.perf_counter()
+        times = [
+            self._append_sample(target, actual, device_time_ms=t_ms, extras=row)
+            for target, actual, t_ms, row in zip(targets, actuals, device_times, extras)
+        ]
+        appended = time.perf_counter()
+        count = len(times)
+        self.perf.add("append_sample", (appended - parsed) * 1e6 / count, unit="us")
+        if device_times[-1] is not None:
+            self._observe_clock(self.last_device_time)
+        self._extend_extras(extras, count)
+        self._feed_trigger(times, targets, actuals)
+        if self.telemetry is not None:
+            self._publish_samples(times, targets, actuals, extras)
+        if self.experiment is not None:
+            self.experiment.link.feed(times, targets, actuals)
+        if self.spectrum is not None:
+            self._feed_spectrum(targets, actuals)
+        if raw is not None:
+            self._extend_raw(*raw, times)
+
+    def _configure_conditioning(self) -> None:
+        if not self.conditioning_enabled_var.get():
+            self.conditioner = None
+            self.conditioning_var.set("Conditioning: off")
+            self._sync_raw_line()
+            self._sync_record_conditioning()
+            return
         try:
-            t0_ms = float(parts[1])
-            dt_ms = float(parts[2])
-            count = int(parts[3])
+            window = int(self.conditioning_window_var.get())
+            n_sigmas = float(self.conditioning_sigmas_var.get())
         except ValueError:
-            return True
-        if count <= 0:
-            return True
-        expected = 4 + (count * 2)
-        if len(parts) < expected:
-            return True
-        index = 4
-        for i in range(count):
+            self._log("ERR: conditioning window and threshold must be numbers")
+            self.conditioning_enabled_var.set(False)
+            return
+        if window < 1 or n_sigmas <= 0:
+            self._log("ERR: conditioning window must be >= 1 and threshold > 0")
+            self.conditioning_enabled_var.set(False)
+            return
+        self.conditioner = SignalConditioner(
+            2 + len(self.schema.extra_indices),
+            window=window,
+            n_sigmas=n_sigmas,
+            resample=self.conditioning_resample_var.get(),
+        )
+        self.raw_times.clear()
+        self.raw_actual.clear()
+        self.conditioning_var.set(self.conditioner.summary())
+        self._sync_raw_line()
+        self._sync_record_conditioning()
+
+    def _record_conditioning(self) -> tuple | None:
+        conditioner = self.conditioner
+        if conditioner is None:
+            return None
+        return (conditioner.window, conditioner.n_sigmas, conditioner.resample)
+
+    def _sync_record_conditioning(self) -> None:
+        # The recorder runs its own conditioner on every sample and keeps the raw columns.
+        settings = self._record_conditioning()
+        if self.recorder is not None:
+            self.recorder.set_conditioning(settings)
+        if self.acquisition is not None:
             try:
-                target = float(parts[index])
-                actual = float(parts[index + 1])
-            except ValueError:
-                break
-            t_ms = t0_ms + (i * dt_ms)
-            self._append_sample(target, actual, device_time_ms=t_ms)
-            index += 2
-        return True
+                self.acquisition.condition(settings)
+            except serial.SerialException as exc:
+                self._log(f"ERR: failed to configure recording: {exc}")
+
+    def _condition(self, targets, actuals, device_times, extras):
+        columns = (targets, actuals) if extras is None else (targets, actuals, extras)
+        block = np.column_stack(columns)
+        conditioner = self.conditioner
+        if block.shape[1] != conditioner.width:
+            # Legacy two-column samples under a wider schema, or a schema change mid-stream.
+            conditioner = self.conditioner = SignalConditioner(
+                block.shape[1], conditioner.window, conditioner.n_sigmas, conditioner.resample
+            )
+        timed = None not in device_times
+        start = time.perf_counter()
+        times, block, _ = conditioner.process(
+            np.asarray(device_times, dtype=np.float64) if timed else None, block
+        )
+        self.perf.add(
+            "condition", (time.perf_counter() - start) * 1e6 / len(device_times), unit="us"
+        )
+        if timed:
+            device_times = times.tolist()
+        return block[:, 0].tolist(), block[:, 1].tolist(), device_times, block[:, 2:]
+
+    def _extend_raw(self, actuals, device_times, times) -> None:
+        # Raw samples keep their own timestamps, mapped through the same device clock epoch.
+        if None in device_times:
+            self.raw_times.extend(times[-len(actuals):])
+        else:
+            epoch_ms = self.clock.epoch_ms
+            self.raw_times.extend((t_ms + epoch_ms) / 1000.0 for t_ms in device_times)
+        self.raw_actual.extend(actuals)
+
+    def _sync_raw_line(self) -> None:
+        if self.axes is None:
+            return
+        if self.conditioner is not None and self.raw_line is None:
+            self.raw_line, = self.axes.plot(
+                [], [], color="gray", alpha=0.6, linewidth=0.8, label="Actual (raw)"
+            )
+        elif self.conditioner is None and self.raw_line is not None:
+            self.raw_line.remove()
+            self.raw_line = None
+        else:
+            return
+        self.axes.legend(loc="upper right")
+        self.plot_dirty = True
+
+    def _on_schema(self, message: SchemaAnnounce) -> None:
+        self._apply_schema(message.schema)
+
+    def _on_bad_schema(self, message: BadSchema) -> None:
+        self._log(f"ERR: bad channel schema: {message.error}")
+
+    @property
+    def schema(self) -> ChannelSchema:
+        return self.codec.schema
+
+    def _apply_schema(self, schema: ChannelSchema) -> None:
+        if schema.describe() == self.schema.describe():
+            return
+        self.codec.schema = schema
+        self.extra_ring = ChannelRing(self.plot_times.maxlen, len(schema.extra_indices))
+        # Keep the extra columns aligned with the plot deques.
+        self.extra_ring.extend(np.full((len(self.plot_times), len(schema.extra_indices)), np.nan))
+        self.response_plot_extras.clear()
+        self.channels_menu.delete(0, tk.END)
+        for name in schema.extra_names:
+            var = self.channel_visible_vars.setdefault(name, tk.BooleanVar(value=True))
+            self.channels_menu.add_checkbutton(label=name, variable=var, command=self._update_plot)
+        self._sync_extra_lines()
+        if self.telemetry is not None:
+            self.telemetry.set_columns(self._telemetry_columns())
+        self._log(f"Channel schema: {schema.describe()}")
+
+    def _on_record_rotated(self, filepath: str) -> None:
+        self.record_path = filepath
+        self._log(f"Recording continues in {filepath} (recorded columns changed)")
+
+    def _sync_extra_lines(self) -> None:
+        if self.axes is None:
+            return
+        for line in self.extra_lines.values():
+            line.remove()
+        self.extra_lines = {}
+        schema = self.schema
+        if schema.extra_names and self.extra_axes is None:
+            self.extra_axes = self.axes.twinx()
+            self.extra_axes.set_ylabel("Channels")
+        for name in schema.extra_names:
+            self.extra_lines[name], = self.extra_axes.plot([], [], linestyle=":", label=name)
+        if self.extra_axes is not None:
+            if self.extra_lines:
+                self.extra_axes.legend(loc="upper left")
+            elif self.extra_axes.get_legend() is not None:
+                self.extra_axes.get_legend().remove()
+
+    def _extend_extras(self, extras: np.ndarray | None, count: int) -> None:
+        width = len(self.schema.extra_indices)
+        if extras is None or extras.shape[1] != width:
+            extras = np.full((count, width), np.nan)
+        self.extra_ring.extend(extras)
+
+    def _reset_link_stats(self) -> None:
+        self.link.reset()
+        self.link_record_mark = self.link.snapshot() if self.recording else None
+        self.link_var.set(self.link.summary())
+
+    def _toggle_telemetry(self) -> None:
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+            self.telemetry_button.configure(text="Start")
+            self._log("Telemetry server stopped.")
+            return
+        address = self.telemetry_address_var.get().strip()
+        try:
+            server = TelemetryServer(address, websocket=self.telemetry_ws_var.get())
+        except (OSError, ValueError) as exc:
+            self._log(f"ERR: telemetry server failed to listen on {address}: {exc}")
+            return
+        server.set_columns(self._telemetry_columns())
+        server.start()
+        self.telemetry = server
+        self.telemetry_button.configure(text="Stop")
+        kind = "WebSocket" if server.websocket else "binary"
+        self._log(f"Telemetry server ({kind}) listening on {address}")
+
+    def _telemetry_columns(self) -> list[str]:
+        return ["time_s", "target", "actual"] + self.schema.extra_names
+
+    def _publish_samples(self, times, targets, actuals, extras: np.ndarray | None) -> None:
+        width = len(self.schema.extra_indices)
+        rows = np.empty((len(times), 3 + width))
+        rows[:, 0] = times
+        rows[:, 1] = targets
+        rows[:, 2] = actuals
+        if extras is not None and extras.shape[1] == width:
+            rows[:, 3:] = extras
+        else:
+            rows[:, 3:] = np.nan
+        self.telemetry.publish(_telemetry_samples(rows))
+
+    def _update_telemetry_status(self) -> None:
+        if self.telemetry is None:
+            return
+        stats = self.telemetry.stats()
+        self.telemetry_var.set(
+            f"Telemetry: {stats['clients']} subscribers, {stats['frames']} frames, "
+            f"{stats['dropped']} dropped for slow subscribers, "
+            f"{stats['queued_bytes'] // 1024} KB queued"
+        )
+
+    def _toggle_rpc(self) -> None:
+        if self.rpc is not None:
+            self.rpc.stop()
+            self.rpc = None
+            self.rpc_button.configure(text="Start")
+            self.rpc_var.set("Scripting API: off")
+            self._log("Scripting API stopped.")
+            return
+        address = self.rpc_address_var.get().strip()
+        try:
+            server = RpcServer(address, self._post_rpc)
+        except (OSError, ValueError) as exc:
+            self._log(f"ERR: scripting API failed to listen on {address}: {exc}")
+            return
+        server.start()
+        self.rpc = server
+        self.rpc_button.configure(text="Stop")
+        self._log(f"Scripting API listening on {address}")
+
+    def _update_rpc_status(self) -> None:
+        if self.rpc is None:
+            return
+        self.rpc_var.set(
+            f"Scripting API: {len(self.rpc.connections)} clients, {self.rpc.calls} calls"
+        )
+
+    def _post_rpc(self, payload, reply) -> None:
+        # RPC thread: calls run on the Tk thread, woken the same way as serial data.
+        self.ui_events.put((self._run_rpc, (payload, reply)))
+        self._notify_rx()
+
+    def _run_rpc(self, payload, reply) -> None:
+        if isinstance(payload, list):
+            if not payload:
+                reply(json.dumps(_rpc_error(None, -32600, "empty batch")))
+                return
+            results = [self._call_rpc(request) for request in payload]
+            results = [result for result in results if result is not None]
+            if results:
+                reply(json.dumps(results))
+            return
+        result = self._call_rpc(payload)
+        if result is not None:
+            reply(json.dumps(result))
+
+    def _call_rpc(self, request) -> dict | None:
+        # Returns the response object, or None for a notification (no "id").
+        if not isinstance(request, dict):
+            return _rpc_error(None, -32600, "invalid request")
+        request_id = request.get("id")
+        name = request.get("method")
+        params = request.get("params", [])
+        method = self.rpc_methods.get(name)
+        if request.get("jsonrpc") != "2.0" or not isinstance(name, str):
+            response = _rpc_error(request_id, -32600, "invalid request")
+        elif method is None:
+            response = _rpc_error(request_id, -32601, f"unknown method {name}")
+        elif not isinstance(params, (list, dict)):
+            response = _rpc_error(request_id, -32602, "params must be an array or object")
+        else:
+            args, kwargs = (params, {}) if isinstance(params, list) else ((), params)
+            try:
+                inspect.signature(method).bind(*args, **kwargs)
+            except TypeError as exc:
+                response = _rpc_error(request_id, -32602, str(exc))
+            else:
+                # Methods report failures through _log like the buttons they stand in for.
+                self.rpc_errors = []
+                failure = None
+                try:
+                    result = method(*args, **kwargs)
+                except (TypeError, ValueError, OSError) as exc:
+                    self.rpc_errors.append(f"ERR: {exc}")
+                    result = None
+                except Exception as exc:
+                    # A bug in a handler must not take down the poll loop that serves RPC.
+                    failure = f"{type(exc).__name__}: {exc}"
+                    result = None
+                errors = self.rpc_errors
+                self.rpc_errors = None
+                if failure is not None:
+                    self._log(f"ERR: RPC {name} failed: {failure}")
+                    response = _rpc_error(request_id, -32603, f"internal error: {failure}")
+                elif errors:
+                    response = _rpc_error(request_id, -32000, "; ".join(errors))
+                else:
+                    response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        if "id" not in request:
+            return None
+        return response
+
+    def _rpc_ping(self) -> str:
+        return "pong"
+
+    def _rpc_get_status(self) -> dict:
+        return {
+            "connected": bool(self.serial_port and self.serial_port.is_open),
+            "recording": self.recording,
+            "record_path": self.record_path if self.recording else None,
+            "rx_rate_hz": self.rx_rate_hz,
+            "schema": self.schema.describe(),
+            "pid": [self.current_p_var.get(), self.current_i_var.get(), self.current_d_var.get()],
+            "tune": self.tune_status_var.get(),
+            "link": self.link.summary(),
+        }
+
+    def _rpc_get_metrics(
+        self, cursor_a: float | None = None, cursor_b: float | None = None
+    ) -> dict:
+        if cursor_a is not None:
+            self.response_cursor_a = float(cursor_a)
+        if cursor_b is not None:
+            self.response_cursor_b = float(cursor_b)
+        if (cursor_a is not None or cursor_b is not None) and self.response_plot_axes is not None:
+            self._draw_response_cursors()
+            self.response_plot_canvas.draw_idle()
+        self._update_response_metrics()
+        return {
+            "cursor_a": self.response_cursor_a,
+            "cursor_b": self.response_cursor_b,
+            "cursor_metrics": self.response_metrics_var.get(),
+            "settling_time": self.settling_time_var.get(),
+            "overshoot": self.overshoot_var.get(),
+            "sse": self.sse_var.get(),
+        }
+
+    def _rpc_start_recording(self, path: str) -> None:
+        self._start_recording(str(path))
+
+    def _rpc_run_experiment(self, path: str) -> None:
+        self._run_experiment(str(path))
+
+    def _rpc_set_gains(self, p: float, i: float, d: float) -> None:
+        self.p_var.set(str(p))
+        self.i_var.set(str(i))
+        self.d_var.set(str(d))
+        self._send_pid()
+
+    def _rpc_set_sample_time(self, ms: float) -> None:
+        self.sample_time_var.set(str(ms))
+        self._send_sample_time()
+
+    def _rpc_tune(self, method: str | None = None) -> None:
+        if method is not None:
+            self.tuning_method_var.set(method)
+        self._send_tune()
+
+    def _rpc_response(self, response_type: str, duration: float | None) -> None:
+        self.response_type_var.set(response_type)
+        self.use_time_var.set(duration is not None)
+        if duration is not None:
+            self.response_time_var.set(str(duration))
+        self._send_response()
+
+    def _rpc_setpoint(self, value: float, duration: float | None = None) -> None:
+        self.setpoint_var.set(str(value))
+        self._rpc_response("Setpoint", duration)
+
+    def _rpc_step(self, amplitude: float, duration: float) -> None:
+        self.step_var.set(str(amplitude))
+        self._rpc_response("Step", duration)
+
+    def _rpc_ramp(self, slope: float, duration: float) -> None:
+        self.ramp_var.set(str(slope))
+        self._rpc_response("Ramp", duration)
+
+    def _rpc_accel(self, accel: float, duration: float) -> None:
+        self.accel_var.set(str(accel))
+        self._rpc_response("Accel", duration)
+
+    def _rpc_sine(
+        self, amplitude: float, frequency: float, duration: float, offset: float = 0.0
+    ) -> None:
+        self.sine_amp_var.set(str(amplitude))
+        self.sine_freq_var.set(str(frequency))
+        self.sine_offset_var.set(str(offset))
+        self._rpc_response("Sine", duration)
+
+    def _rpc_open_response(self, duration: float | None = None) -> None:
+        if duration is not None and float(duration) <= 0:
+            self._log("ERR: response plot duration must be > 0.")
+            return
+        self._open_response_plot(None if duration is None else float(duration))
+
+    def _run_experiment(self, path: str | None = None) -> None:
+        if self.experiment is not None:
+            self._log("ERR: a sequence is already running.")
+            return
+        if path is None:
+            path = filedialog.askopenfilename(
+                title="Experiment plan",
+                filetypes=[("Experiment plans", "*.toml *.yaml *.yml"), ("All files", "*.*")],
+            )
+        if not path:
+            return
+        try:
+            plan = load_plan(path)
+        except (OSError, ValueError) as exc:
+            self._log(f"ERR: experiment plan {path}: {exc}")
+            return
+        self._start_experiment(plan)
+
+    def _run_ensemble(self) -> None:
+        if self.experiment is not None:
+            self._log("ERR: a sequence is already running.")
+            return
+        try:
+            runs = int(self.ensemble_runs_var.get())
+            amplitude = float(self.step_var.get())
+            duration = float(self.response_time_var.get())
+        except ValueError:
+            self._log("ERR: runs, step amplitude and response time must be numbers.")
+            return
+        if runs < 2:
+            self._log("ERR: repeat-and-average needs at least 2 runs.")
+            return
+        if duration < 2:
+            self._log("ERR: response time must be >= 2 seconds.")
+            return
+        output = filedialog.askdirectory(title="Folder for ensemble results")
+        if not output:
+            return
+        self._start_experiment(repeat_plan("STEP", (amplitude,), duration, runs, output))
+
+    def _start_experiment(self, plan) -> None:
+        if not self.serial_port or not self.serial_port.is_open:
+            self._log("ERR: not connected.")
+            return
+        self.experiment = ExperimentRunner(
+            plan,
+            GuiLink(self),
+            report=self._experiment_report,
+            finished=self._experiment_finished,
+            ensembled=self._experiment_ensembled,
+        )
+        self.experiment.start()
+
+    def _abort_experiment(self) -> None:
+        if self.experiment is not None:
+            self.experiment.abort()
+
+    def _experiment_report(self, text: str) -> None:
+        # Runner and analysis threads.
+        self.ui_events.put((self._on_experiment_report, (text,)))
+        self._notify_rx()
+
+    def _on_experiment_report(self, text: str) -> None:
+        self.experiment_var.set(text)
+        self._log(text)
+
+    def _experiment_ensembled(self, step, result) -> None:
+        self.ui_events.put((self._show_ensemble_plot, (step, result)))
+        self._notify_rx()
+
+    def _show_ensemble_plot(self, step, result) -> None:
+        if self.ensemble_window is not None:
+            try:
+                self.ensemble_window.destroy()
+            except tk.TclError:
+                pass
+        self.ensemble_window = tk.Toplevel(self.root)
+        self.ensemble_window.title(f"Ensemble: {result.runs} x {step.describe()}")
+        self.ensemble_window.geometry("700x500")
+
+        Figure, FigureCanvasTkAgg = _plotting()
+        figure = Figure(figsize=(5, 4), dpi=100)
+        axes = figure.add_subplot(111)
+        axes.fill_between(
+            result.t, result.mean - result.std, result.mean + result.std,
+            color="tab:blue", alpha=0.15, label="±1 std",
+        )
+        axes.fill_between(
+            result.t, result.mean - result.band, result.mean + result.band,
+            color="tab:blue", alpha=0.35, label="95% CI of mean",
+        )
+        axes.plot(result.t, result.mean, color="tab:blue", label="Mean actual")
+        axes.plot(result.t, result.target, color="tab:red", linestyle="--", label="Target")
+        axes.set_xlabel("Time from target edge (s)")
+        axes.grid(True, alpha=0.3)
+        axes.legend(loc="lower right")
+        figure.tight_layout()
+
+        canvas = FigureCanvasTkAgg(figure, master=self.ensemble_window)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        ttk.Label(
+            self.ensemble_window, text=result.summary(), wraplength=680, padding=(8, 4)
+        ).pack(fill=tk.X)
+
+    def _experiment_finished(self) -> None:
+        self.ui_events.put((self._on_experiment_finished, ()))
+        self._notify_rx()
+
+    def _on_experiment_finished(self) -> None:
+        self.experiment = None
+
+    def _experiment_send(self, message) -> None:
+        if not self.serial_port or not self.serial_port.is_open:
+            return
+        payload = message.encode()
+        self._queue_command(payload)
+        self._log(f"TX: {payload}")
 
-    def _append_sample(self, target: float, actual: float, device_time_ms: float | None = None) -> None:
+    def _experiment_respond(self, kind: str, values: tuple, duration: float | None) -> None:
+        if not self.serial_port or not self.serial_port.is_open:
+            return
+        self.response_seq += 1
+        self._queue_response(Response(kind, values, duration, self.response_seq))
+
+    def _observe_clock(self, device_s: float) -> None:
+        # The last sample of a batch left the device no later than the batch arrived.
+        if self.rx_arrival_wall is not None:
+            self.clock.observe(device_s, self.rx_arrival_wall)
+
+    def _append_sample(
+        self,
+        target: float,
+        actual: float,
+        device_time_ms: float | None = None,
+        extras: np.ndarray | None = None,
+    ) -> float:
         now_wall = time.time()
         if device_time_ms is None:
             elapsed = self.plot_index / self.RX_RATE_HZ
             self.plot_index += 1
         else:
-            elapsed = device_time_ms / 1000.0
-            if self.last_device_time is not None and elapsed < self.last_device_time:
-                # Device time reset or wrapped; reset plot index fallback.
-                self.plot_index = 0
+            # Unwrapped device time: wraps and resets continue the same timebase.
+            device_s = self.clock.unwrap(device_time_ms, self.rx_arrival_wall)
+            elapsed = device_s
             self.last_device_time = elapsed
-        if self.response_type_var.get() == "Step":
-            if self.last_target is None:
-                self.last_target = target
-            else:
-                if abs(target - self.last_target) > 1e-6:
-                    # Restart metrics on any target change (new step).
-                    self._start_step_metrics(
-                        target, start_time=elapsed, prev_target=self.last_target
-                    )
-                    self.pending_step_start = False
-                self.last_target = target
+            if self.clock.valid:
+                now_wall = self.clock.to_host(device_s)
+        if self.last_target is None:
+            self.last_target = target
+        elif abs(target - self.last_target) > 1e-6:
+            # First visible target change after a response command, whatever its kind.
+            if self.tx_writer is not None:
+                self.tx_writer.note_effect()
+            if self.response_type_var.get() == "Step":
+                # Restart metrics on any target change (new step).
+                self._start_step_metrics(target, start_time=elapsed, prev_target=self.last_target)
+                self.pending_step_start = False
+            self.last_target = target
         if self.step_active and self.step_start_time is None:
             # Align step timing to the data timebase.
             self.step_start_time = elapsed
@@ -960,8 +6258,6 @@ class CdcGuiApp:
         self.actual_history.append((elapsed, actual))
         self._trim_history(elapsed)
         self._update_step_metrics(actual, elapsed)
-        if self.recording and self.csv_writer:
-            self.csv_writer.writerow([now_wall, target, actual])
         if self.response_plot_active:
             if self.response_plot_start_elapsed is not None:
                 resp_elapsed = elapsed - self.response_plot_start_elapsed
@@ -975,75 +6271,70 @@ class CdcGuiApp:
                 self.response_plot_times.append(resp_elapsed)
                 self.response_plot_target.append(target)
                 self.response_plot_actual.append(actual)
+                self.response_plot_extras.append(extras)
             else:
                 self.response_plot_active = False
+        return elapsed
 
-    def _parse_pid_status(self, line: str) -> bool:
-        if not line.startswith("PID="):
-            return False
-        payload = line[4:]
-        try:
-            p_val, i_val, d_val = self._parse_pid_triplet(payload)
-        except ValueError:
-            return False
-        self.current_p_var.set(f"{p_val:g}")
-        self.current_i_var.set(f"{i_val:g}")
-        self.current_d_var.set(f"{d_val:g}")
-        return True
+    def _on_pid_status(self, message: PidStatus) -> None:
+        self.current_p_var.set(f"{message.p:g}")
+        self.current_i_var.set(f"{message.i:g}")
+        self.current_d_var.set(f"{message.d:g}")
 
-    def _parse_tune_status(self, line: str) -> bool:
-        if not line.startswith("TUNE="):
-            return False
-        payload = line[5:]
-        if payload.startswith("OK"):
+    def _on_tune_status(self, message: TuneStatus) -> None:
+        if message.state == "OK":
             self.tune_status_var.set("Tune: OK")
-            # Expected format: TUNE=OK,Ku=...,Pu=...,Kp=...,Ki=...,Kd=...
-            vals = {}
-            parts = payload.split(",")
-            for part in parts[1:]:
-                if "=" in part:
-                    k, v = part.split("=", 1)
-                    vals[k.strip()] = v.strip()
-            if "Kp" in vals:
-                self.p_var.set(vals["Kp"])
-            if "Ki" in vals:
-                self.i_var.set(vals["Ki"])
-            if "Kd" in vals:
-                self.d_var.set(vals["Kd"])
-            self._log(f"RX: {line}")
-            return True
-        if payload.startswith("ERR"):
+            # Expected fields: Ku, Pu, Kp, Ki, Kd
+            fields = message.fields
+            if "Kp" in fields:
+                self.p_var.set(fields["Kp"])
+            if "Ki" in fields:
+                self.i_var.set(fields["Ki"])
+            if "Kd" in fields:
+                self.d_var.set(fields["Kd"])
+        elif message.state == "ERR":
             self.tune_status_var.set("Tune: ERR")
-            self._log(f"RX: {line}")
-            return True
-        if payload.startswith("START"):
+        else:
             self.tune_status_var.set("Tune: RUNNING")
-            self._log(f"RX: {line}")
-            return True
-        return False
-
-    @staticmethod
-    def _parse_pid_triplet(payload: str) -> tuple[float, float, float]:
-        p_val = i_val = d_val = None
-        parts = payload.split(",")
-        for part in parts:
-            if part.startswith("P="):
-                p_val = float(part[2:].strip())
-            elif part.startswith("I="):
-                i_val = float(part[2:].strip())
-            elif part.startswith("D="):
-                d_val = float(part[2:].strip())
-        if p_val is None or i_val is None or d_val is None:
-            raise ValueError("missing PID fields")
-        return p_val, i_val, d_val
 
     def _update_plot(self) -> None:
-        if not self.plot_times:
+        if self.canvas is None:
+            return
+        start = time.perf_counter()
+        self._refresh_plot()
+        self.perf.add("plot_update", (time.perf_counter() - start) * 1000.0)
+
+    def _refresh_plot(self) -> None:
+        self.plot_dirty = False
+        self.last_redraw = time.monotonic()
+        if not self.plot_times and not self.sessions:
             return
         self.target_line.set_data(self.plot_times, self.plot_target)
         self.actual_line.set_data(self.plot_times, self.plot_actual)
+        if (self.conditioner is None) != (self.raw_line is None):
+            self._sync_raw_line()
+        if self.raw_line is not None:
+            self.raw_line.set_data(self.raw_times, self.raw_actual)
+            self.conditioning_var.set(self.conditioner.summary())
         self.axes.relim()
         self.axes.autoscale_view()
+        if self.extra_lines:
+            columns = self.extra_ring.view()
+            times = np.asarray(self.plot_times)[-len(columns):] if len(columns) else []
+            for col, name in enumerate(self.schema.extra_names):
+                line = self.extra_lines[name]
+                visible = self.channel_visible_vars[name].get()
+                line.set_visible(visible)
+                if visible and len(columns):
+                    line.set_data(times, columns[:, col])
+            self.extra_axes.relim(visible_only=True)
+            self.extra_axes.autoscale_view()
+        for session in self.sessions.values():
+            session.target_line.set_data(session.times, session.target)
+            session.actual_line.set_data(session.times, session.actual)
+        if self.sessions:
+            self.axes.relim()
+            self.axes.autoscale_view()
         self.canvas.draw_idle()
         if len(self.plot_times) >= 2:
             span = self.plot_times[-1] - self.plot_times[0]
@@ -1054,6 +6345,110 @@ class CdcGuiApp:
         self.rx_rate_var.set(
             f"RX rate: {self.rx_rate_hz:.1f} Hz (Nyquist {self.rx_rate_hz/2:.1f} Hz)"
         )
+        if self.spectrum is not None:
+            self._update_spectrum()
+
+    def _toggle_spectrum(self) -> None:
+        if self.spectrum_var.get():
+            self._open_spectrum()
+        else:
+            self._close_spectrum()
+
+    def _open_spectrum(self) -> None:
+        if self.spectrum_window is not None:
+            self.spectrum_window.lift()
+            return
+        self.spectrum_window = tk.Toplevel(self.root)
+        self.spectrum_window.title("Spectrum")
+        self.spectrum_window.geometry("700x420")
+        self.spectrum_window.protocol("WM_DELETE_WINDOW", self._close_spectrum)
+
+        Figure, FigureCanvasTkAgg = _plotting()
+        figure = Figure(figsize=(5, 3), dpi=100)
+        self.spectrum_axes = figure.add_subplot(111)
+        self.spectrum_axes.set_xlabel("Frequency (Hz)")
+        self.spectrum_axes.set_ylabel("Amplitude")
+        self.spectrum_axes.set_yscale("log")
+        self.spectrum_axes.grid(True, which="both", alpha=0.3)
+        self.spectrum_error_line, = self.spectrum_axes.plot([], [], label="Target − Actual")
+        self.spectrum_actual_line, = self.spectrum_axes.plot([], [], label="Actual", alpha=0.7)
+        self.spectrum_peak_markers, = self.spectrum_axes.plot(
+            [], [], "v", color="tab:red", label="Peaks"
+        )
+        self.spectrum_nyquist_line = self.spectrum_axes.axvline(
+            0.0, color="gray", linestyle="--", linewidth=1.0
+        )
+        self.spectrum_axes.legend(loc="upper right")
+        figure.tight_layout()
+        self.spectrum_canvas = FigureCanvasTkAgg(figure, master=self.spectrum_window)
+        self.spectrum_canvas.draw()
+        self.spectrum_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        controls = ttk.Frame(self.spectrum_window, padding=(8, 4))
+        controls.pack(fill=tk.X)
+        ttk.Label(controls, text="FFT size:").pack(side=tk.LEFT)
+        self.spectrum_size_var = tk.StringVar(value="1024")
+        size_combo = ttk.Combobox(
+            controls,
+            textvariable=self.spectrum_size_var,
+            state="readonly",
+            width=6,
+            values=[str(size) for size in SpectrumAnalyzer.SIZES],
+        )
+        size_combo.pack(side=tk.LEFT, padx=6)
+        size_combo.bind("<<ComboboxSelected>>", lambda event: self._reset_spectrum())
+        self.spectrum_peaks_var = tk.StringVar(value="Peaks: waiting for data")
+        ttk.Label(controls, textvariable=self.spectrum_peaks_var).pack(side=tk.LEFT, padx=10)
+        self._reset_spectrum()
+
+    def _reset_spectrum(self) -> None:
+        self.spectrum = SpectrumAnalyzer(int(self.spectrum_size_var.get()))
+        self.spectrum_peaks_var.set("Peaks: waiting for data")
+
+    def _close_spectrum(self) -> None:
+        self.spectrum = None
+        self.spectrum_var.set(False)
+        if self.spectrum_window is not None:
+            try:
+                self.spectrum_window.destroy()
+            except tk.TclError:
+                pass
+        self.spectrum_window = None
+
+    def _feed_spectrum(self, targets, actuals) -> None:
+        actuals = np.asarray(actuals, dtype=np.float64)
+        self.spectrum.extend(np.column_stack((np.subtract(targets, actuals), actuals)))
+
+    def _update_spectrum(self) -> None:
+        if not self.spectrum.update():
+            return
+        rate = self.rx_rate_hz
+        nyquist = rate / 2.0
+        freqs = self.spectrum.frequencies(rate)[1:]
+        magnitude = np.maximum(self.spectrum.magnitude[:, 1:], 1e-12)
+        self.spectrum_error_line.set_data(freqs, magnitude[0])
+        self.spectrum_actual_line.set_data(freqs, magnitude[1])
+        peaks = self.spectrum.peaks(0, rate)
+        self.spectrum_peak_markers.set_data(
+            [freq for freq, _ in peaks], [value for _, value in peaks]
+        )
+        self.spectrum_nyquist_line.set_xdata([nyquist, nyquist])
+        self.spectrum_axes.set_xlim(0.0, nyquist * 1.02)
+        self.spectrum_axes.relim()
+        self.spectrum_axes.autoscale_view(scalex=False)
+        if peaks:
+            # Energy this close to Nyquist may be a faster oscillation folded down.
+            self.spectrum_peaks_var.set(
+                "Error peaks: "
+                + ", ".join(
+                    f"{freq:.2f} Hz ({value:.3g})"
+                    + (" near Nyquist, may be aliased" if freq >= 0.8 * nyquist else "")
+                    for freq, value in peaks
+                )
+            )
+        else:
+            self.spectrum_peaks_var.set("Error peaks: none above the noise floor")
+        self.spectrum_canvas.draw_idle()
 
     def _open_response_plot(self, duration: float | None) -> None:
         if self.response_plot_window is not None:
@@ -1088,6 +6483,7 @@ class CdcGuiApp:
         )
         self.response_plot_window.update_idletasks()
 
+        Figure, FigureCanvasTkAgg = _plotting()
         figure = Figure(figsize=(5, 3), dpi=100)
         self.response_plot_axes = figure.add_subplot(111)
         self.response_plot_axes.set_xlabel("Time (s)")
@@ -1095,6 +6491,8 @@ class CdcGuiApp:
         self.response_plot_axes.grid(True, alpha=0.3)
         self.response_plot_target_line, = self.response_plot_axes.plot([], [], label="Target")
         self.response_plot_actual_line, = self.response_plot_axes.plot([], [], label="Actual")
+        for reference in self.response_references:
+            self._plot_reference(reference)
         self.response_plot_axes.legend(loc="upper right")
 
         self.response_plot_canvas = FigureCanvasTkAgg(figure, master=self.response_plot_window)
@@ -1103,6 +6501,8 @@ class CdcGuiApp:
         self.response_plot_canvas.mpl_connect("button_press_event", self._on_response_plot_click)
         self.response_plot_canvas.mpl_connect("motion_notify_event", self._on_response_plot_drag)
         self.response_plot_canvas.mpl_connect("button_release_event", self._on_response_plot_release)
+        # Zoom and pan re-pick the reference LOD level even while no samples arrive.
+        self.response_plot_axes.callbacks.connect("xlim_changed", self._on_response_xlim_changed)
 
         controls = ttk.Frame(self.response_plot_window, padding=(8, 4))
         controls.pack(fill=tk.X)
@@ -1132,13 +6532,42 @@ class CdcGuiApp:
         response_file_menu.add_command(label="Save CSV", command=self._save_response_plot_data)
         response_file_menu.add_command(label="Save Image", command=self._save_response_plot_image)
         response_file_menu.add_separator()
+        response_file_menu.add_command(label="Load References...", command=self._load_references)
+        response_file_menu.add_command(label="Clear References", command=self._clear_references)
+        response_file_menu.add_separator()
         response_file_menu.add_command(label="Close", command=self._close_response_plot)
         response_menubar.add_cascade(label="File", menu=response_file_menu)
         self.response_plot_window.config(menu=response_menubar)
 
+        compare = ttk.Frame(self.response_plot_window, padding=(8, 0, 8, 4))
+        compare.pack(fill=tk.X)
+        ttk.Label(compare, text="Baseline:").grid(row=0, column=0, sticky=tk.W)
+        self.response_baseline_combo = ttk.Combobox(
+            compare, textvariable=self.response_baseline_var, state="readonly", width=28
+        )
+        self.response_baseline_combo.grid(row=0, column=1, padx=6, sticky=tk.W)
+        self.response_baseline_combo.bind(
+            "<<ComboboxSelected>>", lambda event: self._update_reference_table()
+        )
+        ttk.Button(compare, text="Remove Selected", command=self._remove_reference).grid(
+            row=0, column=2, padx=6
+        )
+        self.response_reference_tree = ttk.Treeview(
+            compare, columns=METRICS, show="tree headings", height=4
+        )
+        self.response_reference_tree.heading("#0", text="Run")
+        self.response_reference_tree.column("#0", width=160)
+        for name in METRICS:
+            self.response_reference_tree.heading(name, text=name)
+            self.response_reference_tree.column(name, width=80, anchor=tk.E)
+        self.response_reference_tree.grid(row=1, column=0, columnspan=3, sticky="ew", pady=(4, 0))
+        compare.columnconfigure(2, weight=1)
+        self._update_reference_choices()
+
         self.response_plot_times.clear()
         self.response_plot_target.clear()
         self.response_plot_actual.clear()
+        self.response_plot_extras.clear()
         self.response_plot_paused = False
         self.response_plot_pause_button.configure(text="Pause")
         self.response_plot_annotations = []
@@ -1161,7 +6590,11 @@ class CdcGuiApp:
             self.response_plot_end_time = self.response_plot_t0 + duration
             self.response_plot_duration = duration
         self.response_plot_active = True
-        self.response_plot_start_elapsed = self.plot_times[-1] if self.plot_times else None
+        if self.clock.valid and self.last_device_time is not None:
+            # Start at the device time of the button press, not at the last sample received.
+            self.response_plot_start_elapsed = self.clock.to_device(self.response_plot_t0)
+        else:
+            self.response_plot_start_elapsed = self.plot_times[-1] if self.plot_times else None
         self._schedule_response_plot_update()
 
     def _set_response_plot_duration(self, duration: float) -> None:
@@ -1180,7 +6613,9 @@ class CdcGuiApp:
         self._open_response_plot(duration)
 
     def _update_response_plot(self) -> None:
-        if not self.response_plot_active or not self.response_plot_times:
+        if not self.response_plot_active:
+            return
+        if not self.response_plot_times and not self.response_references:
             return
         self.response_plot_target_line.set_data(
             self.response_plot_times, self.response_plot_target
@@ -1190,8 +6625,149 @@ class CdcGuiApp:
         )
         self.response_plot_axes.relim()
         self.response_plot_axes.autoscale_view()
+        if self.response_references:
+            self._update_reference_lines()
+            self._update_reference_table()
+        self.response_plot_canvas.draw_idle()
+
+    def _load_references(self) -> None:
+        paths = filedialog.askopenfilenames(
+            title="Load reference runs",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+        )
+        if not paths:
+            return
+        # Parsing and building the LOD pyramids can take a while for long recordings.
+        threading.Thread(
+            target=self._read_references, args=(list(paths),), name="references", daemon=True
+        ).start()
+
+    def _read_references(self, paths: list[str]) -> None:
+        for path in paths:
+            try:
+                reference = ReferenceTrace.load(path)
+            except (OSError, ValueError, UnicodeDecodeError) as exc:
+                self.ui_events.put((self._log, (f"ERR: failed to load reference {path}: {exc}",)))
+            else:
+                self.ui_events.put((self._add_reference, (reference,)))
+            self._notify_rx()
+
+    def _add_reference(self, reference: ReferenceTrace) -> None:
+        names = {existing.name for existing in self.response_references}
+        base = reference.name
+        suffix = 2
+        while reference.name in names:
+            reference.name = f"{base} ({suffix})"
+            suffix += 1
+        self.response_references.append(reference)
+        self._log(f"Reference loaded: {reference.name} ({len(reference.times)} samples)")
+        if self.response_plot_axes is not None:
+            self._plot_reference(reference)
+            self.response_plot_axes.legend(loc="upper right")
+        self._update_reference_choices()
+        self._update_response_plot()
+
+    def _plot_reference(self, reference: ReferenceTrace) -> None:
+        # Start from the coarsest level so autoscaling sees the full extent.
+        times, values = reference.lod.levels[-1]
+        reference.line, = self.response_plot_axes.plot(
+            times, values, linewidth=1.0, alpha=0.7, label=reference.name
+        )
+        reference.view_key = None
+
+    def _remove_reference(self) -> None:
+        if self.response_reference_tree is None:
+            return
+        selected = set(self.response_reference_tree.selection())
+        keep = []
+        for reference in self.response_references:
+            if f"ref:{reference.name}" in selected:
+                if reference.line is not None:
+                    reference.line.remove()
+                    reference.line = None
+            else:
+                keep.append(reference)
+        self._replace_references(keep)
+
+    def _clear_references(self) -> None:
+        for reference in self.response_references:
+            if reference.line is not None:
+                reference.line.remove()
+                reference.line = None
+        self._replace_references([])
+
+    def _replace_references(self, references: list) -> None:
+        self.response_references = references
+        self._update_reference_choices()
+        if self.response_plot_axes is not None:
+            self.response_plot_axes.legend(loc="upper right")
+            self._update_reference_table()
+            self.response_plot_canvas.draw_idle()
+
+    def _update_reference_choices(self) -> None:
+        names = [reference.name for reference in self.response_references]
+        if self.response_baseline_var.get() not in names:
+            self.response_baseline_var.set(names[0] if names else "")
+        if self.response_baseline_combo is not None:
+            self.response_baseline_combo.configure(values=names)
+
+    def _update_reference_lines(self) -> None:
+        t0, t1 = self.response_plot_axes.get_xlim()
+        widget = self.response_plot_canvas.get_tk_widget()
+        pixels = max(int(widget.winfo_width()), 200)
+        key = (t0, t1, pixels)
+        for reference in self.response_references:
+            if reference.line is not None and reference.view_key != key:
+                reference.line.set_data(*reference.lod.view(t0, t1, pixels))
+                reference.view_key = key
+
+    def _on_response_xlim_changed(self, axes) -> None:
+        if not self.response_references or self.response_plot_canvas is None:
+            return
+        self._update_reference_lines()
         self.response_plot_canvas.draw_idle()
 
+    def _update_reference_table(self) -> None:
+        tree = self.response_reference_tree
+        if tree is None:
+            return
+        if self.response_cursor_a is not None and self.response_cursor_b is not None:
+            t_start = min(self.response_cursor_a, self.response_cursor_b)
+            t_end = max(self.response_cursor_a, self.response_cursor_b)
+        else:
+            t_start = t_end = None
+        rows = []
+        current = None
+        if self.response_plot_times:
+            times = np.fromiter(self.response_plot_times, dtype=np.float64)
+            current = window_metrics(
+                times,
+                np.fromiter(self.response_plot_target, dtype=np.float64),
+                np.fromiter(self.response_plot_actual, dtype=np.float64),
+                times[0] if t_start is None else t_start,
+                times[-1] if t_end is None else t_end,
+            )
+            rows.append(("current", "Current", current))
+        baseline = None
+        for reference in self.response_references:
+            metrics = reference.metrics(t_start, t_end)
+            rows.append((f"ref:{reference.name}", reference.name, metrics))
+            if reference.name == self.response_baseline_var.get():
+                baseline = metrics
+        if current is not None and baseline is not None:
+            delta = {name: current[name] - baseline[name] for name in METRICS}
+            rows.append(("delta", "Current − baseline", delta))
+        selected = tree.selection()
+        tree.delete(*tree.get_children())
+        for item, label, metrics in rows:
+            values = [
+                "--" if np.isnan(metrics[name]) else f"{metrics[name]:.4g}" for name in METRICS
+            ]
+            tree.insert("", tk.END, iid=item, text=label, values=values)
+        kept = [item for item in selected if tree.exists(item)]
+        if kept:
+            tree.selection_set(kept)
+
     def _schedule_response_plot_update(self) -> None:
         if self.response_plot_after_id is not None:
             self.root.after_cancel(self.response_plot_after_id)
@@ -1229,6 +6805,10 @@ class CdcGuiApp:
         self.response_cursor_a_button = None
         self.response_cursor_b_button = None
         self.response_plot_metrics_label = None
+        self.response_reference_tree = None
+        self.response_baseline_combo = None
+        for reference in self.response_references:
+            reference.line = None
         self.response_plot_annotations = []
         self.response_plot_markers = []
         self.response_point_dragging = False
@@ -1264,18 +6844,38 @@ class CdcGuiApp:
         if not filepath:
             return
         try:
-            with open(filepath, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(["time_s", "target", "actual"])
-                for t, target, actual in zip(
-                    self.response_plot_times, self.response_plot_target, self.response_plot_actual
-                ):
-                    writer.writerow([f"{t:.6f}", f"{target:.6f}", f"{actual:.6f}"])
+            self._write_response_csv(
+                filepath,
+                self.response_plot_times,
+                self.response_plot_target,
+                self.response_plot_actual,
+                self.response_plot_extras,
+                self.schema.extra_names,
+            )
         except OSError as exc:
             self._log(f"ERR: failed to save response CSV: {exc}")
             return
         self._log(f"Saved response data: {filepath}")
 
+    @staticmethod
+    def _write_response_csv(
+        filepath: str, times, targets, actuals, extras=None, extra_names: list[str] | None = None
+    ) -> None:
+        extra_names = extra_names or []
+        if extras is None:
+            extras = [None] * len(times)
+        with open(filepath, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["time_s", "target", "actual"] + extra_names)
+            for t, target, actual, row in zip(times, targets, actuals, extras):
+                values = [f"{t:.6f}", f"{target:.6f}", f"{actual:.6f}"]
+                if extra_names:
+                    if row is None or len(row) != len(extra_names):
+                        values += [""] * len(extra_names)
+                    else:
+                        values += [f"{value:.6g}" for value in row.tolist()]
+                writer.writerow(values)
+
     def _save_response_plot_image(self) -> None:
         if self.response_plot_canvas is None or self.response_plot_axes is None:
             self._log("ERR: response plot is not available.")
@@ -1527,6 +7127,8 @@ class CdcGuiApp:
             )
 
     def _update_response_metrics(self) -> None:
+        if self.response_references:
+            self._update_reference_table()
         if self.response_cursor_a is None or self.response_cursor_b is None:
             self.response_metrics_var.set("Cursors: set A and B")
             return
@@ -1746,34 +7348,68 @@ class CdcGuiApp:
                 self.paned.forget(self.log_frame)
 
     def _on_close(self) -> None:
+        if self.reconnect_after_id is not None:
+            self.root.after_cancel(self.reconnect_after_id)
+        if self.port_monitor is not None:
+            self.port_monitor.stop()
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        if self.rpc is not None:
+            self.rpc.stop()
+        if self.experiment is not None:
+            self.experiment.abort()
+        if self.stall_detector is not None:
+            self.stall_detector.stop()
+        if self.sampler is not None:
+            self.sampler.stop()
+        for session in list(self.sessions.values()):
+            session.close()
+        self.sessions.clear()
+        if self.group_writer is not None:
+            self.group_writer.stop()
         if self.recording:
             self._stop_recording()
         if self.serial_port:
             self._disconnect()
+        if self.wake_pipe is not None:
+            try:
+                self.root.tk.deletefilehandler(self.wake_pipe[0])
+            except tk.TclError:
+                pass
+            for fd in self.wake_pipe:
+                os.close(fd)
+            self.wake_pipe = None
         self.root.destroy()
 
-    def _start_recording(self) -> None:
+    def _start_recording(self, filepath: str | None = None) -> None:
         if self.recording:
             return
 
-        filepath = filedialog.asksaveasfilename(
-            title="Save CSV",
-            defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv")],
-        )
+        if filepath is None:
+            filepath = filedialog.asksaveasfilename(
+                title="Save CSV",
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv")],
+            )
         if not filepath:
             return
 
-        try:
-            self.csv_file = open(filepath, "w", newline="", encoding="utf-8")
-        except OSError as exc:
-            self._log(f"ERR: failed to open CSV: {exc}")
-            self.csv_file = None
-            return
-
-        self.csv_writer = csv.writer(self.csv_file)
-        self.csv_writer.writerow(["timestamp", "target", "actual"])
+        if self.acquisition is not None:
+            try:
+                self.acquisition.condition(self._record_conditioning())
+                self.acquisition.record(filepath)
+            except serial.SerialException as exc:
+                self._log(f"ERR: failed to start recording: {exc}")
+                return
+        else:
+            try:
+                self._start_recorder(filepath)
+            except OSError as exc:
+                self._log(f"ERR: failed to open CSV: {exc}")
+                return
+        self.record_path = filepath
         self.recording = True
+        self.link_record_mark = self.link.snapshot()
         self.record_button.configure(state="disabled")
         self.stop_button.configure(state="normal")
         self._log(f"Recording started: {filepath}")
@@ -1783,19 +7419,54 @@ class CdcGuiApp:
             return
 
         self.recording = False
-        if self.csv_file:
-            self.csv_file.close()
-        self.csv_file = None
-        self.csv_writer = None
+        if self.acquisition is not None:
+            try:
+                self.acquisition.stop_record()
+            except serial.SerialException:
+                pass
+        self._stop_recorder()
         self.record_button.configure(state="normal")
         self.stop_button.configure(state="disabled")
         self._log("Recording stopped.")
+        if self.link_record_mark is not None:
+            self._log(f"Recording {self.link.summary(self.link_record_mark)}")
+            self.link_record_mark = None
+
+    def _start_recorder(self, filepath: str, append: bool = False) -> None:
+        recorder = LineRecorder(self.schema, self._post_record_event)
+        recorder.set_conditioning(self._record_conditioning())
+        recorder.open(filepath, append)
+        recorder.start()
+        self.recorder = recorder
+        # The reader thread hands every line to the recorder before any overload policy.
+        self.rx_queue.recorder = recorder
+
+    def _stop_recorder(self) -> None:
+        self.rx_queue.recorder = None
+        if self.recorder is not None:
+            self.recorder.stop()
+        self.recorder = None
+
+    def _post_record_event(self, kind: str, detail: str) -> None:
+        # Called from the recorder thread.
+        if kind == "record_path":
+            self.ui_events.put((self._on_record_rotated, (detail,)))
+        else:
+            self.ui_events.put((self._log, (detail,)))
+        self._notify_rx()
 
 
 def main() -> None:
+    started = time.perf_counter()
     root = tk.Tk()
     ttk.Style().theme_use("clam")
-    CdcGuiApp(root)
+    app = CdcGuiApp(root)
+    app.startup_started = started
+    # Prints startup timings as JSON once the plot is ready, then exits (benchmarks/startup.py).
+    app.startup_exit = "--startup-benchmark" in sys.argv[1:]
+    if "--rpc" in sys.argv[1:-1]:
+        app.rpc_address_var.set(sys.argv[sys.argv.index("--rpc") + 1])
+        app._toggle_rpc()
     root.mainloop()
 
 
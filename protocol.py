@@ -0,0 +1,426 @@
+import re
+from typing import NamedTuple
+
+import numpy as np
+
+CHANNEL_TYPES = {
+    "f32": np.float32,
+    "f64": np.float64,
+    "i8": np.int8,
+    "u8": np.uint8,
+    "i16": np.int16,
+    "u16": np.uint16,
+    "i32": np.int32,
+    "u32": np.uint32,
+}
+
+
+class ChannelSchema:
+    def __init__(self, names: list[str], types: list[str], scales: list[float]) -> None:
+        if len(names) < 2:
+            raise ValueError("schema needs at least two channels")
+        if len(set(names)) != len(names):
+            raise ValueError("duplicate channel names")
+        for type_name in types:
+            if type_name not in CHANNEL_TYPES:
+                raise ValueError(f"unknown channel type {type_name}")
+        self.names = list(names)
+        self.types = list(types)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.target_index = self.names.index("target") if "target" in self.names else 0
+        self.actual_index = self.names.index("actual") if "actual" in self.names else 1
+        self.extra_indices = [
+            i for i in range(len(self.names)) if i not in (self.target_index, self.actual_index)
+        ]
+        self.extra_names = [self.names[i] for i in self.extra_indices]
+        # Integer channels are rounded and saturate at their type's range, so a corrupt
+        # field cannot become an impossible reading. Float channels are taken as sent.
+        dtypes = [CHANNEL_TYPES[type_name] for type_name in self.types]
+        self.integer = np.flatnonzero([np.issubdtype(dtype, np.integer) for dtype in dtypes])
+        self.low = np.array([np.iinfo(dtypes[i]).min for i in self.integer], dtype=np.float64)
+        self.high = np.array([np.iinfo(dtypes[i]).max for i in self.integer], dtype=np.float64)
+
+    @property
+    def width(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def parse(cls, payload: str) -> "ChannelSchema":
+        # name[:type[:scale]],... e.g. target:f32,actual:f32,u:i16:0.001
+        names = []
+        types = []
+        scales = []
+        for item in payload.split(","):
+            fields = [field.strip() for field in item.split(":")]
+            if not fields[0]:
+                continue
+            names.append(fields[0])
+            types.append(fields[1] if len(fields) > 1 and fields[1] else "f32")
+            scales.append(float(fields[2]) if len(fields) > 2 and fields[2] else 1.0)
+        return cls(names, types, scales)
+
+    def describe(self) -> str:
+        return ",".join(
+            f"{name}:{type_name}:{scale:g}"
+            for name, type_name, scale in zip(self.names, self.types, self.scales)
+        )
+
+    def coerce(self, raw: np.ndarray) -> np.ndarray:
+        # raw is (..., width) unscaled values as sent; integer channels are clamped in place.
+        if len(self.integer):
+            raw[..., self.integer] = np.clip(np.rint(raw[..., self.integer]), self.low, self.high)
+        return raw
+
+    def decode(self, fields: list[str], count: int) -> np.ndarray:
+        # One conversion for the whole block; scaling is a single broadcast multiply.
+        raw = np.array(fields[: count * self.width], dtype=np.float64)
+        return self.coerce(raw.reshape(count, self.width)) * self.scales
+
+    def decode_row(self, fields: list[str]) -> np.ndarray:
+        # float() per field beats numpy's string conversion for a single short row.
+        return self.coerce(np.array([float(field) for field in fields])) * self.scales
+
+
+DEFAULT_SCHEMA = ChannelSchema(["target", "actual"], ["f32", "f32"], [1.0, 1.0])
+
+
+# Device -> host messages.
+
+
+class PidStatus(NamedTuple):
+    p: float
+    i: float
+    d: float
+
+    def encode(self) -> str:
+        return f"PID=P={self.p},I={self.i},D={self.d}"
+
+
+class TuneStatus(NamedTuple):
+    # state is OK, ERR or START; fields holds the Ku/Pu/Kp/Ki/Kd text of an OK reply.
+    state: str
+    fields: dict
+
+    def encode(self) -> str:
+        return ",".join([f"TUNE={self.state}"] + [f"{k}={v}" for k, v in self.fields.items()])
+
+
+class ProfileAck(NamedTuple):
+    seq: int
+    free: int
+
+    def encode(self) -> str:
+        return f"PACK={self.seq},FREE={self.free}"
+
+
+class ProfileStatus(NamedTuple):
+    # state is READY, DONE, ERR or whatever else the device reports; capacity only for READY.
+    state: str
+    capacity: int | None = None
+
+    def encode(self) -> str:
+        if self.capacity is None:
+            return f"PROFILE={self.state}"
+        return f"PROFILE={self.state},CAP={self.capacity}"
+
+
+class SchemaAnnounce(NamedTuple):
+    schema: ChannelSchema
+
+    def encode(self) -> str:
+        return f"SCHEMA={self.schema.describe()}"
+
+
+class BadSchema(NamedTuple):
+    error: str
+
+
+class Batch(NamedTuple):
+    # block is None when the body was truncated or unparsable; error then says which.
+    t0_ms: float
+    dt_ms: float
+    count: int
+    block: np.ndarray | None
+    error: str | None = None
+
+    def device_times(self) -> np.ndarray:
+        return self.t0_ms + np.arange(self.count) * self.dt_ms
+
+    def encode(self, schema: ChannelSchema = DEFAULT_SCHEMA) -> str:
+        values = ",".join(f"{v:.9g}" for v in (self.block / schema.scales).ravel().tolist())
+        return f"B,{self.t0_ms:.10g},{self.dt_ms:.10g},{self.count},{values}"
+
+
+class BadBatch(NamedTuple):
+    # Header did not parse; nothing is known about the samples.
+    line: str
+
+
+class Sample(NamedTuple):
+    # schema is DEFAULT_SCHEMA for a legacy target,actual line under a wider schema.
+    row: np.ndarray
+    schema: ChannelSchema
+
+    def encode(self) -> str:
+        return ",".join(f"{v:.9g}" for v in (self.row / self.schema.scales).tolist())
+
+
+class DeviceError(NamedTuple):
+    text: str
+
+    def encode(self) -> str:
+        return f"!ERR:{self.text}"
+
+
+class Text(NamedTuple):
+    # Anything the codec does not recognise; shown in the log as-is.
+    line: str
+
+    def encode(self) -> str:
+        return self.line
+
+
+# Host -> device messages.
+
+
+class SetGains(NamedTuple):
+    p: float
+    i: float
+    d: float
+
+    def encode(self) -> str:
+        return f"P={self.p},I={self.i},D={self.d}"
+
+
+class SetSampleTime(NamedTuple):
+    ms: float
+
+    def encode(self) -> str:
+        return f"TS={self.ms}"
+
+
+class StartTune(NamedTuple):
+    method: str
+
+    def encode(self) -> str:
+        return f"TUNE={self.method}"
+
+
+class StartRelayTune(NamedTuple):
+    sp: float
+    fs: float
+    d: float
+    h: float
+    cycles: int
+    pv_min: float
+    pv_max: float
+
+    def encode(self) -> str:
+        return (
+            f"TUNE=RELAY,SP={self.sp},FS={self.fs},D={self.d},H={self.h},CYC={self.cycles},"
+            f"PV_MIN={self.pv_min},PV_MAX={self.pv_max}"
+        )
+
+
+class StopTune(NamedTuple):
+    def encode(self) -> str:
+        return "TUNE=STOP"
+
+
+class GetPid(NamedTuple):
+    def encode(self) -> str:
+        return "GETPID"
+
+
+class GetSchema(NamedTuple):
+    def encode(self) -> str:
+        return "GETSCHEMA"
+
+
+class EStop(NamedTuple):
+    def encode(self) -> str:
+        return "ESTOP"
+
+
+class Response(NamedTuple):
+    # kind is SETPOINT, STEP, RAMP, ACCEL or SINE; duration is optional only for SETPOINT.
+    kind: str
+    values: tuple
+    duration: float | None
+    seq: int
+
+    def encode(self) -> str:
+        fields = list(self.values)
+        if self.duration is not None:
+            fields.append(self.duration)
+        return f"{self.kind}={','.join(str(v) for v in fields)},SEQ={self.seq}"
+
+
+class ProfileBegin(NamedTuple):
+    count: int
+    sample_time_ms: float
+    binary: bool
+    seq: int
+
+    def encode(self) -> str:
+        fmt = "B" if self.binary else "A"
+        return f"PROFILE=BEGIN,N={self.count},TS={self.sample_time_ms:g},FMT={fmt},SEQ={self.seq}"
+
+
+class ProfileEnd(NamedTuple):
+    seq: int
+
+    def encode(self) -> str:
+        return f"PROFILE=END,SEQ={self.seq}"
+
+
+class ProfileAbort(NamedTuple):
+    seq: int
+
+    def encode(self) -> str:
+        return f"PROFILE=ABORT,SEQ={self.seq}"
+
+
+def frame(message) -> bytes:
+    return (message.encode() + "\n").encode("ascii")
+
+
+SAMPLE_START = frozenset("-+.0123456789")
+# Field layout the firmware always emits; anything else goes through _keyed().
+PID_FIELDS = re.compile(r"P=([^,]*),I=([^,]*),D=([^,]*)")
+
+
+def _keyed(payload: str) -> dict:
+    # k=v,k=v,... -> {k: v}; items without "=" are skipped.
+    fields = {}
+    for part in payload.split(","):
+        key, sep, value = part.partition("=")
+        if sep:
+            fields[key] = value
+    return fields
+
+
+class Codec:
+    # Line decoder for the device protocol. One prefix lookup per line picks the
+    # parser; schema is swapped by whoever applies a SchemaAnnounce.
+
+    def __init__(self, schema: ChannelSchema = DEFAULT_SCHEMA) -> None:
+        self.schema = schema
+        self.decoders = {
+            "PID": self._decode_pid,
+            "TUNE": self._decode_tune,
+            "PACK": self._decode_pack,
+            "PROFILE": self._decode_profile,
+            "SCHEMA": self._decode_schema,
+        }
+
+    def decode(self, line: str):
+        if line[:1] in SAMPLE_START:
+            return self._decode_sample(line)
+        if line.startswith("B,"):
+            return self._decode_batch(line)
+        if line.startswith("!ERR:"):
+            return DeviceError(line[5:])
+        head, sep, payload = line.partition("=")
+        if sep:
+            decoder = self.decoders.get(head)
+            if decoder is not None:
+                message = decoder(payload)
+                if message is not None:
+                    return message
+        if "," in line:
+            # e.g. nan,1.0 -- anything float() accepts is still a sample.
+            return self._decode_sample(line)
+        return Text(line)
+
+    def _decode_sample(self, line: str):
+        schema = self.schema
+        fields = line.split(",")
+        if len(fields) != schema.width:
+            # Legacy target,actual lines are still accepted under any schema.
+            schema = DEFAULT_SCHEMA
+            fields = line.split(",", 1)
+        try:
+            return Sample(schema.decode_row(fields), schema)
+        except ValueError:
+            return Text(line)
+
+    def _decode_batch(self, line: str):
+        parts = line.split(",")
+        if len(parts) < 5:
+            return BadBatch(line)
+        try:
+            t0_ms = float(parts[1])
+            dt_ms = float(parts[2])
+            count = int(parts[3])
+        except ValueError:
+            return BadBatch(line)
+        if count <= 0:
+            return Batch(t0_ms, dt_ms, 0, None)
+        schema = self.schema
+        expected = 4 + (count * schema.width)
+        if len(parts) < expected:
+            return Batch(t0_ms, dt_ms, count, None, "truncated")
+        try:
+            block = schema.decode(parts[4:expected], count)
+        except ValueError:
+            return Batch(t0_ms, dt_ms, count, None, "malformed")
+        return Batch(t0_ms, dt_ms, count, block)
+
+    @staticmethod
+    def _decode_pid(payload: str):
+        match = PID_FIELDS.fullmatch(payload)
+        try:
+            if match is not None:
+                return PidStatus(*map(float, match.groups()))
+            fields = _keyed(payload)
+            return PidStatus(float(fields["P"]), float(fields["I"]), float(fields["D"]))
+        except (KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _decode_tune(payload: str):
+        if payload.startswith("OK"):
+            fields = {}
+            for part in payload.split(",")[1:]:
+                key, sep, value = part.partition("=")
+                if sep:
+                    fields[key.strip()] = value.strip()
+            return TuneStatus("OK", fields)
+        if payload.startswith("ERR"):
+            return TuneStatus("ERR", {})
+        if payload.startswith("START"):
+            return TuneStatus("START", {})
+        return None
+
+    @staticmethod
+    def _decode_pack(payload: str):
+        # PACK=<block seq>,FREE=<free samples>
+        seq, _, free = payload.partition(",FREE=")
+        try:
+            return ProfileAck(int(seq), int(free))
+        except ValueError:
+            pass
+        seq, _, rest = payload.partition(",")
+        try:
+            return ProfileAck(int(seq), int(_keyed(rest)["FREE"]))
+        except (KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _decode_profile(payload: str):
+        state, _, rest = payload.partition(",")
+        if not state.startswith("READY"):
+            return ProfileStatus(state)
+        try:
+            capacity = int(_keyed(rest)["CAP"])
+        except (KeyError, ValueError):
+            capacity = None
+        return ProfileStatus("READY", capacity)
+
+    @staticmethod
+    def _decode_schema(payload: str):
+        try:
+            return SchemaAnnounce(ChannelSchema.parse(payload))
+        except ValueError as exc:
+            return BadSchema(str(exc))